@@ -1,7 +1,19 @@
+"""
+ASGI entry point.
+
+Serve the CRM with an ASGI server and the async dashboard/detail views,
+for example with uvicorn (``pip install uvicorn``)::
+
+    CRM_ASYNC_VIEWS=1 uvicorn clothe_crm.asgi:application --workers 2
+
+One process then keeps many slow clients waiting on the database without
+a thread each. Static files are not served by the ASGI application; use
+whitenoise or the front-end web server for them.
+"""
 import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'clothing_factory.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'clothe_crm.settings')
 
-application = get_asgi_application()
\ No newline at end of file
+application = get_asgi_application()
@@ -26,6 +26,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings include the rest of the stack
+    'crm.instrumentation.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -39,7 +41,8 @@ ROOT_URLCONF = 'clothe_crm.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus render timing for PerformanceMiddleware
+        'BACKEND': 'crm.instrumentation.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -56,13 +59,153 @@ TEMPLATES = [
 WSGI_APPLICATION = 'clothe_crm.wsgi.application'
 
 # Database
+# CRM_DB_PROFILE selects how SQLite connections are tuned; the pragmas are
+# applied to every new connection by crm.database.configure_connection.
+# "production" uses WAL so readers never block the writer, syncs less
+# often (still safe against application crashes), keeps a 32 MB page
+# cache and memory-maps the file, waits up to 20 s for a lock instead of
+# failing with "database is locked", and reuses connections across
+# requests. "default" is SQLite's stock behaviour and is what manage.py
+# and development use, so the checked-in db.sqlite3 is never switched to
+# WAL; deployments set CRM_DB_PROFILE=production (compare the two with
+# "manage.py benchmark_writes").
+SQLITE_PROFILES = {
+    'default': {
+        'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+        'timeout': 5,
+        'conn_max_age': 0,
+    },
+    'production': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'cache_size': -32000,
+            'mmap_size': 268435456,
+            'temp_store': 'MEMORY',
+        },
+        'timeout': 20,
+        'conn_max_age': 600,
+    },
+}
+CRM_DB_PROFILE = os.environ.get('CRM_DB_PROFILE', 'default')
+CRM_SQLITE_PRAGMAS = SQLITE_PROFILES[CRM_DB_PROFILE]['pragmas']
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'timeout': SQLITE_PROFILES[CRM_DB_PROFILE]['timeout'],
+        },
+        'CONN_MAX_AGE': SQLITE_PROFILES[CRM_DB_PROFILE]['conn_max_age'],
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Cache
+# The file (default) and db backends share the dashboard snapshot,
+# fragments and model versions between processes; run "manage.py
+# createcachetable" once for db. CRM_CACHE_LOCATION overrides the
+# directory or table name. CRM_CACHE_BACKEND=locmem keeps the cache per
+# process, which turns the caching below off.
+CRM_CACHE_BACKEND = os.environ.get('CRM_CACHE_BACKEND', 'file')
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CRM_CACHE_LOCATION', str(BASE_DIR / 'cache')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.environ.get('CRM_CACHE_LOCATION', 'crm_cache'),
+    },
+}
+CACHES = {
+    'default': CACHE_BACKENDS[CRM_CACHE_BACKEND],
+}
+
+# Fragments and 304s are keyed on model versions that every writer
+# (web workers, run_worker, management commands) must see, so both are
+# off with the per-process locmem cache (system check crm.E001).
+SHARED_CACHE = CRM_CACHE_BACKEND != 'locmem'
+
+# Seconds a rendered table fragment is kept (0 turns fragment caching
+# off); writes make it unreachable sooner by bumping the model versions
+# it is keyed on.
+CRM_FRAGMENT_CACHE_TIMEOUT = 600 if SHARED_CACHE else 0
+
+# Answer If-None-Match/If-Modified-Since with 304 on the cached pages
+CRM_CONDITIONAL_GET = SHARED_CACHE
+
+# Seconds a dashboard snapshot may be served before it is rebuilt even
+# without writes (writes invalidate it immediately through a generation
+# counter every process must see, so 0, off, with locmem).
+CRM_DASHBOARD_CACHE_TIMEOUT = 300 if SHARED_CACHE else 0
+
+# Serve home, worker_detail and product_detail from crm.async_views. Turn
+# this on when running under an ASGI server (see clothe_crm/asgi.py);
+# under WSGI each async view would just be run in its own event loop.
+CRM_ASYNC_VIEWS = os.environ.get('CRM_ASYNC_VIEWS', '') == '1'
+
+# Above this many workers the per-worker attendance form redirects to the
+# exceptions-only form.
+CRM_ATTENDANCE_FULL_FORM_LIMIT = 200
+
+# JSON API (crm.api): default and largest page size, and the most orders
+# accepted by one POST to /api/orders/batch/.
+CRM_API_PAGE_SIZE = 100
+CRM_API_MAX_LIMIT = 500
+CRM_API_BATCH_LIMIT = 500
+
+# Background tasks (crm.tasks, run by "manage.py run_worker"). Export
+# files and uploaded imports live in CRM_TASK_FILES_DIR. A failed task is
+# retried up to CRM_TASK_MAX_ATTEMPTS times in all, the first retry after
+# CRM_TASK_RETRY_DELAY seconds and each later one twice as long. Running
+# tasks without a worker heartbeat for CRM_TASK_STALE_AFTER seconds are
+# queued again.
+CRM_TASK_FILES_DIR = os.environ.get('CRM_TASK_FILES_DIR', str(BASE_DIR / 'task_files'))
+CRM_TASK_MAX_ATTEMPTS = 3
+CRM_TASK_RETRY_DELAY = 30
+CRM_TASK_HEARTBEAT_INTERVAL = 15
+CRM_TASK_STALE_AFTER = 300
+
+# Deleting a worker or product only marks it deleted (crm.deletion); with
+# CRM_PURGE_DELETED a background task then removes it and its orders,
+# attendance and history, CRM_PURGE_BATCH_SIZE rows per transaction.
+# Without it, a task only hides the orders and attendance, and the
+# deleted records wait for "manage.py purge_deleted".
+CRM_PURGE_DELETED = True
+CRM_PURGE_BATCH_SIZE = 500
+
+# Requests slower than this are logged to CRM_SLOW_REQUEST_LOG as JSON,
+# with their CRM_SLOW_REQUEST_QUERIES slowest SQL statements.
+CRM_SLOW_REQUEST_MS = 500
+CRM_SLOW_REQUEST_QUERIES = 5
+CRM_SLOW_REQUEST_LOG = os.environ.get('CRM_SLOW_REQUEST_LOG', str(BASE_DIR / 'slow_requests.log'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'slow_requests': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': CRM_SLOW_REQUEST_LOG,
+            'maxBytes': 5 * 1024 * 1024,
+            'backupCount': 3,
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'crm.performance': {
+            'handlers': ['slow_requests'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
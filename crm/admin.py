@@ -1,34 +1,170 @@
-from django.contrib import admin
-from .models import Worker, Product, Order, Attendance
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.http import HttpResponseRedirect
+
+from . import deletion, search, stock, tasks
+from .orders import change_status, delete_orders, save_order
+from .models import (
+    Worker, Product, Order, Attendance, ArchivedOrder, ArchivedAttendance, CategoryReorderLevel, StockAlert,
+    StockMovement, Task,
+)
+
+
+class IndexedSearchAdmin(admin.ModelAdmin):
+    """Changelist and autocomplete searches go through the full-text prefix index (crm.search)."""
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search.filter_queryset(queryset, search_term), False
+
+
+class SoftDeleteAdmin(admin.ModelAdmin):
+    """Deletes mark the record deleted and leave its dependents to the purge_deleted task (crm.deletion)."""
+
+    def get_deleted_objects(self, objs, request):
+        # Listing every cascaded row is what the background purge avoids
+        objs = list(objs)
+        count = {self.model._meta.verbose_name_plural: len(objs)}
+        return [str(obj) for obj in objs], count, set(), []
+
+    def delete_model(self, request, obj):
+        deletion.soft_delete(obj)
+        task = 'purge_deleted' if settings.CRM_PURGE_DELETED else 'hide_deleted'
+        tasks.enqueue(task, user=request.user, model=obj._meta.model_name, pk=obj.pk)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self.delete_model(request, obj)
 
 
 @admin.register(Worker)
-class WorkerAdmin(admin.ModelAdmin):
+class WorkerAdmin(SoftDeleteAdmin, IndexedSearchAdmin):
     list_display = ('full_name', 'position', 'phone_number', 'join_date')
     list_filter = ('position', 'join_date')
     search_fields = ('full_name', 'position', 'phone_number')
+    ordering = ('full_name', 'id')
     date_hierarchy = 'join_date'
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category', 'price', 'stock')
+class ProductAdmin(SoftDeleteAdmin, IndexedSearchAdmin):
+    list_display = ('name', 'category', 'price', 'stock', 'reorder_level')
     list_filter = ('category',)
     search_fields = ('name', 'category')
-    list_editable = ('price', 'stock')
+    ordering = ('name', 'id')
+    list_editable = ('price', 'stock', 'reorder_level')
+
+
+@admin.register(CategoryReorderLevel)
+class CategoryReorderLevelAdmin(admin.ModelAdmin):
+    list_display = ('category', 'level')
+    list_editable = ('level',)
+
+
+@admin.register(StockAlert)
+class StockAlertAdmin(admin.ModelAdmin):
+    list_display = ('product', 'stock', 'level', 'opened_at', 'resolved_at')
+    list_filter = (('resolved_at', admin.EmptyFieldListFilter), 'product__category')
+    search_fields = ('product__name',)
+    date_hierarchy = 'opened_at'
+    list_select_related = ('product',)
+    readonly_fields = ('product', 'stock', 'level', 'opened_at', 'resolved_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('product', 'change', 'reason', 'created_at')
+    list_filter = ('reason', 'created_at')
+    search_fields = ('product__name',)
+    date_hierarchy = 'created_at'
+    list_select_related = ('product',)
+
+    # The ledger is append-only; rows only go away with their product
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class OrderAdminForm(forms.ModelForm):
+    def clean(self):
+        cleaned_data = super().clean()
+        product, quantity = cleaned_data.get('product'), cleaned_data.get('quantity')
+        original = self.instance
+        # Orders whose stock was never booked move none (crm.orders.save_order)
+        booked = not original.pk or original.stock_held is not None
+        if booked and product and quantity and cleaned_data.get('status') != 'cancelled':
+            # self.instance still holds the saved values here
+            held = original.quantity if original.stock_held and original.product_id == product.pk else 0
+            if quantity - held > product.stock:
+                self.add_error('quantity', f'Not enough stock available. Only {product.stock + held} units available.')
+        return cleaned_data
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
+    form = OrderAdminForm
     list_display = ('id', 'worker', 'product', 'quantity', 'order_date', 'status', 'total_price')
     list_filter = ('status', 'order_date')
     search_fields = ('worker__full_name', 'product__name')
     date_hierarchy = 'order_date'
+    autocomplete_fields = ('worker', 'product')
+    actions = ('mark_pending', 'mark_completed', 'mark_cancelled')
+
+    def get_queryset(self, request):
+        # Order.__str__ walks both FKs on the change and delete pages
+        return super().get_queryset(request).select_related('worker', 'product')
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        # Stock taken between the form check and save_model: the save rolls back, back to the form
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except stock.InsufficientStock as e:
+            self.message_user(request, f'Not enough stock available. Only {e.available} units available.',
+                              messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+
+    # Stock follows every save and delete, as in the order views (crm.orders)
+    def save_model(self, request, obj, form, change):
+        save_order(obj)
+
+    def delete_model(self, request, obj):
+        delete_orders([obj])
+
+    def delete_queryset(self, request, queryset):
+        delete_orders(queryset)
+
+    def change_status(self, request, queryset, status):
+        try:
+            changed = change_status(queryset.values_list('pk', flat=True), status)
+        except stock.InsufficientStock as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return
+        self.message_user(request, f'{changed} orders marked {dict(Order.STATUS_CHOICES)[status].lower()}.')
+
+    @admin.action(description='Mark selected orders as pending', permissions=['change'])
+    def mark_pending(self, request, queryset):
+        self.change_status(request, queryset, 'pending')
+
+    @admin.action(description='Mark selected orders as completed', permissions=['change'])
+    def mark_completed(self, request, queryset):
+        self.change_status(request, queryset, 'completed')
+
+    @admin.action(description='Mark selected orders as cancelled (returns their stock)', permissions=['change'])
+    def mark_cancelled(self, request, queryset):
+        self.change_status(request, queryset, 'cancelled')
 
     def total_price(self, obj):
-        return f"${obj.quantity * obj.product.price}"
+        return f"${obj.line_total}"
 
     total_price.short_description = 'Total Price'
+    total_price.admin_order_field = 'line_total'
 
 
 @admin.register(Attendance)
@@ -36,4 +172,47 @@ class AttendanceAdmin(admin.ModelAdmin):
     list_display = ('worker', 'date', 'status')
     list_filter = ('status', 'date')
     search_fields = ('worker__full_name',)
-    date_hierarchy = 'date'
\ No newline at end of file
+    date_hierarchy = 'date'
+    autocomplete_fields = ('worker',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('worker')
+
+
+class ArchiveAdmin(admin.ModelAdmin):
+    """Read-only: rows arrive through `manage.py archive`."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(ArchiveAdmin):
+    list_display = ('id', 'worker', 'product', 'quantity', 'order_date', 'status', 'line_total', 'archived_at')
+    list_filter = ('status', 'order_date')
+    search_fields = ('worker__full_name', 'product__name')
+    date_hierarchy = 'order_date'
+    list_select_related = ('worker', 'product')
+
+
+@admin.register(ArchivedAttendance)
+class ArchivedAttendanceAdmin(ArchiveAdmin):
+    list_display = ('worker', 'date', 'status', 'archived_at')
+    list_filter = ('status', 'date')
+    search_fields = ('worker__full_name',)
+    date_hierarchy = 'date'
+    list_select_related = ('worker',)
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'progress', 'attempts', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    date_hierarchy = 'created_at'
+    list_select_related = ('created_by',)
+    raw_id_fields = ('created_by',)
+    readonly_fields = ('attempts', 'progress', 'message', 'result', 'error', 'worker', 'started_at',
+                       'heartbeat_at', 'finished_at')
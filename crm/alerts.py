@@ -0,0 +1,71 @@
+"""
+Low-stock alerts.
+
+Every stock change (crm.stock, product edits, bulk loads) calls ``check``
+for the products it touched. A product below its reorder level gets one
+open StockAlert, kept current while it stays low and resolved once
+stock is back at or above the level; a partial unique index keeps it to
+one open alert per product. The dashboard lists the open alerts instead
+of scanning the catalog.
+
+The reorder level is the product's own ``reorder_level``, else its
+category's CategoryReorderLevel, else ``LOW_STOCK_LEVEL``.
+"""
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import LOW_STOCK_LEVEL, CategoryReorderLevel, Product, StockAlert
+
+
+def reorder_level():
+    """Expression for a product's effective reorder level."""
+    category_level = CategoryReorderLevel.objects.filter(category=OuterRef('category')).values('level')[:1]
+    return Coalesce('reorder_level', Subquery(category_level), Value(LOW_STOCK_LEVEL))
+
+
+def open_alerts():
+    return StockAlert.objects.filter(resolved_at__isnull=True)
+
+
+def resolved_alerts():
+    return StockAlert.objects.filter(resolved_at__isnull=False)
+
+
+def check(product_ids=None):
+    """
+    Open, refresh or resolve the alerts of ``product_ids`` (every product
+    if None). Returns the number of alerts opened.
+    """
+    products = Product.objects.annotate(level=reorder_level())
+    alerts = open_alerts()
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        products = products.filter(pk__in=product_ids)
+        alerts = alerts.filter(product_id__in=product_ids)
+
+    low = {pk: (stock, level) for pk, stock, level in
+           products.filter(stock__lt=F('level')).values_list('pk', 'stock', 'level')}
+    now = timezone.now()
+
+    with transaction.atomic():
+        alerts.exclude(product_id__in=low).update(resolved_at=now)
+        if not low:
+            return 0
+
+        changed = []
+        existing = alerts.filter(product_id__in=low)
+        for alert in existing:
+            stock, level = low.pop(alert.product_id)
+            if (alert.stock, alert.level) != (stock, level):
+                alert.stock, alert.level = stock, level
+                changed.append(alert)
+        StockAlert.objects.bulk_update(changed, ['stock', 'level'])
+
+        # A concurrent writer may have opened the same alert; the partial unique index keeps one
+        StockAlert.objects.bulk_create(
+            [StockAlert(product_id=pk, stock=stock, level=level, opened_at=now) for pk, (stock, level) in low.items()],
+            ignore_conflicts=True,
+        )
+    return len(low)
@@ -0,0 +1,222 @@
+"""
+JSON API for integrations (POS terminals, warehouse scanners).
+
+Read endpoints for every resource in ``RESOURCES``:
+
+* ``GET /api/<resource>/`` lists rows with cursor pagination
+  (``?after=<cursor>``, ``?limit=``, at most ``CRM_API_MAX_LIMIT``) and
+  the filters listed for the resource;
+* ``GET /api/<resource>/<id>/`` returns one row;
+* ``?fields=id,name`` on either selects a sparse fieldset, and only
+  those columns are read from the database.
+
+``POST /api/orders/batch/`` takes ``{"orders": [...], "all_or_nothing":
+false}`` and creates up to ``CRM_API_BATCH_LIMIT`` orders in one
+transaction (see crm.orders), answering with one result per item.
+
+Requests authenticate with the session cookie (unsafe methods then need
+the CSRF token, as for forms) or with HTTP Basic credentials.
+"""
+import base64
+import binascii
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
+
+from .models import Worker, Product, Order, Attendance
+from .orders import place_orders
+from .stock import InsufficientStock
+from .pagination import InvalidCursor, KeysetPaginator
+
+RESOURCES = {
+    'workers': {
+        'model': Worker,
+        'fields': ['id', 'full_name', 'position', 'phone_number', 'join_date'],
+        'ordering': ('full_name', 'id'),
+        'filters': {'position': 'position'},
+    },
+    'products': {
+        'model': Product,
+        'fields': ['id', 'name', 'category', 'price', 'stock'],
+        'ordering': ('name', 'id'),
+        'filters': {'category': 'category'},
+    },
+    'orders': {
+        'model': Order,
+        'fields': ['id', 'worker', 'product', 'quantity', 'order_date', 'status', 'unit_price', 'line_total'],
+        'ordering': ('-order_date', '-id'),
+        'filters': {
+            'worker': 'worker',
+            'product': 'product',
+            'status': 'status',
+            'since': 'order_date__gte',
+            'until': 'order_date__lte',
+        },
+    },
+    'attendance': {
+        'model': Attendance,
+        'fields': ['id', 'worker', 'date', 'status'],
+        'ordering': ('-date', '-id'),
+        'filters': {'worker': 'worker', 'date': 'date', 'status': 'status'},
+    },
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def error(message, status=400, **extra):
+    return JsonResponse({'error': message, **extra}, status=status)
+
+
+def _basic_auth_user(request):
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not header.startswith('Basic '):
+        return None
+    try:
+        username, password = base64.b64decode(header[6:]).decode().split(':', 1)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    return authenticate(request, username=username, password=password)
+
+
+def api_view(*methods):
+    """Restrict to ``methods``, authenticate, and turn BadRequest into a 400 JSON response."""
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return error(f'Method {request.method} not allowed.', status=405)
+
+            user = _basic_auth_user(request)
+            if user is not None:
+                request.user = user
+            elif not request.user.is_authenticated:
+                return error('Authentication required.', status=401)
+            elif request.method not in ('GET', 'HEAD', 'OPTIONS'):
+                # Session requests get the same CSRF protection as the HTML forms
+                rejected = CsrfViewMiddleware(lambda request: None).process_view(request, None, (), {})
+                if rejected:
+                    return error('CSRF verification failed.', status=403)
+
+            try:
+                return view(request, *args, **kwargs)
+            except BadRequest as e:
+                return error(str(e))
+
+        return wrapper
+
+    return decorator
+
+
+def _resource(name):
+    try:
+        return RESOURCES[name]
+    except KeyError:
+        raise BadRequest(f'Unknown resource {name!r}.')
+
+
+def _fields(request, spec):
+    """The requested sparse fieldset, in the resource's field order."""
+    requested = request.GET.get('fields')
+    if not requested:
+        return spec['fields']
+    names = {name.strip() for name in requested.split(',') if name.strip()}
+    unknown = names - set(spec['fields'])
+    if unknown:
+        raise BadRequest(f'Unknown field(s): {", ".join(sorted(unknown))}.')
+    return [name for name in spec['fields'] if name in names]
+
+
+def _serialize(obj, fields):
+    # Foreign keys are given as ids
+    return {name: getattr(obj, obj._meta.get_field(name).attname) for name in fields}
+
+
+def _filtered(request, spec):
+    model = spec['model']
+    queryset = model.objects.all()
+    for param, lookup in spec['filters'].items():
+        if param not in request.GET:
+            continue
+        field = model._meta.get_field(lookup.split('__')[0])
+        try:
+            value = field.target_field.to_python(request.GET[param]) if field.is_relation \
+                else field.to_python(request.GET[param])
+        except ValidationError as e:
+            raise BadRequest(f'Invalid {param}: {" ".join(e.messages)}')
+        queryset = queryset.filter(**{lookup: value})
+    return queryset
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', settings.CRM_API_PAGE_SIZE))
+    except ValueError:
+        raise BadRequest('limit must be a number.')
+    return max(1, min(limit, settings.CRM_API_MAX_LIMIT))
+
+
+@api_view('GET')
+def resource_list(request, resource):
+    spec = _resource(resource)
+    fields = _fields(request, spec)
+    # The cursor needs the ordering columns even when they are not returned
+    columns = set(fields) | {name.lstrip('-') for name in spec['ordering']}
+    queryset = _filtered(request, spec).only(*columns)
+
+    paginator = KeysetPaginator(queryset, spec['ordering'], per_page=_limit(request))
+    try:
+        page = paginator.get_page(after=request.GET.get('after'), before=request.GET.get('before'))
+    except InvalidCursor:
+        raise BadRequest('Invalid cursor.')
+
+    return JsonResponse({
+        'results': [_serialize(obj, fields) for obj in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+@api_view('GET')
+def resource_detail(request, resource, pk):
+    spec = _resource(resource)
+    fields = _fields(request, spec)
+    obj = spec['model'].objects.only(*fields).filter(pk=pk).first()
+    if obj is None:
+        return error('Not found.', status=404)
+    return JsonResponse(_serialize(obj, fields))
+
+
+@api_view('POST')
+def order_batch(request):
+    try:
+        payload = json.loads(request.body)
+    except (UnicodeDecodeError, ValueError):
+        raise BadRequest('Body must be JSON.')
+
+    items = payload.get('orders') if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        raise BadRequest('"orders" must be a non-empty list.')
+    if len(items) > settings.CRM_API_BATCH_LIMIT:
+        raise BadRequest(f'At most {settings.CRM_API_BATCH_LIMIT} orders per batch.')
+
+    try:
+        results, committed = place_orders(items, all_or_nothing=bool(payload.get('all_or_nothing')))
+    except InsufficientStock:
+        # Other writers kept taking the stock between every read and UPDATE; nothing was written
+        return error('Stock changed while the batch was being placed. Retry the request.', status=409)
+    return JsonResponse({
+        'committed': committed,
+        'created': sum(result['status'] == 'created' for result in results),
+        'failed': sum(result['status'] == 'error' for result in results),
+        'results': results,
+    })
@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'crm'
\ No newline at end of file
+    name = 'crm'
+
+    def ready(self):
+        from . import checks, search, signals  # noqa: F401
+        post_migrate.connect(search.ensure_triggers, sender=self, dispatch_uid='crm.ensure_search_triggers')
@@ -0,0 +1,133 @@
+"""
+Async versions of the dashboard and the worker/product detail pages.
+
+Served instead of the sync views in crm.views when CRM_ASYNC_VIEWS is on
+(see clothe_crm/asgi.py). A request waiting on the database no longer
+holds a worker thread: the event loop serves other requests meanwhile.
+Each view hands its independent queries to one ``asyncio.gather``, but
+they still run one after another: the async ORM goes through
+``sync_to_async(thread_sensitive=True)``, which queues every call on the
+single thread that owns the connection. Rendering touches lazy objects
+(request.user, querysets in templates), so it runs through
+``sync_to_async`` too.
+"""
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.db.models import Sum
+from django.http import Http404
+from django.shortcuts import render
+
+from .caching import conditional_page, version_key
+from .models import Worker, Product, Order, Attendance, ArchivedOrder
+from .stats import aget_dashboard_snapshot
+from .views import ARCHIVED_ORDERS_SHOWN
+
+
+def async_login_required(view):
+    # django.contrib.auth's login_required only wraps sync views before Django 5.0
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if await sync_to_async(lambda: request.user.is_authenticated)():
+            return await view(request, *args, **kwargs)
+        return redirect_to_login(request.get_full_path(), settings.LOGIN_URL)
+
+    return wrapper
+
+
+async def aget_object_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def aorder_revenue(orders):
+    # Summed in SQL from the stored line totals
+    totals = await orders.exclude(status='cancelled').aaggregate(revenue=Sum('line_total'))
+    return totals['revenue'] or 0
+
+
+async def arender(request, template_name, context):
+    return await sync_to_async(render)(request, template_name, context)
+
+
+@async_login_required
+@conditional_page('home', Worker, Product, Order, Attendance)
+async def home(request):
+    snapshot, cache_versions = await asyncio.gather(
+        aget_dashboard_snapshot(), sync_to_async(version_key)(Worker, Product, Order),
+    )
+
+    context = {
+        'total_workers': snapshot['total_workers'],
+        'total_products': snapshot['total_products'],
+        'total_orders': snapshot['total_orders'],
+        'attendance_summary': snapshot['attendance_summary'],
+        'recent_orders': snapshot['recent_orders'],
+        'stock_alerts': snapshot['stock_alerts'],
+        'cache_versions': cache_versions,
+    }
+
+    return await arender(request, 'crm/home.html', context)
+
+
+@async_login_required
+@conditional_page('worker_detail', Worker, Product, Order, Attendance)
+async def worker_detail(request, pk):
+    worker = await aget_object_or_404(Worker.objects.all(), pk=pk)
+    orders = Order.objects.filter(worker=worker).select_related('product').order_by('-order_date')
+    archived_orders = ArchivedOrder.objects.filter(worker=worker).select_related('worker', 'product')
+
+    order_list, archived_list, attendance, revenue, archived_revenue, cache_versions = await asyncio.gather(
+        alist(orders),
+        alist(archived_orders.order_by('-order_date', '-id')[:ARCHIVED_ORDERS_SHOWN]),
+        alist(Attendance.objects.filter(worker=worker).order_by('-date')[:10]),
+        aorder_revenue(orders),
+        aorder_revenue(archived_orders),
+        sync_to_async(version_key)(Worker, Product, Order, Attendance),
+    )
+
+    context = {
+        'worker': worker,
+        'orders': order_list,
+        'archived_orders': archived_list,
+        'attendance': attendance,
+        'revenue': revenue + archived_revenue,
+        'cache_versions': cache_versions,
+    }
+
+    return await arender(request, 'crm/worker_detail.html', context)
+
+
+@async_login_required
+@conditional_page('product_detail', Worker, Product, Order)
+async def product_detail(request, pk):
+    product = await aget_object_or_404(Product.objects.all(), pk=pk)
+    orders = Order.objects.filter(product=product).select_related('worker').order_by('-order_date')
+    archived_orders = ArchivedOrder.objects.filter(product=product).select_related('worker', 'product')
+
+    order_list, archived_list, revenue, archived_revenue, cache_versions = await asyncio.gather(
+        alist(orders),
+        alist(archived_orders.order_by('-order_date', '-id')[:ARCHIVED_ORDERS_SHOWN]),
+        aorder_revenue(orders),
+        aorder_revenue(archived_orders),
+        sync_to_async(version_key)(Worker, Product, Order),
+    )
+
+    context = {
+        'product': product,
+        'orders': order_list,
+        'archived_orders': archived_list,
+        'revenue': revenue + archived_revenue,
+        'cache_versions': cache_versions,
+    }
+
+    return await arender(request, 'crm/product_detail.html', context)
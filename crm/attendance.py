@@ -0,0 +1,62 @@
+from django.db import connection, transaction
+
+from .caching import invalidate
+from .models import Worker, Attendance
+from .rollups import refresh_attendance
+
+BATCH_SIZE = 1000
+
+
+def _attendance_changed():
+    invalidate(Attendance)
+
+
+def record_attendance(day, statuses, batch_size=BATCH_SIZE):
+    """
+    Upsert one attendance row per ``worker_id -> status`` for ``day``.
+
+    Rows are written with INSERT ... ON CONFLICT (worker_id, date) DO UPDATE
+    in batches, so a whole shift costs a handful of statements instead of
+    one round-trip per worker.
+    """
+    records = [
+        Attendance(worker_id=worker_id, date=day, status=status)
+        for worker_id, status in statuses.items()
+    ]
+
+    with transaction.atomic():
+        Attendance.objects.bulk_create(
+            records,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['worker', 'date'],
+            update_fields=['status'],
+        )
+        # bulk_create does not send post_save
+        refresh_attendance(day)
+        transaction.on_commit(_attendance_changed)
+
+    return len(records)
+
+
+def record_day(day, exceptions, default_status='present'):
+    """
+    Record ``default_status`` for every worker on ``day`` except the
+    ``worker_id -> status`` pairs in ``exceptions``.
+
+    The default rows are produced by one INSERT ... SELECT over the worker
+    table, so Python only ever handles the exceptions.
+    """
+    workers_sql, workers_params = Worker.objects.order_by().values('pk').query.sql_with_params()
+    table = Attendance._meta.db_table
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # "WHERE 1 = 1" keeps SQLite from reading ON CONFLICT as a join clause
+            cursor.execute(
+                f'INSERT INTO {table} (worker_id, date, status) '
+                f'SELECT workers.id, %s, %s FROM ({workers_sql}) AS workers WHERE 1 = 1 '
+                f'ON CONFLICT (worker_id, date) DO UPDATE SET status = excluded.status',
+                [day, default_status, *workers_params],
+            )
+        record_attendance(day, exceptions)
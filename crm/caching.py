@@ -0,0 +1,199 @@
+"""
+Version-keyed page and fragment caching.
+
+Each CRM model has a version counter in the cache that is bumped on
+``post_save``/``post_delete`` (see crm.signals) and by the bulk paths
+that bypass signals. Rendered fragments are cached under the versions
+of the models they show, so a write makes the old entries unreachable
+instead of having to find and delete them. ``conditional_page`` turns
+the same versions into ETag/Last-Modified headers so unchanged pages
+answer 304 without running the view. The dashboard snapshot (crm.stats)
+is tagged with a generation counter of its own; ``invalidate`` moves it
+and the versions together after a write.
+
+Writers in other processes (run_worker, management commands, other
+web workers) only reach the versions through a shared cache, so both
+are off with the local-memory backend (system check crm.E001).
+"""
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .models import Worker, Product, Order, Attendance
+
+TRACKED_MODELS = (Worker, Product, Order, Attendance)
+
+VERSION_KEY = 'crm:version:{}'
+DASHBOARD_GENERATION_KEY = 'crm:dashboard:generation'
+MODIFIED_KEY = 'crm:modified:{}'
+STATS_KEY = 'crm:cache-stats:{}:{}'
+OUTCOMES = ('hit', 'miss', 'not_modified', 'rendered')
+
+# Fragment and page names seen by this process, for the diagnostics page
+tracked_names = set()
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def start_counter(key):
+    # Seeded from the clock so an evicted counter never restarts at a value old entries still carry
+    cache.add(key, time.time_ns(), None)
+    return cache.get(key)
+
+
+def _bump_counter(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        start_counter(key)
+
+
+def _start_version(model):
+    cache.add(MODIFIED_KEY.format(_label(model)), time.time(), None)
+    return start_counter(VERSION_KEY.format(_label(model)))
+
+
+def versions(*models):
+    """``{label: version}`` for ``models``."""
+    keys = {VERSION_KEY.format(_label(model)): model for model in models}
+    found = cache.get_many(keys)
+    return {
+        _label(model): found[key] if key in found else _start_version(model)
+        for key, model in keys.items()
+    }
+
+
+def version_key(*models):
+    return '-'.join(str(version) for label, version in sorted(versions(*models).items()))
+
+
+def bump_versions(*models):
+    """Mark ``models`` (every tracked model if none are given) as changed."""
+    for model in models or TRACKED_MODELS:
+        _bump_counter(VERSION_KEY.format(_label(model)))
+        cache.set(MODIFIED_KEY.format(_label(model)), time.time(), None)
+
+
+def invalidate(*models):
+    """After a write to ``models`` (every tracked model if none are given): a new dashboard and new versions."""
+    _bump_counter(DASHBOARD_GENERATION_KEY)
+    bump_versions(*models)
+
+
+def last_modified(*models):
+    found = cache.get_many([MODIFIED_KEY.format(_label(model)) for model in models])
+    stamps = []
+    for model in models:
+        key = MODIFIED_KEY.format(_label(model))
+        if key not in found:
+            # Unknown, so as far as anyone can tell it changed just now
+            _start_version(model)
+        stamps.append(found.get(key) or time.time())
+    changed = datetime.fromtimestamp(max(stamps), dt_timezone.utc)
+    # Pages also show "today", so they change at midnight even without writes
+    return max(changed, timezone.now().replace(hour=0, minute=0, second=0, microsecond=0))
+
+
+def record(name, outcome):
+    tracked_names.add(name)
+    key = STATS_KEY.format(name, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_stats(names=None):
+    """``[{'name': ..., 'hit': n, 'miss': n, ...}]`` for every tracked name."""
+    names = sorted(names or tracked_names)
+    found = cache.get_many([STATS_KEY.format(name, outcome) for name in names for outcome in OUTCOMES])
+    rows = []
+    for name in names:
+        row = {'name': name}
+        row.update((outcome, found.get(STATS_KEY.format(name, outcome), 0)) for outcome in OUTCOMES)
+        lookups = row['hit'] + row['miss']
+        requests = row['not_modified'] + row['rendered']
+        row['hit_ratio'] = row['hit'] / lookups if lookups else None
+        row['not_modified_ratio'] = row['not_modified'] / requests if requests else None
+        rows.append(row)
+    return rows
+
+
+def reset_stats(names=None):
+    cache.delete_many([STATS_KEY.format(name, outcome) for name in (names or tracked_names) for outcome in OUTCOMES])
+
+
+def conditional_page(name, *models):
+    """
+    Answer conditional GETs for a view that only shows ``models``.
+
+    The ETag covers the model versions, the URL and the user (every page
+    shows the username); responses are marked private and must be
+    revalidated, so browsers always ask and get a 304 while nothing changed.
+    """
+    tracked_names.add(name)
+
+    def etag(request, *args, **kwargs):
+        if not settings.CRM_CONDITIONAL_GET:
+            return None
+        parts = [name, request.get_full_path(), str(request.user.pk), str(timezone.now().date()), version_key(*models)]
+        return hashlib.md5('|'.join(parts).encode(), usedforsecurity=False).hexdigest()
+
+    def modified(request, *args, **kwargs):
+        if not settings.CRM_CONDITIONAL_GET:
+            return None
+        return last_modified(*models)
+
+    def validators(request, *args, **kwargs):
+        res_etag = etag(request, *args, **kwargs)
+        res_last_modified = modified(request, *args, **kwargs)
+        return (
+            quote_etag(res_etag) if res_etag is not None else None,
+            int(res_last_modified.timestamp()) if res_last_modified else None,
+        )
+
+    def finish(request, response, res_etag, res_last_modified):
+        # As django.views.decorators.http.condition, which only wraps sync views before Django 5.0
+        if request.method in ('GET', 'HEAD'):
+            if res_last_modified and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(res_last_modified)
+            if res_etag:
+                response.headers.setdefault('ETag', res_etag)
+            record(name, 'not_modified' if response.status_code == 304 else 'rendered')
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                res_etag, res_last_modified = await sync_to_async(validators)(request, *args, **kwargs)
+                response = get_conditional_response(request, etag=res_etag, last_modified=res_last_modified)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return finish(request, response, res_etag, res_last_modified)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            res_etag, res_last_modified = validators(request, *args, **kwargs)
+            response = get_conditional_response(request, etag=res_etag, last_modified=res_last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return finish(request, response, res_etag, res_last_modified)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Backends whose entries only the writing process can see
+PER_PROCESS_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+# Caching that writers in every process must be able to invalidate
+CACHE_SETTINGS = ('CRM_FRAGMENT_CACHE_TIMEOUT', 'CRM_CONDITIONAL_GET', 'CRM_DASHBOARD_CACHE_TIMEOUT')
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Version-keyed fragments, 304s and the dashboard snapshot go stale for good
+    when writers in other processes cannot bump the versions and the generation.
+    """
+    if settings.CACHES['default']['BACKEND'] not in PER_PROCESS_BACKENDS:
+        return []
+    enabled = [name for name in CACHE_SETTINGS if getattr(settings, name)]
+    if not enabled:
+        return []
+    return [Error(
+        f'{", ".join(enabled)} need a cache shared by every process, not the local-memory cache.',
+        hint='Set CRM_CACHE_BACKEND=file or db, or set these to 0/False.',
+        id='crm.E001',
+    )]
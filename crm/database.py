@@ -0,0 +1,31 @@
+"""
+SQLite connection tuning.
+
+``configure_connection`` runs on ``connection_created`` and applies
+``settings.CRM_SQLITE_PRAGMAS`` (chosen by the CRM_DB_PROFILE setting)
+to every new SQLite connection. Other databases are left alone.
+"""
+import re
+
+from django.conf import settings
+
+PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+
+
+def apply_pragmas(connection, pragmas):
+    """Run ``PRAGMA name = value`` for each item and return what SQLite reports back."""
+    applied = {}
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            if not PRAGMA_NAME.match(name):
+                raise ValueError(f'Invalid pragma name {name!r}')
+            cursor.execute(f'PRAGMA {name} = {value}')
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            applied[name] = row[0] if row else None
+    return applied
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection, getattr(settings, 'CRM_SQLITE_PRAGMAS', {}))
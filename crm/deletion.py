@@ -0,0 +1,153 @@
+"""
+Deleting workers and products without one long cascade.
+
+A delete from the UI or the admin only calls ``soft_delete``: the row
+gets ``deleted_at`` and disappears from the default managers (and so
+from lists, forms, search, the API and the dashboard counts) at once,
+in a single UPDATE. Everything else happens in the background, in
+batches of ``CRM_PURGE_BATCH_SIZE`` rows per transaction so the SQLite
+write lock is only ever held briefly:
+
+* ``hide`` stamps ``deleted_at`` on the record's orders and attendance
+  (hot and archived), taking the orders out of the rollups and
+  recounting the attendance days as it goes (the ``hide_deleted``
+  task);
+* ``purge`` hides whatever is still visible, then removes the dependent
+  rows table by table with plain ``DELETE ... WHERE id IN (...)``
+  statements and finally the record itself (the ``purge_deleted``
+  task, or ``manage.py purge_deleted`` for everything still marked
+  deleted).
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import rollups
+from .alerts import open_alerts
+from .caching import invalidate
+from .models import (
+    Worker, Product, Order, Attendance, ArchivedOrder, ArchivedAttendance, DailyProductSales, DailyWorkerSales,
+    StockAlert, StockMovement, StockSnapshot,
+)
+
+MODELS = {'worker': Worker, 'product': Product}
+
+# Rows hidden after the record, by hide
+HIDDEN = {
+    Worker: [Order, ArchivedOrder, Attendance, ArchivedAttendance],
+    Product: [Order, ArchivedOrder],
+}
+
+# Orders go first so the rollup rows they are taken out of still exist
+DEPENDENTS = {
+    Worker: [Order, ArchivedOrder, Attendance, ArchivedAttendance, DailyWorkerSales],
+    Product: [Order, ArchivedOrder, StockAlert, StockSnapshot, StockMovement, DailyProductSales],
+}
+
+
+def delete_rows(model, ids):
+    """``DELETE`` rows by id without collecting cascades or sending signals."""
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)} WHERE id IN ({placeholders})',
+                       ids)
+
+
+def soft_delete(obj):
+    """Hide ``obj`` everywhere now; its orders and attendance follow in ``hide`` and ``purge``."""
+    now = timezone.now()
+    model = type(obj)
+    with transaction.atomic():
+        model.all_objects.filter(pk=obj.pk).update(deleted_at=now)
+        if model is Product:
+            open_alerts().filter(product=obj).update(resolved_at=now)
+    obj.deleted_at = now
+    invalidate(model)
+
+
+def _foreign_key(dependent, model):
+    return next(field.attname for field in dependent._meta.concrete_fields if field.related_model is model)
+
+
+def _take_out_of_rollups(orders):
+    contributions = [
+        {'date': order_date, 'product_id': product_id, 'worker_id': worker_id, 'category': category,
+         'units': quantity, 'revenue': line_total}
+        for order_date, product_id, worker_id, category, quantity, line_total in
+        orders.exclude(status='cancelled').values_list('order_date', 'product_id', 'worker_id', 'product__category', 'quantity', 'line_total')
+    ]
+    rollups.apply_many(contributions, -1)
+
+
+def hide(obj, batch_size=None, progress=None):
+    """
+    Hide the orders and attendance of a soft-deleted ``obj`` and take them
+    out of the rollups, one batch per transaction. ``progress(hidden, total)``
+    is called after every batch. Returns the number of rows hidden.
+    """
+    model = type(obj)
+    batch_size = batch_size or settings.CRM_PURGE_BATCH_SIZE
+    visible = [dependent.objects.filter(**{_foreign_key(dependent, model): obj.pk}) for dependent in HIDDEN[model]]
+    total = sum(rows.count() for rows in visible)
+
+    hidden = 0
+    for dependent, rows in zip(HIDDEN[model], visible):
+        queryset = rows.order_by('pk').values_list('pk', flat=True)
+        while True:
+            with transaction.atomic():
+                ids = list(queryset[:batch_size])
+                if not ids:
+                    break
+                rows = dependent.objects.filter(pk__in=ids)
+                if dependent in (Order, ArchivedOrder):
+                    _take_out_of_rollups(rows)
+                days = set(rows.values_list('date', flat=True)) if dependent in (Attendance, ArchivedAttendance) else ()
+                rows.update(deleted_at=obj.deleted_at)
+                if days:
+                    rollups.refresh_attendance(*days)
+            hidden += len(ids)
+            if progress:
+                progress(hidden, total)
+
+    if hidden:
+        invalidate(Order, Attendance)
+    return hidden
+
+
+def purge(obj, batch_size=None, progress=None):
+    """
+    Delete a soft-deleted ``obj`` and every row that depends on it, one
+    batch per transaction. ``progress(deleted, total)`` is called after
+    every batch. Returns the number of dependent rows deleted.
+    """
+    model = type(obj)
+    batch_size = batch_size or settings.CRM_PURGE_BATCH_SIZE
+    # Hidden rows are out of the rollups already, so the deletes need no bookkeeping
+    hide(obj, batch_size)
+    dependents = [(dependent, {_foreign_key(dependent, model): obj.pk}) for dependent in DEPENDENTS[model]]
+    # The base managers include the hidden rows
+    total = sum(dependent._base_manager.filter(**lookup).count() for dependent, lookup in dependents)
+
+    deleted = 0
+    for dependent, lookup in dependents:
+        queryset = dependent._base_manager.filter(**lookup).order_by('pk').values_list('pk', flat=True)
+        while True:
+            with transaction.atomic():
+                ids = list(queryset[:batch_size])
+                if not ids:
+                    break
+                delete_rows(dependent, ids)
+            deleted += len(ids)
+            if progress:
+                progress(deleted, total)
+
+    # Nothing is left to cascade to
+    model.all_objects.filter(pk=obj.pk, deleted_at__isnull=False).delete()
+    invalidate(Worker, Product, Order, Attendance)
+    return deleted
+
+
+def pending():
+    """Soft-deleted records that have not been purged yet."""
+    for model in MODELS.values():
+        yield from model.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at')
@@ -0,0 +1,149 @@
+"""
+Streaming exports of orders, attendance and products, and of the orders
+and attendance moved to the archive tables (crm.archive).
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)`` so memory
+stays flat however many rows are exported, and every filter is applied
+in SQL before the first row is fetched.
+"""
+import csv
+import tempfile
+
+from .models import Product, Order, Attendance, ArchivedOrder, ArchivedAttendance
+
+CHUNK_SIZE = 2000
+
+ORDER_COLUMNS = [
+    ('id', 'Order #'),
+    ('order_date', 'Date'),
+    ('status', 'Status'),
+    ('worker_id', 'Worker ID'),
+    ('worker__full_name', 'Worker'),
+    ('product_id', 'Product ID'),
+    ('product__name', 'Product'),
+    ('quantity', 'Quantity'),
+    ('unit_price', 'Unit Price'),
+    ('line_total', 'Total'),
+]
+
+ATTENDANCE_COLUMNS = [
+    ('id', 'ID'),
+    ('date', 'Date'),
+    ('worker_id', 'Worker ID'),
+    ('worker__full_name', 'Worker'),
+    ('status', 'Status'),
+]
+
+EXPORTS = {
+    'orders': {
+        'queryset': lambda: Order.objects.all(),
+        'columns': ORDER_COLUMNS,
+        'ordering': ('order_date', 'id'),
+        'date_field': 'order_date',
+        'status_field': 'status',
+    },
+    'attendance': {
+        'queryset': lambda: Attendance.objects.all(),
+        'columns': ATTENDANCE_COLUMNS,
+        'ordering': ('date', 'id'),
+        'date_field': 'date',
+        'status_field': 'status',
+    },
+    'archived_orders': {
+        'queryset': lambda: ArchivedOrder.objects.all(),
+        'columns': ORDER_COLUMNS,
+        'ordering': ('order_date', 'id'),
+        'date_field': 'order_date',
+        'status_field': 'status',
+    },
+    'archived_attendance': {
+        'queryset': lambda: ArchivedAttendance.objects.all(),
+        'columns': ATTENDANCE_COLUMNS,
+        'ordering': ('date', 'id'),
+        'date_field': 'date',
+        'status_field': 'status',
+    },
+    'products': {
+        'queryset': lambda: Product.objects.all(),
+        'columns': [
+            ('id', 'ID'),
+            ('name', 'Name'),
+            ('category', 'Category'),
+            ('price', 'Price'),
+            ('stock', 'Stock'),
+        ],
+        'ordering': ('name', 'id'),
+        'date_field': None,
+        'status_field': 'category',
+    },
+}
+
+
+class UnknownExport(Exception):
+    pass
+
+
+def get_queryset(name, start=None, end=None, status=None):
+    try:
+        spec = EXPORTS[name]
+    except KeyError:
+        raise UnknownExport(name)
+
+    queryset = spec['queryset']()
+    if spec['date_field']:
+        if start:
+            queryset = queryset.filter(**{f"{spec['date_field']}__gte": start})
+        if end:
+            queryset = queryset.filter(**{f"{spec['date_field']}__lte": end})
+    if status and spec['status_field']:
+        queryset = queryset.filter(**{spec['status_field']: status})
+
+    fields = [field for field, header in spec['columns']]
+    return queryset.order_by(*spec['ordering']).values_list(*fields)
+
+
+def iter_rows(name, start=None, end=None, status=None, chunk_size=CHUNK_SIZE):
+    """Yield the header row, then every matching row as a tuple."""
+    queryset = get_queryset(name, start=start, end=end, status=status)
+    yield [header for field, header in EXPORTS[name]['columns']]
+    yield from queryset.iterator(chunk_size=chunk_size)
+
+
+class Echo:
+    """File-like object whose write() hands the line straight back."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_xlsx(rows, target):
+    """
+    Write ``rows`` to ``target`` with openpyxl's write-only workbook.
+
+    XLSX is a zip archive, so it can only be sent once complete; rows are
+    still streamed into the workbook without being held in memory.
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError('XLSX export requires the openpyxl package.')
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in rows:
+        sheet.append(list(row))
+    workbook.save(target)
+    return target
+
+
+def xlsx_tempfile(rows):
+    target = tempfile.TemporaryFile()
+    write_xlsx(rows, target)
+    target.seek(0)
+    return target
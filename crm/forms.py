@@ -1,8 +1,36 @@
+import json
+
 from django import forms
+from django.core.exceptions import ValidationError
+from django.urls import reverse_lazy
 from .models import Worker, Product, Order, Attendance
 from django.utils import timezone
 
 
+class AutocompleteSelect(forms.Select):
+    """
+    A select that only renders the chosen option; the script in base.html
+    adds a search box that fills it from the ``autocomplete`` endpoint, so
+    the page never lists the whole table.
+    """
+
+    def __init__(self, model_name, attrs=None):
+        attrs = {'data-autocomplete-url': reverse_lazy('autocomplete', args=[model_name]), **(attrs or {})}
+        super().__init__(attrs)
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [item for item in value if item not in ('', None)]
+        options = [self.create_option(name, '', '---------', not selected, 0)]
+        try:
+            objects = list(self.choices.queryset.filter(pk__in=selected)) if selected else []
+        except (ValueError, ValidationError):
+            # Bound to input that is not a valid id
+            objects = []
+        for index, obj in enumerate(objects, start=1):
+            options.append(self.create_option(name, obj.pk, self.choices.field.label_from_instance(obj), True, index))
+        return [(None, options, 0)]
+
+
 class WorkerForm(forms.ModelForm):
     join_date = forms.DateField(
         widget=forms.DateInput(attrs={'type': 'date'}),
@@ -17,7 +45,7 @@ class WorkerForm(forms.ModelForm):
 class ProductForm(forms.ModelForm):
     class Meta:
         model = Product
-        fields = ['name', 'category', 'price', 'stock']
+        fields = ['name', 'category', 'price', 'stock', 'reorder_level']
 
 
 class OrderForm(forms.ModelForm):
@@ -29,6 +57,37 @@ class OrderForm(forms.ModelForm):
     class Meta:
         model = Order
         fields = ['worker', 'product', 'quantity', 'order_date', 'status']
+        widgets = {
+            'worker': AutocompleteSelect('workers'),
+            'product': AutocompleteSelect('products'),
+        }
+
+
+class OrderStatusForm(forms.Form):
+    """
+    The bulk status change on the order list; ``orders`` are the ticked
+    rows, or with ``select_across`` every order the list's status filter
+    (``filter_status``) matches, not only the page on screen.
+    """
+    status = forms.ChoiceField(choices=Order.STATUS_CHOICES)
+    orders = forms.ModelMultipleChoiceField(queryset=Order.objects.all(), required=False,
+                                            widget=forms.MultipleHiddenInput)
+    select_across = forms.BooleanField(required=False)
+    filter_status = forms.ChoiceField(choices=[('', 'All')] + Order.STATUS_CHOICES, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('select_across') and not cleaned_data.get('orders'):
+            raise forms.ValidationError('Select at least one order.')
+        return cleaned_data
+
+    def selected_orders(self):
+        if not self.cleaned_data['select_across']:
+            return self.cleaned_data['orders']
+        orders = Order.objects.all()
+        if self.cleaned_data['filter_status']:
+            orders = orders.filter(status=self.cleaned_data['filter_status'])
+        return orders
 
 
 class AttendanceForm(forms.ModelForm):
@@ -40,6 +99,9 @@ class AttendanceForm(forms.ModelForm):
     class Meta:
         model = Attendance
         fields = ['worker', 'date', 'status']
+        widgets = {
+            'worker': AutocompleteSelect('workers'),
+        }
 
 
 class AttendanceBulkForm(forms.Form):
@@ -63,8 +125,86 @@ class AttendanceBulkForm(forms.Form):
                 )
 
 
+class AttendanceExceptionsForm(forms.Form):
+    date = forms.DateField(
+        widget=forms.DateInput(attrs={'type': 'date'}),
+        initial=timezone.now().date()
+    )
+    exceptions = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={'rows': 8, 'placeholder': '12,absent\n57,late'}),
+        help_text='Everyone not listed is recorded as present. One "worker ID, status" pair per line, '
+                  'or a JSON object such as {"12": "absent"}.'
+    )
+
+    def clean_exceptions(self):
+        raw = self.cleaned_data['exceptions'].strip()
+        if not raw:
+            return {}
+
+        if raw.startswith('{'):
+            try:
+                pairs = list(json.loads(raw).items())
+            except ValueError:
+                raise forms.ValidationError('Invalid JSON.')
+        else:
+            pairs = []
+            for line in raw.splitlines():
+                if line.strip():
+                    worker_id, _, status = line.partition(',')
+                    pairs.append((worker_id, status))
+
+        statuses = dict(Attendance.STATUS_CHOICES)
+        exceptions = {}
+        for worker_id, status in pairs:
+            status = str(status).strip().lower()
+            try:
+                worker_id = int(str(worker_id).strip())
+            except ValueError:
+                raise forms.ValidationError(f'"{worker_id}" is not a worker ID.')
+            if status not in statuses:
+                raise forms.ValidationError(f'Unknown status "{status}" for worker {worker_id}.')
+            exceptions[worker_id] = status
+
+        known = set(Worker.objects.filter(pk__in=exceptions).values_list('pk', flat=True))
+        missing = sorted(set(exceptions) - known)
+        if missing:
+            raise forms.ValidationError(f'Unknown worker IDs: {", ".join(map(str, missing))}.')
+
+        return exceptions
+
+
+class ExportForm(forms.Form):
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel (XLSX)'),
+    ]
+
+    format = forms.ChoiceField(required=False, choices=FORMAT_CHOICES)
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+    status = forms.CharField(required=False)
+
+
+class ImportUploadForm(forms.Form):
+    KIND_CHOICES = [
+        ('products', 'Products'),
+        ('workers', 'Workers'),
+        ('orders', 'Orders'),
+    ]
+
+    kind = forms.ChoiceField(choices=KIND_CHOICES)
+    file = forms.FileField(help_text='CSV with a header row, or JSON Lines (.jsonl).')
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        if not upload.name.lower().endswith(('.csv', '.jsonl', '.ndjson', '.json')):
+            raise forms.ValidationError('Upload a .csv or .jsonl file.')
+        return upload
+
+
 class WorkerSearchForm(forms.Form):
-    search = forms.CharField(required=False, label='Search by name or position')
+    search = forms.CharField(required=False, label='Search by name, position or phone')
     position = forms.ChoiceField(
         required=False,
         choices=[('', 'All Positions')] + [
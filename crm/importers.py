@@ -0,0 +1,257 @@
+"""
+Bulk loaders for products, workers and historical orders.
+
+Input files are streamed (CSV with a header row, or JSON Lines) and
+written in batches with bulk_create/bulk_update, one transaction per
+batch. Foreign keys are resolved through natural-key maps loaded once
+per import instead of one lookup per row:
+
+* products are keyed by ``name``
+* workers are keyed by ``phone_number``
+* orders reference ``worker`` (phone number) and ``product`` (name), or
+  ``worker_id``/``product_id`` directly
+
+Imported orders are history: they do not touch Product.stock, and they
+are priced at the product's current price.
+"""
+import csv
+import json
+import time
+from decimal import Decimal
+from itertools import islice
+
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from . import alerts, ledger
+from .models import Worker, Product, Order
+from .caching import invalidate
+from .rollups import rebuild, recategorize
+
+BATCH_SIZE = 2000
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.errors = []
+        self.started = time.monotonic()
+        self.seconds = 0
+
+    @property
+    def rows(self):
+        return self.created + self.updated + self.skipped
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0
+
+    def skip(self, line, message):
+        self.skipped += 1
+        if len(self.errors) < 100:
+            self.errors.append(f'line {line}: {message}')
+
+    def finish(self):
+        self.seconds = time.monotonic() - self.started
+        return self
+
+
+def read_records(path):
+    """
+    Yield ``(line_number, dict)`` pairs from a .csv or .jsonl file. A line
+    that is not a JSON object is yielded with a ValueError instead, for
+    the importer to skip.
+    """
+    with open(path, newline='', encoding='utf-8') as source:
+        if path.endswith(('.jsonl', '.ndjson', '.json')):
+            for number, line in enumerate(source, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield number, e
+                    continue
+                yield number, record if isinstance(record, dict) else ValueError('not a JSON object')
+        else:
+            # Line 1 is the header
+            for number, row in enumerate(csv.DictReader(source), start=2):
+                yield number, row
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _upsert(model, key_field, update_fields, records, batch_size, build):
+    """Create new rows and bulk-update existing ones, keyed by ``key_field``."""
+    result = ImportResult()
+    existing = dict(model.objects.values_list(key_field, 'pk'))
+
+    for batch in batched(records, batch_size):
+        creates, updates = {}, {}
+        for line, record in batch:
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                obj = build(record)
+            except (KeyError, ValueError, TypeError, ArithmeticError) as e:
+                result.skip(line, f'{type(e).__name__}: {e}')
+                continue
+
+            key = getattr(obj, key_field)
+            if key in existing:
+                obj.pk = existing[key]
+                updates[key] = obj
+            else:
+                # Later rows for the same key win
+                creates[key] = obj
+
+        with transaction.atomic():
+            created = model.objects.bulk_create(creates.values(), batch_size=batch_size)
+            model.objects.bulk_update(updates.values(), update_fields, batch_size=batch_size)
+
+        existing.update((getattr(obj, key_field), obj.pk) for obj in created)
+        result.created += len(created)
+        result.updated += len(updates)
+
+    return result
+
+
+def _positive_int(value, name):
+    number = int(value)
+    if number < 1:
+        raise ValueError(f'{name} must be at least 1')
+    return number
+
+
+def _text(record, name):
+    # Short CSV rows fill the missing columns with None
+    value = str(record.get(name) or '').strip()
+    if not value:
+        raise ValueError(f'missing {name}')
+    return value
+
+
+def _product(record):
+    category = _text(record, 'category')
+    if category not in dict(Product.CATEGORY_CHOICES):
+        raise ValueError(f'invalid category {category!r}')
+    price = Decimal(_text(record, 'price'))
+    if price < 0:
+        raise ValueError('price must not be negative')
+    return Product(
+        name=_text(record, 'name'),
+        category=category,
+        price=price,
+        stock=_positive_int(_text(record, 'stock'), 'stock'),
+    )
+
+
+def _worker(record):
+    join_date = parse_date(_text(record, 'join_date'))
+    if join_date is None:
+        raise ValueError(f'invalid join_date {record["join_date"]!r}')
+    return Worker(
+        full_name=_text(record, 'full_name'),
+        position=_text(record, 'position'),
+        phone_number=_text(record, 'phone_number'),
+        join_date=join_date,
+    )
+
+
+def import_products(records, batch_size=BATCH_SIZE):
+    return _upsert(Product, 'name', ['category', 'price', 'stock'], records, batch_size, _product)
+
+
+def import_workers(records, batch_size=BATCH_SIZE):
+    return _upsert(Worker, 'phone_number', ['full_name', 'position', 'join_date'], records, batch_size, _worker)
+
+
+def import_orders(records, batch_size=BATCH_SIZE):
+    result = ImportResult()
+    workers = dict(Worker.objects.values_list('phone_number', 'pk'))
+    products, prices = {}, {}
+    for pk, name, price in Product.objects.values_list('pk', 'name', 'price'):
+        products[name] = pk
+        prices[pk] = price
+    worker_ids = set(workers.values())
+    product_ids = set(prices)
+    statuses = dict(Order.STATUS_CHOICES)
+
+    def resolve(record, name, by_key, known_ids):
+        if record.get(f'{name}_id'):
+            pk = int(record[f'{name}_id'])
+            if pk not in known_ids:
+                raise KeyError(f'unknown {name} id {pk}')
+            return pk
+        key = str(record[name]).strip()
+        if key not in by_key:
+            raise KeyError(f'unknown {name} {key!r}')
+        return by_key[key]
+
+    first_date = last_date = None
+
+    for batch in batched(records, batch_size):
+        orders = []
+        for line, record in batch:
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                order_date = parse_date(_text(record, 'order_date'))
+                status = str(record.get('status') or 'pending').strip()
+                if order_date is None:
+                    raise ValueError(f'invalid order_date {record["order_date"]!r}')
+                if status not in statuses:
+                    raise ValueError(f'invalid status {status!r}')
+                order = Order(
+                    worker_id=resolve(record, 'worker', workers, worker_ids),
+                    product_id=resolve(record, 'product', products, product_ids),
+                    quantity=_positive_int(record['quantity'], 'quantity'),
+                    order_date=order_date,
+                    status=status,
+                )
+                order.set_prices(prices[order.product_id])
+                orders.append(order)
+            except (KeyError, ValueError, TypeError) as e:
+                result.skip(line, f'{type(e).__name__}: {e}')
+
+        with transaction.atomic():
+            Order.objects.bulk_create(orders, batch_size=batch_size)
+        result.created += len(orders)
+
+        dates = [order.order_date for order in orders]
+        if dates:
+            first_date = min(dates + [first_date or dates[0]])
+            last_date = max(dates + [last_date or dates[0]])
+
+    # bulk_create skips the rollup signals
+    if first_date:
+        rebuild(first_date, last_date)
+
+    return result
+
+
+IMPORTERS = {
+    'products': import_products,
+    'workers': import_workers,
+    'orders': import_orders,
+}
+
+
+def import_file(kind, path, batch_size=BATCH_SIZE):
+    result = IMPORTERS[kind](read_records(path), batch_size=batch_size)
+    # bulk_create/bulk_update skip the post_save signals
+    if kind == 'products':
+        ledger.reconcile()
+        alerts.check()
+        recategorize()
+    invalidate()
+    return result.finish()
@@ -0,0 +1,204 @@
+"""
+Per-request performance instrumentation.
+
+``PerformanceMiddleware`` times each request, every SQL statement (through
+``connection.execute_wrapper``) and template rendering (through the
+``TimedDjangoTemplates`` backend), then:
+
+* adds a ``Server-Timing`` header (total, db, template) to the response,
+* logs requests slower than ``CRM_SLOW_REQUEST_MS`` as one JSON line on
+  the ``crm.performance`` logger, with the slowest statements,
+* feeds ``view_stats``, a rolling window of timings per view kept in
+  this process, shown on the staff performance page.
+
+Queries run while a StreamingHttpResponse is consumed happen after the
+middleware returns and are not counted.
+"""
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger('crm.performance')
+
+_current = ContextVar('crm_request_metrics', default=None)
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total_ms = 0
+        self.queries = []
+        self.template_ms = 0
+        self._template_depth = 0
+
+    @property
+    def db_ms(self):
+        return sum(duration for duration, sql in self.queries)
+
+    def worst_queries(self, count):
+        return sorted(self.queries, key=lambda query: -query[0])[:count]
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(((time.perf_counter() - started) * 1000, sql))
+
+    def finish(self):
+        self.total_ms = (time.perf_counter() - self.started) * 1000
+        return self
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+
+        # Templates rendered inside another one (crispy fields, inclusion tags) are already being timed
+        metrics._template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics._template_depth -= 1
+            if not metrics._template_depth:
+                metrics.template_ms += (time.perf_counter() - started) * 1000
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render time added to the current request's metrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+class ViewStats:
+    """The last ``window`` requests of every view, for percentiles."""
+
+    def __init__(self, window=500, slow_window=20):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+        self.slow = deque(maxlen=slow_window)
+
+    def add(self, view, metrics, slow_entry=None):
+        with self.lock:
+            self.samples[view].append((metrics.total_ms, len(metrics.queries), metrics.db_ms, metrics.template_ms))
+            if slow_entry:
+                self.slow.appendleft(slow_entry)
+
+    def summary(self):
+        with self.lock:
+            samples = {view: list(rows) for view, rows in self.samples.items()}
+            slow = list(self.slow)
+
+        rows = []
+        for view, entries in samples.items():
+            totals = [entry[0] for entry in entries]
+            rows.append({
+                'view': view,
+                'count': len(entries),
+                'p50_ms': percentile(totals, 0.50),
+                'p95_ms': percentile(totals, 0.95),
+                'p99_ms': percentile(totals, 0.99),
+                'max_ms': max(totals),
+                'queries': sum(entry[1] for entry in entries) / len(entries),
+                'db_ms': sum(entry[2] for entry in entries) / len(entries),
+                'template_ms': sum(entry[3] for entry in entries) / len(entries),
+            })
+        rows.sort(key=lambda row: -row['p95_ms'])
+        return rows, slow
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.slow.clear()
+
+
+view_stats = ViewStats()
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with connection.execute_wrapper(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics.finish())
+
+    async def __acall__(self, request):
+        # The async ORM runs queries in a thread that shares this context, and so this connection
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with connection.execute_wrapper(metrics):
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics.finish())
+
+    def finish(self, request, response, metrics):
+        response['Server-Timing'] = (
+            f'total;dur={metrics.total_ms:.1f}, '
+            f'db;dur={metrics.db_ms:.1f};desc="{len(metrics.queries)} queries", '
+            f'template;dur={metrics.template_ms:.1f}'
+        )
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        slow_entry = None
+        if metrics.total_ms >= settings.CRM_SLOW_REQUEST_MS:
+            slow_entry = {
+                'view': view,
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'total_ms': round(metrics.total_ms, 1),
+                'db_ms': round(metrics.db_ms, 1),
+                'queries': len(metrics.queries),
+                'template_ms': round(metrics.template_ms, 1),
+                'worst_sql': [
+                    {'ms': round(duration, 1), 'sql': sql}
+                    for duration, sql in metrics.worst_queries(settings.CRM_SLOW_REQUEST_QUERIES)
+                ],
+            }
+            logger.warning(json.dumps(slow_entry))
+
+        view_stats.add(view, metrics, slow_entry)
+        return response
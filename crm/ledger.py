@@ -0,0 +1,110 @@
+"""
+Stock history.
+
+Every stock change writes a StockMovement row in the same transaction
+(crm.stock for orders, the Product signals for edits, ``reconcile``
+after bulk loads), so the movements of a product add up to its stock.
+``take_snapshots`` (``manage.py snapshot_stock``, run daily from cron,
+or the ``snapshot_stock`` task) stores each product's running total up
+to the newest movement id.
+
+``stock_as_of`` and ``balances`` start from the newest snapshot taken
+by the requested time and add only the movements after it, so a
+historic stock figure costs one index probe plus the movements of at
+most one snapshot interval, however long the history grows.
+"""
+from datetime import date, datetime, time
+
+from django.db import transaction
+from django.db.models import IntegerField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, StockMovement, StockSnapshot
+
+
+def _moment(when):
+    # A date means the end of that day
+    if isinstance(when, date) and not isinstance(when, datetime):
+        when = datetime.combine(when, time.max)
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
+
+
+def _ledger(product_ids=None, when=None, through=None):
+    """
+    Products annotated with their newest snapshot (``base``, ``snapshot_through``)
+    and the sum of the later movements (``delta``, NULL when there are none).
+    """
+    snapshots = StockSnapshot.objects.filter(product=OuterRef('pk'))
+    movements = StockMovement.objects.filter(product=OuterRef('pk'), id__gt=OuterRef('snapshot_through'))
+    if when is not None:
+        snapshots = snapshots.filter(taken_at__lte=when)
+        movements = movements.filter(created_at__lte=when)
+    if through is not None:
+        movements = movements.filter(id__lte=through)
+    latest = snapshots.order_by('-taken_at', '-id')[:1]
+    delta = movements.order_by().values('product').annotate(total=Sum('change')).values('total')
+
+    # Soft-deleted products keep their ledger until the purge
+    products = Product.all_objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=list(product_ids))
+    return products.annotate(
+        base=Coalesce(Subquery(latest.values('stock')), Value(0)),
+        snapshot_through=Coalesce(Subquery(latest.values('through_movement')), Value(0)),
+    ).annotate(delta=Subquery(delta, output_field=IntegerField()))
+
+
+def balances(product_ids=None, when=None):
+    """``{product_id: stock}`` as of ``when`` (a date means its end; now if None)."""
+    when = _moment(when) if when is not None else None
+    return {pk: base + (delta or 0) for pk, base, delta in
+            _ledger(product_ids, when).values_list('pk', 'base', 'delta')}
+
+
+def stock_as_of(product, when):
+    """Stock of ``product`` (an instance or id) at ``when``, replayed from the ledger."""
+    product_id = getattr(product, 'pk', product)
+    return balances([product_id], when).get(product_id, 0)
+
+
+def record(changes, reason):
+    """Write a movement for every non-zero ``{product_id: change}``."""
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=product_id, change=change, reason=reason)
+        for product_id, change in sorted(changes.items()) if change
+    ])
+
+
+def reconcile(product_ids=None):
+    """
+    Record an adjustment for every product whose stock differs from its
+    ledger balance, e.g. after bulk_create/bulk_update skipped the
+    signals. Returns the number of products adjusted.
+    """
+    with transaction.atomic():
+        changes = {
+            pk: stock - base - (delta or 0) for pk, stock, base, delta in
+            _ledger(product_ids).values_list('pk', 'stock', 'base', 'delta')
+        }
+        changes = {pk: change for pk, change in changes.items() if change}
+        record(changes, 'adjustment')
+    return len(changes)
+
+
+def take_snapshots(product_ids=None):
+    """Snapshot every product with movements since its last snapshot; returns the number taken."""
+    with transaction.atomic():
+        through = StockMovement.objects.aggregate(last=Max('id'))['last']
+        if through is None:
+            return 0
+        taken_at = timezone.now()
+        snapshots = [
+            StockSnapshot(product_id=pk, stock=base + delta, through_movement=through, taken_at=taken_at)
+            for pk, base, delta in _ledger(product_ids, through=through).values_list('pk', 'base', 'delta')
+            if delta is not None
+        ]
+        StockSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+    return len(snapshots)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from crm.archive import archive
+from crm.management.commands.export import date_argument
+
+
+class Command(BaseCommand):
+    help = 'Moves closed orders and attendance dated before --before into the archive tables, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=date_argument, required=True,
+                            help='Archive rows dated before this day (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows moved per transaction')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Archiving closed orders and attendance before {options['before']}...")
+        moved = archive(
+            options['before'], batch_size=options['batch_size'],
+            progress=lambda kind, count: self.stdout.write(f'  {kind}: {count}'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved['orders']} orders and {moved['attendance']} attendance records."
+        ))
@@ -0,0 +1,145 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from crm.instrumentation import percentile
+from crm.models import Worker
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json')
+
+
+class Command(BaseCommand):
+    help = 'Times the key CRM pages against the current database and compares them with a JSON baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline JSON file to compare against')
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+        parser.add_argument('--output', help='Also write the results to this JSON file')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p95 slowdown before a page is reported as a regression (0.25 = 25%%)')
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--read-only', action='store_true',
+                            help='Skip the attendance POSTs, which record everyone present today')
+
+    def endpoints(self, read_only):
+        """``(name, method, url, data, expected status)`` for every page to time."""
+        worker = Worker.objects.order_by('pk').first()
+        if worker is None:
+            raise CommandError('No workers found, seed data with "load_initial_data --workers N ..." first')
+        today = time.strftime('%Y-%m-%d')
+
+        endpoints = [
+            ('home', 'get', reverse('home'), None, 200),
+            ('order_list', 'get', reverse('order_list'), None, 200),
+            ('worker_detail', 'get', reverse('worker_detail', args=[worker.pk]), None, 200),
+        ]
+        # Above the limit the per-worker form only redirects to the quick form
+        workers = Worker.objects.count()
+        if workers <= settings.CRM_ATTENDANCE_FULL_FORM_LIMIT:
+            endpoints.append(('attendance_bulk_create', 'get', reverse('attendance_bulk_create'), None, 200))
+            if not read_only:
+                data = {'date': today}
+                data.update((f'worker_{pk}', 'present') for pk in Worker.objects.values_list('pk', flat=True))
+                endpoints.append(('attendance_bulk_create:post', 'post', reverse('attendance_bulk_create'), data, 302))
+        else:
+            self.stdout.write(f'attendance_bulk_create skipped: {workers} workers is above '
+                              f'CRM_ATTENDANCE_FULL_FORM_LIMIT ({settings.CRM_ATTENDANCE_FULL_FORM_LIMIT})')
+
+        endpoints.append(('attendance_quick_create', 'get', reverse('attendance_quick_create'), None, 200))
+        if not read_only:
+            endpoints.append(('attendance_quick_create:post', 'post', reverse('attendance_quick_create'),
+                              {'date': today, 'exceptions': ''}, 302))
+        return endpoints
+
+    def handle(self, *args, **options):
+        user, created = User.objects.get_or_create(username='benchmark', defaults={'is_staff': True})
+        hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+        client = Client(HTTP_HOST=hosts[0] if hosts else 'localhost')
+        client.force_login(user)
+
+        results, failures = {}, []
+        for name, method, url, data, expected in self.endpoints(options['read_only']):
+            for _ in range(options['warmup']):
+                getattr(client, method)(url, data)
+
+            timings, queries, statuses = [], 0, set()
+            for _ in range(options['iterations']):
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = getattr(client, method)(url, data)
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries = max(queries, len(captured))
+                statuses.add(response.status_code)
+            status = response.status_code
+
+            # Timing a redirect or an error page says nothing about the page itself
+            if statuses != {expected}:
+                failures.append(name)
+                self.stderr.write(self.style.ERROR(
+                    f'{name} answered {", ".join(map(str, sorted(statuses)))}, expected {expected}'
+                ))
+
+            results[name] = {
+                'status': status,
+                'queries': queries,
+                'p50_ms': round(percentile(timings, 0.50), 2),
+                'p95_ms': round(percentile(timings, 0.95), 2),
+                'p99_ms': round(percentile(timings, 0.99), 2),
+                'max_ms': round(max(timings), 2),
+            }
+            self.stdout.write(
+                f"{name:32} {status}  p50 {results[name]['p50_ms']:8.2f} ms  p95 {results[name]['p95_ms']:8.2f} ms  "
+                f"p99 {results[name]['p99_ms']:8.2f} ms  {queries} queries"
+            )
+
+        regressions = self.compare(results, options['baseline'], options['tolerance'])
+
+        save_baseline = options['save_baseline'] and not failures
+        for path in filter(None, [options['output'], options['baseline'] if save_baseline else None]):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'w') as target:
+                json.dump(results, target, indent=2, sort_keys=True)
+                target.write('\n')
+            self.stdout.write(f'Results written to {path}')
+
+        if created:
+            user.delete()
+
+        if failures:
+            raise CommandError(f'{len(failures)} page(s) did not answer as expected: {", ".join(failures)}')
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} page(s) regressed: {", ".join(regressions)}')
+
+    def compare(self, results, path, tolerance):
+        if not os.path.exists(path):
+            return []
+
+        with open(path) as source:
+            baseline = json.load(source)
+
+        regressions = []
+        self.stdout.write(f'\nCompared with {path}:')
+        for name, current in results.items():
+            previous = baseline.get(name)
+            if not previous:
+                continue
+            change = (current['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] if previous['p95_ms'] else 0
+            slower = change > tolerance or current['queries'] > previous['queries']
+            line = (f"{name:32} p95 {previous['p95_ms']:.2f} -> {current['p95_ms']:.2f} ms ({change:+.0%}), "
+                    f"queries {previous['queries']} -> {current['queries']}")
+            if slower:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(line + '  REGRESSION'))
+            else:
+                self.stdout.write(line)
+        return regressions
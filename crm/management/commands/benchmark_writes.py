@@ -0,0 +1,127 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.test.utils import override_settings
+
+from crm import stock
+from crm.instrumentation import percentile
+from crm.models import Worker, Product, Order
+
+
+class Command(BaseCommand):
+    help = ('Measures order-entry write throughput with several writer threads under each SQLite profile, '
+            'on throwaway copies of the database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=200, help='Orders written by each thread')
+        parser.add_argument('--profiles', nargs='+', default=list(settings.SQLITE_PROFILES),
+                            help='Profiles from settings.SQLITE_PROFILES to compare')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('benchmark_writes only applies to SQLite')
+        unknown = set(options['profiles']) - set(settings.SQLITE_PROFILES)
+        if unknown:
+            raise CommandError(f'Unknown profile(s): {", ".join(sorted(unknown))}')
+
+        worker_id = Worker.objects.order_by('pk').values_list('pk', flat=True).first()
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True)[:20])
+        if worker_id is None or not product_ids:
+            raise CommandError('Need at least one worker and one product, run "load_initial_data" first')
+
+        directory = tempfile.mkdtemp(prefix='crm-benchmark-')
+        try:
+            snapshot = os.path.join(directory, 'snapshot.sqlite3')
+            self.copy_database(snapshot, product_ids, options['threads'] * options['orders'])
+
+            self.stdout.write(f"{options['threads']} threads x {options['orders']} orders each\n")
+            for name in options['profiles']:
+                path = os.path.join(directory, f'{name}.sqlite3')
+                shutil.copyfile(snapshot, path)
+                result = self.run_profile(name, path, worker_id, product_ids, options['threads'], options['orders'])
+                self.stdout.write(
+                    f"{name:12} {result['orders']:6} orders in {result['seconds']:6.2f} s  "
+                    f"{result['per_second']:8.1f} orders/s  p95 {result['p95_ms']:7.1f} ms  "
+                    f"{result['locked']} 'database is locked' errors"
+                )
+        finally:
+            connection.close()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def copy_database(self, path, product_ids, units):
+        # The backup API copies a consistent snapshot even while others write
+        connection.ensure_connection()
+        target = sqlite3.connect(path)
+        try:
+            connection.connection.backup(target)
+            placeholders = ', '.join('?' * len(product_ids))
+            target.execute(f'UPDATE crm_product SET stock = ? WHERE id IN ({placeholders})', [units, *product_ids])
+            target.commit()
+        finally:
+            target.close()
+
+    def run_profile(self, name, path, worker_id, product_ids, threads, orders):
+        profile = settings.SQLITE_PROFILES[name]
+        settings_dict = connections['default'].settings_dict
+        original = settings_dict['NAME'], settings_dict['OPTIONS'].get('timeout')
+
+        # Only the writer threads connect while the copy is configured; each opens its own connection
+        settings_dict['NAME'] = path
+        settings_dict['OPTIONS']['timeout'] = profile['timeout']
+        try:
+            with override_settings(CRM_SQLITE_PRAGMAS=profile['pragmas']):
+                return self.write_concurrently(worker_id, product_ids, threads, orders)
+        finally:
+            settings_dict['NAME'] = original[0]
+            if original[1] is None:
+                settings_dict['OPTIONS'].pop('timeout', None)
+            else:
+                settings_dict['OPTIONS']['timeout'] = original[1]
+
+    def write_concurrently(self, worker_id, product_ids, threads, orders):
+        latencies, locked = [], []
+        start = threading.Barrier(threads)
+
+        def writer(offset):
+            try:
+                start.wait()
+                for i in range(orders):
+                    product_id = product_ids[(offset + i) % len(product_ids)]
+                    started = time.perf_counter()
+                    try:
+                        # Same work as order_create: reserve stock, then save the order
+                        with transaction.atomic():
+                            stock.reserve(product_id, 1)
+                            Order.objects.create(worker_id=worker_id, product_id=product_id, quantity=1, stock_held=True)
+                    except OperationalError as e:
+                        if 'locked' not in str(e):
+                            raise
+                        locked.append(1)
+                        continue
+                    latencies.append((time.perf_counter() - started) * 1000)
+            finally:
+                connections.close_all()
+
+        pool = [threading.Thread(target=writer, args=(offset,)) for offset in range(threads)]
+        started = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        seconds = time.perf_counter() - started
+
+        return {
+            'orders': len(latencies),
+            'seconds': seconds,
+            'per_second': len(latencies) / seconds if seconds else 0,
+            'p95_ms': percentile(latencies, 0.95) if latencies else 0,
+            'locked': len(locked),
+        }
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from crm.exports import EXPORTS, iter_rows, iter_csv, write_xlsx
+
+
+def date_argument(value):
+    parsed = parse_date(value)
+    if parsed is None:
+        raise CommandError(f'Invalid date "{value}", expected YYYY-MM-DD')
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'Exports orders, attendance or products as CSV or XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS))
+        parser.add_argument('--start', type=date_argument, help='First date to include (YYYY-MM-DD)')
+        parser.add_argument('--end', type=date_argument, help='Last date to include (YYYY-MM-DD)')
+        parser.add_argument('--status', help='Only rows with this status (category for products)')
+        parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv')
+        parser.add_argument('--output', help='File to write to, defaults to stdout for CSV')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rows = iter_rows(
+            options['name'],
+            start=options['start'],
+            end=options['end'],
+            status=options['status'],
+            chunk_size=options['chunk_size'],
+        )
+
+        if options['format'] == 'xlsx':
+            if not options['output']:
+                raise CommandError('--output is required for XLSX exports')
+            try:
+                write_xlsx(rows, options['output'])
+            except RuntimeError as e:
+                raise CommandError(str(e))
+            return
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as target:
+                target.writelines(iter_csv(rows))
+        else:
+            for line in iter_csv(rows):
+                self.stdout.write(line, ending='')
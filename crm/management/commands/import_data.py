@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.importers import IMPORTERS, BATCH_SIZE, import_file
+
+
+class Command(BaseCommand):
+    help = 'Bulk imports products, workers or historical orders from CSV or JSON Lines files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('paths', nargs='+', help='.csv (with header row) or .jsonl files')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        for path in options['paths']:
+            self.stdout.write(f'Importing {options["kind"]} from {path}...')
+            try:
+                result = import_file(options['kind'], path, batch_size=options['batch_size'])
+            except OSError as e:
+                raise CommandError(str(e))
+
+            for error in result.errors:
+                self.stderr.write(f'  skipped {error}')
+
+            self.stdout.write(self.style.SUCCESS(
+                f'{result.created} created, {result.updated} updated, {result.skipped} skipped '
+                f'in {result.seconds:.2f}s ({result.rows_per_second:,.0f} rows/s)'
+            ))
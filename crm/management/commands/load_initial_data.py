@@ -1,6 +1,11 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from crm import alerts, ledger
+from crm.caching import invalidate
 from crm.models import Worker, Product, Order, Attendance
+from crm.rollups import rebuild, source_date_range
+from crm.seeding import seed
 import random
 from datetime import timedelta
 
@@ -8,7 +13,20 @@ from datetime import timedelta
 class Command(BaseCommand):
     help = 'Loads initial data for the CRM application'
 
+    def add_arguments(self, parser):
+        # Any of the size options switches to generating synthetic data at scale
+        parser.add_argument('--workers', type=int, help='Number of synthetic workers')
+        parser.add_argument('--products', type=int, help='Number of synthetic products')
+        parser.add_argument('--orders', type=int, help='Number of synthetic orders')
+        parser.add_argument('--days', type=int, help='Days of order and attendance history')
+        parser.add_argument('--end-date', type=parse_date, help='Last day of history (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed, same seed gives the same data')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
     def handle(self, *args, **kwargs):
+        if any(kwargs[name] is not None for name in ('workers', 'products', 'orders', 'days')):
+            return self.load_synthetic_data(**kwargs)
+
         self.stdout.write('Loading initial data...')
 
         # Clear existing data
@@ -89,6 +107,8 @@ class Command(BaseCommand):
         ]
 
         Product.objects.bulk_create(products)
+        ledger.reconcile()
+        alerts.check()
         self.stdout.write(self.style.SUCCESS(f'Created {len(products)} products'))
 
         # Create orders
@@ -102,13 +122,15 @@ class Command(BaseCommand):
             status = random.choice(status_choices)
             order_date = timezone.now().date() - timedelta(days=random.randint(0, 30))
 
-            orders.append(Order(
+            order = Order(
                 worker=worker,
                 product=product,
                 quantity=quantity,
                 order_date=order_date,
                 status=status
-            ))
+            )
+            order.set_prices()
+            orders.append(order)
 
         Order.objects.bulk_create(orders)
         self.stdout.write(self.style.SUCCESS(f'Created {len(orders)} orders'))
@@ -129,4 +151,26 @@ class Command(BaseCommand):
         Attendance.objects.bulk_create(attendance_records)
         self.stdout.write(self.style.SUCCESS(f'Created {len(attendance_records)} attendance records'))
 
-        self.stdout.write(self.style.SUCCESS('Initial data loaded successfully!'))
\ No newline at end of file
+        # bulk_create skips the rollup and cache signals
+        first_date, last_date = source_date_range()
+        if first_date:
+            rebuild(first_date, last_date)
+        invalidate()
+
+        self.stdout.write(self.style.SUCCESS('Initial data loaded successfully!'))
+
+    def load_synthetic_data(self, **kwargs):
+        self.stdout.write('Generating synthetic data...')
+        counts = seed(
+            workers=kwargs['workers'] if kwargs['workers'] is not None else 100,
+            products=kwargs['products'] if kwargs['products'] is not None else 200,
+            orders=kwargs['orders'] if kwargs['orders'] is not None else 10000,
+            days=kwargs['days'] if kwargs['days'] is not None else 30,
+            end_date=kwargs['end_date'] or timezone.now().date(),
+            random_seed=kwargs['seed'],
+            batch_size=kwargs['batch_size'],
+            progress=lambda message: self.stdout.write(f'  {message}'),
+        )
+        for name, (count, seconds) in counts.items():
+            rate = count / seconds if seconds else 0
+            self.stdout.write(self.style.SUCCESS(f'Created {count} {name} in {seconds:.1f}s ({rate:,.0f} rows/s)'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from crm.deletion import pending, purge
+
+
+class Command(BaseCommand):
+    help = 'Removes soft-deleted workers and products with their orders, attendance and history, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Rows deleted per transaction (CRM_PURGE_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        purged = 0
+        for obj in pending():
+            self.stdout.write(f'Purging {obj._meta.verbose_name} "{obj}"...')
+            purge(
+                obj, batch_size=options['batch_size'],
+                progress=lambda deleted, total: self.stdout.write(f'  {deleted} of {total} rows'),
+            )
+            purged += 1
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} deleted records.'))
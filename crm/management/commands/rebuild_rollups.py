@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from crm.management.commands.export import date_argument
+from crm.rollups import rebuild, source_date_range
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily sales and attendance rollups from orders and attendance, in date windows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date_argument, help='First date to rebuild, defaults to the oldest data')
+        parser.add_argument('--end', type=date_argument, help='Last date to rebuild, defaults to the newest data')
+        parser.add_argument('--batch-days', type=int, default=31, help='Days recomputed per transaction')
+
+    def handle(self, *args, **options):
+        first, last = source_date_range()
+        start = options['start'] or first
+        end = options['end'] or last
+
+        if start is None or end is None:
+            self.stdout.write('Nothing to rebuild.')
+            return
+
+        self.stdout.write(f'Rebuilding rollups from {start} to {end}...')
+        rebuild(
+            start, end, batch_days=options['batch_days'],
+            progress=lambda first, last: self.stdout.write(f'  {first} - {last}'),
+        )
+        self.stdout.write(self.style.SUCCESS('Rollups rebuilt successfully!'))
@@ -0,0 +1,30 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from crm.tasks import Worker
+
+
+class Command(BaseCommand):
+    help = ('Runs queued background tasks (exports, imports, rollup rebuilds) with a pool of threads. '
+            'Start several to spread work over processes; they share the queue safely')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help='Tasks run at the same time by this process')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between checks of an empty queue')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--name', help='Worker name recorded on claimed tasks, defaults to host:pid')
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            threads=options['threads'],
+            poll_interval=options['poll_interval'],
+            name=options['name'],
+            log=self.stdout.write,
+        )
+        # Finish the running tasks on SIGTERM, like on Ctrl-C
+        signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+
+        self.stdout.write(f'Worker {worker.name} running {worker.threads} thread(s)...')
+        worker.run(burst=options['burst'])
+        self.stdout.write(self.style.SUCCESS('Worker stopped.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from crm.ledger import reconcile, take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Stores the stock of every product that moved since its last snapshot; run it daily from cron'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reconcile', action='store_true',
+                            help='First record adjustments for stock changed outside the ledger')
+
+    def handle(self, *args, **options):
+        if options['reconcile']:
+            adjusted = reconcile()
+            self.stdout.write(f'Recorded adjustments for {adjusted} products.')
+        taken = take_snapshots()
+        self.stdout.write(self.style.SUCCESS(f'Took {taken} stock snapshots.'))
@@ -0,0 +1,88 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:34
+
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+import django.db.models.deletion
+
+BATCH_SIZE = 5000
+
+
+def backfill_rollups(apps, schema_editor):
+    # Existing orders and attendance start out counted, so later edits and cancels have rows to adjust.
+    # Orders have no price snapshot yet; 0005 fills it with the same product price used here
+    Order = apps.get_model('crm', 'Order')
+    Attendance = apps.get_model('crm', 'Attendance')
+    DailyProductSales = apps.get_model('crm', 'DailyProductSales')
+    DailyWorkerSales = apps.get_model('crm', 'DailyWorkerSales')
+    DailyAttendance = apps.get_model('crm', 'DailyAttendance')
+
+    orders = Order.objects.exclude(status='cancelled').order_by()
+    totals = {'orders': Count('pk'), 'units': Sum('quantity'), 'revenue': Sum(F('quantity') * F('product__price'))}
+    DailyProductSales.objects.bulk_create((
+        DailyProductSales(date=row['order_date'], product_id=row['product_id'], category=row['product__category'],
+                          orders=row['orders'], units=row['units'], revenue=row['revenue'])
+        for row in orders.values('order_date', 'product_id', 'product__category').annotate(**totals).iterator()
+    ), batch_size=BATCH_SIZE)
+    DailyWorkerSales.objects.bulk_create((
+        DailyWorkerSales(date=row['order_date'], worker_id=row['worker_id'], orders=row['orders'],
+                         units=row['units'], revenue=row['revenue'])
+        for row in orders.values('order_date', 'worker_id').annotate(**totals).iterator()
+    ), batch_size=BATCH_SIZE)
+    DailyAttendance.objects.bulk_create((
+        DailyAttendance(date=row['date'], **{status: row[status] for status in ('present', 'absent', 'late')})
+        for row in Attendance.objects.order_by().values('date').annotate(
+            **{status: Count('pk', filter=Q(status=status)) for status in ('present', 'absent', 'late')}
+        ).iterator()
+    ), batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('present', models.IntegerField(default=0)),
+                ('absent', models.IntegerField(default=0)),
+                ('late', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyWorkerSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('worker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crm.worker')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['worker', 'date'], name='crm_dws_worker_date_idx')],
+                'unique_together': {('date', 'worker')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('category', models.CharField(choices=[('shirts', 'Shirts'), ('pants', 'Pants'), ('dresses', 'Dresses'), ('jackets', 'Jackets'), ('accessories', 'Accessories')], max_length=20)),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crm.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'category'], name='crm_dps_date_category_idx')],
+                'unique_together': {('date', 'product')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+
+def backfill_prices(apps, schema_editor):
+    # Existing orders take the product's current price; one UPDATE pair per id range
+    Order = apps.get_model('crm', 'Order')
+    Product = apps.get_model('crm', 'Product')
+    price = Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1])
+
+    last = Order.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    for start in range(0, last, BATCH_SIZE):
+        batch = Order.objects.filter(pk__gt=start, pk__lte=start + BATCH_SIZE)
+        batch.update(unit_price=price)
+        batch.update(line_total=F('quantity') * F('unit_price'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.RunPython(backfill_prices, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=12),
+        ),
+    ]
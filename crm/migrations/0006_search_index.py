@@ -0,0 +1,92 @@
+from django.db import migrations, OperationalError
+
+PHONE_DIGITS = "replace(replace(replace(replace(replace({}, '-', ''), ' ', ''), '(', ''), ')', ''), '+', '')"
+
+WORKER_ROW = "{0}.id, {0}.full_name, {0}.position, {0}.phone_number, " + PHONE_DIGITS.format('{0}.phone_number')
+PRODUCT_ROW = '{0}.id, {0}.name, {0}.category'
+
+CREATE = [
+    # Own copy of the text (not external content) so triggers only need the rowid to delete
+    """CREATE VIRTUAL TABLE crm_worker_search USING fts5(
+        full_name, position, phone_number, phone_digits,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )""",
+    f"""CREATE TRIGGER crm_worker_search_insert AFTER INSERT ON crm_worker BEGIN
+        INSERT INTO crm_worker_search (rowid, full_name, position, phone_number, phone_digits)
+        VALUES ({WORKER_ROW.format('new')});
+    END""",
+    f"""CREATE TRIGGER crm_worker_search_update AFTER UPDATE ON crm_worker BEGIN
+        DELETE FROM crm_worker_search WHERE rowid = old.id;
+        INSERT INTO crm_worker_search (rowid, full_name, position, phone_number, phone_digits)
+        VALUES ({WORKER_ROW.format('new')});
+    END""",
+    """CREATE TRIGGER crm_worker_search_delete AFTER DELETE ON crm_worker BEGIN
+        DELETE FROM crm_worker_search WHERE rowid = old.id;
+    END""",
+    f"""INSERT INTO crm_worker_search (rowid, full_name, position, phone_number, phone_digits)
+        SELECT {WORKER_ROW.format('crm_worker')} FROM crm_worker""",
+
+    """CREATE VIRTUAL TABLE crm_product_search USING fts5(
+        name, category,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )""",
+    f"""CREATE TRIGGER crm_product_search_insert AFTER INSERT ON crm_product BEGIN
+        INSERT INTO crm_product_search (rowid, name, category) VALUES ({PRODUCT_ROW.format('new')});
+    END""",
+    f"""CREATE TRIGGER crm_product_search_update AFTER UPDATE OF name, category ON crm_product BEGIN
+        DELETE FROM crm_product_search WHERE rowid = old.id;
+        INSERT INTO crm_product_search (rowid, name, category) VALUES ({PRODUCT_ROW.format('new')});
+    END""",
+    """CREATE TRIGGER crm_product_search_delete AFTER DELETE ON crm_product BEGIN
+        DELETE FROM crm_product_search WHERE rowid = old.id;
+    END""",
+    f"""INSERT INTO crm_product_search (rowid, name, category)
+        SELECT {PRODUCT_ROW.format('crm_product')} FROM crm_product""",
+]
+
+DROP = [
+    'DROP TRIGGER IF EXISTS crm_worker_search_insert',
+    'DROP TRIGGER IF EXISTS crm_worker_search_update',
+    'DROP TRIGGER IF EXISTS crm_worker_search_delete',
+    'DROP TABLE IF EXISTS crm_worker_search',
+    'DROP TRIGGER IF EXISTS crm_product_search_insert',
+    'DROP TRIGGER IF EXISTS crm_product_search_update',
+    'DROP TRIGGER IF EXISTS crm_product_search_delete',
+    'DROP TABLE IF EXISTS crm_product_search',
+]
+
+
+def fts5_available(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute('CREATE VIRTUAL TABLE temp.crm_fts5_probe USING fts5(value)')
+        except OperationalError:
+            return False
+        cursor.execute('DROP TABLE temp.crm_fts5_probe')
+    return True
+
+
+def create_search_index(apps, schema_editor):
+    # crm.search falls back to icontains filters when these tables are missing
+    if fts5_available(schema_editor):
+        for statement in CREATE:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in DROP:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_order_price_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,60 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+LOW_STOCK_LEVEL = 10
+
+
+def open_existing_alerts(apps, schema_editor):
+    # No product or category levels exist yet, so every product uses the default
+    Product = apps.get_model('crm', 'Product')
+    StockAlert = apps.get_model('crm', 'StockAlert')
+    StockAlert.objects.bulk_create(
+        StockAlert(product_id=pk, stock=stock, level=LOW_STOCK_LEVEL)
+        for pk, stock in Product.objects.filter(stock__lt=LOW_STOCK_LEVEL).values_list('pk', 'stock')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_search_index'),
+    ]
+
+    operations = [
+        # Nullable without a default, so SQLite adds the column in place and the search triggers survive
+        migrations.AddField(
+            model_name='product',
+            name='reorder_level',
+            field=models.PositiveIntegerField(blank=True, help_text='Raise a stock alert when stock falls below this level.', null=True),
+        ),
+        migrations.CreateModel(
+            name='CategoryReorderLevel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('shirts', 'Shirts'), ('pants', 'Pants'), ('dresses', 'Dresses'), ('jackets', 'Jackets'), ('accessories', 'Accessories')], max_length=20, unique=True)),
+                ('level', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.PositiveIntegerField()),
+                ('stock', models.PositiveIntegerField()),
+                ('opened_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_alerts', to='crm.product')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(condition=models.Q(('resolved_at__isnull', True)), fields=['stock'], name='crm_stockalert_open_idx'),
+                    models.Index(fields=['-opened_at', '-id'], name='crm_stockalert_opened_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(condition=models.Q(('resolved_at__isnull', True)), fields=('product',), name='crm_stockalert_one_open'),
+                ],
+            },
+        ),
+        migrations.RunPython(open_existing_alerts, migrations.RunPython.noop),
+    ]
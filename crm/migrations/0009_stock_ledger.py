@@ -0,0 +1,56 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    # Current stock becomes each product's opening balance
+    Product = apps.get_model('crm', 'Product')
+    StockMovement = apps.get_model('crm', 'StockMovement')
+    StockMovement.objects.bulk_create(
+        (StockMovement(product_id=pk, change=stock, reason='opening')
+         for pk, stock in Product.objects.values_list('pk', 'stock').iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0008_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('change', models.IntegerField()),
+                ('reason', models.CharField(choices=[('opening', 'Opening balance'), ('order', 'Order placed'), ('order_change', 'Order changed'), ('order_release', 'Order released'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='crm.product')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['product', 'id'], name='crm_stockmove_product_idx'),
+                    models.Index(fields=['created_at'], name='crm_stockmove_created_idx'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField()),
+                ('through_movement', models.BigIntegerField()),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='crm.product')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['product', '-taken_at'], name='crm_stocksnap_product_idx'),
+                ],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
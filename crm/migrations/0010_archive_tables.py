@@ -0,0 +1,50 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0009_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.PositiveIntegerField()),
+                ('order_date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('line_total', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to='crm.product')),
+                ('worker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to='crm.worker')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['-order_date', '-id'], name='crm_archorder_date_id_idx'),
+                    models.Index(fields=['worker', '-order_date'], name='crm_archorder_worker_date_idx'),
+                    models.Index(fields=['product', '-order_date'], name='crm_archorder_product_date_idx'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedAttendance',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('present', 'Present'), ('absent', 'Absent'), ('late', 'Late')], max_length=20)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('worker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_attendance', to='crm.worker')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['date', 'status'], name='crm_archattend_date_idx'),
+                    models.Index(fields=['worker', '-date'], name='crm_archattend_worker_idx'),
+                ],
+            },
+        ),
+    ]
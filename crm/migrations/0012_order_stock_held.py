@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+def backfill_stock_held(apps, schema_editor):
+    # Creating an order has always taken its stock, so every order holds its quantity
+    # except cancelled ones, which hold none from here on
+    Order = apps.get_model('crm', 'Order')
+    Order.objects.exclude(status='cancelled').update(stock_held=True)
+    Order.objects.filter(status='cancelled').update(stock_held=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0011_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='stock_held',
+            field=models.BooleanField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_stock_held, migrations.RunPython.noop),
+    ]
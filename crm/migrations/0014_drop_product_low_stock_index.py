@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0013_hide_deleted_dependents'),
+    ]
+
+    # The dashboard reads open stock alerts (crm_stockalert_open_idx) instead of stock < 10
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='crm_product_low_stock_idx',
+        ),
+    ]
@@ -1,12 +1,38 @@
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
+# Reorder level for products with neither their own nor a category level
+LOW_STOCK_LEVEL = 10
+
+
+class ActiveManager(models.Manager):
+    """The default manager of the soft-deletable models: soft-deleted rows are left out (see crm.deletion)."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 
 class Worker(models.Model):
     full_name = models.CharField(max_length=100)
     position = models.CharField(max_length=100)
     phone_number = models.CharField(max_length=20)
     join_date = models.DateField()
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ActiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # Only the deleted rows waiting to be purged
+            models.Index(fields=['deleted_at'], name='crm_worker_deleted_idx',
+                         condition=models.Q(deleted_at__isnull=False)),
+            models.Index(fields=['full_name', 'id'], name='crm_worker_name_id_idx'),
+            # worker_list filtered by position, ordered by name
+            models.Index(fields=['position', 'full_name', 'id'], name='crm_worker_position_idx'),
+            models.Index(fields=['join_date'], name='crm_worker_join_date_idx'),
+        ]
 
     def __str__(self):
         return self.full_name
@@ -25,11 +51,109 @@ class Product(models.Model):
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField()
+    # Blank falls back to the category's CategoryReorderLevel, then LOW_STOCK_LEVEL
+    reorder_level = models.PositiveIntegerField(
+        null=True, blank=True, help_text='Raise a stock alert when stock falls below this level.'
+    )
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ActiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at'], name='crm_product_deleted_idx',
+                         condition=models.Q(deleted_at__isnull=False)),
+            models.Index(fields=['name', 'id'], name='crm_product_name_id_idx'),
+            models.Index(fields=['category', 'name'], name='crm_product_category_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(price__gte=0), name='crm_product_price_gte_0'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class CategoryReorderLevel(models.Model):
+    category = models.CharField(max_length=20, choices=Product.CATEGORY_CHOICES, unique=True)
+    level = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.get_category_display()}: {self.level}"
+
+
+class StockAlert(models.Model):
+    """A product below its reorder level; kept open (one per product) until stock recovers."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_alerts')
+    level = models.PositiveIntegerField()
+    stock = models.PositiveIntegerField()
+    opened_at = models.DateTimeField(default=timezone.now)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product'], condition=models.Q(resolved_at__isnull=True), name='crm_stockalert_one_open',
+            ),
+        ]
+        indexes = [
+            # The dashboard lists the open alerts, lowest stock first
+            models.Index(fields=['stock'], name='crm_stockalert_open_idx', condition=models.Q(resolved_at__isnull=True)),
+            models.Index(fields=['-opened_at', '-id'], name='crm_stockalert_opened_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name}: {self.stock} below {self.level}"
+
+    @property
+    def is_open(self):
+        return self.resolved_at is None
+
+
+class StockMovement(models.Model):
+    """One change to a product's stock; rows are only ever added (see crm.ledger)."""
+    REASON_CHOICES = [
+        ('opening', 'Opening balance'),
+        ('order', 'Order placed'),
+        ('order_change', 'Order changed'),
+        ('order_release', 'Order released'),
+        ('adjustment', 'Adjustment'),
+    ]
+
+    # Indexed together with id below
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements', db_index=False)
+    change = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Movements of one product after a snapshot's last movement id
+            models.Index(fields=['product', 'id'], name='crm_stockmove_product_idx'),
+            models.Index(fields=['created_at'], name='crm_stockmove_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name}: {self.change:+d} ({self.get_reason_display()})"
+
+
+class StockSnapshot(models.Model):
+    """A product's stock once every movement up to ``through_movement`` is applied."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots', db_index=False)
+    stock = models.IntegerField()
+    through_movement = models.BigIntegerField()
+    taken_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', '-taken_at'], name='crm_stocksnap_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name}: {self.stock} at {self.taken_at:%Y-%m-%d %H:%M}"
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -42,12 +166,57 @@ class Order(models.Model):
     quantity = models.PositiveIntegerField()
     order_date = models.DateField(default=timezone.now)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Snapshot of the product price when the order was placed, so totals never join Product
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, editable=False)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2, editable=False)
+    # Whether crm.stock has the quantity reserved; None when stock was never booked for the order
+    # (imports, seeding), and then it never moves for it
+    stock_held = models.BooleanField(null=True, editable=False)
+    # Set with the worker's or product's, so the order is hidden until the purge removes it
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ActiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-order_date', '-id'], name='crm_order_date_id_idx'),
+            # worker_detail and product_detail list one FK's orders newest first
+            models.Index(fields=['worker', '-order_date'], name='crm_order_worker_date_idx'),
+            models.Index(fields=['product', '-order_date'], name='crm_order_product_date_idx'),
+            # Admin status filter combined with the order_date hierarchy
+            models.Index(fields=['status', 'order_date'], name='crm_order_status_date_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(status__in=['pending', 'completed', 'cancelled']), name='crm_order_status_valid',
+            ),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The product the stored unit_price was taken from
+        priced = self.__dict__.get('unit_price') is not None
+        self._priced_product_id = self.__dict__.get('product_id') if priced else None
 
     def __str__(self):
         return f"Order #{self.id} - {self.product.name} by {self.worker.full_name}"
 
+    def set_prices(self, unit_price=None):
+        """Snapshot ``unit_price`` (the product's current price by default) and recompute line_total."""
+        if unit_price is None and (self.unit_price is None or self.product_id != self._priced_product_id):
+            unit_price = self.product.price
+        if unit_price is not None:
+            self.unit_price = self._meta.get_field('unit_price').to_python(unit_price)
+            self._priced_product_id = self.product_id
+        self.line_total = self.quantity * self.unit_price
+
+    def save(self, *args, **kwargs):
+        self.set_prices()
+        super().save(*args, **kwargs)
+
     def total_price(self):
-        return self.quantity * self.product.price
+        return self.line_total
 
 
 class Attendance(models.Model):
@@ -60,9 +229,168 @@ class Attendance(models.Model):
     worker = models.ForeignKey(Worker, on_delete=models.CASCADE)
     date = models.DateField(default=timezone.now)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ActiveManager()
+    all_objects = models.Manager()
 
     class Meta:
         unique_together = ['worker', 'date']
+        indexes = [
+            # Dashboard counts and attendance_list read one day, split by status
+            models.Index(fields=['date', 'status'], name='crm_attendance_date_status_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(status__in=['present', 'absent', 'late']), name='crm_attendance_status_valid',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.worker.full_name} - {self.date} - {self.status}"
+
+
+# Cold copies of old rows, moved out of the hot tables by `manage.py archive` (crm.archive)
+class ArchivedOrder(models.Model):
+    """A closed order moved out of crm_order; keeps its id, prices and status."""
+    id = models.BigIntegerField(primary_key=True)
+    worker = models.ForeignKey(Worker, on_delete=models.CASCADE, related_name='archived_orders')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='archived_orders')
+    quantity = models.PositiveIntegerField()
+    order_date = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2)
+    archived_at = models.DateTimeField(default=timezone.now)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ActiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-order_date', '-id'], name='crm_archorder_date_id_idx'),
+            models.Index(fields=['worker', '-order_date'], name='crm_archorder_worker_date_idx'),
+            models.Index(fields=['product', '-order_date'], name='crm_archorder_product_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.id} - {self.product.name} by {self.worker.full_name}"
+
+    def total_price(self):
+        return self.line_total
+
+
+class ArchivedAttendance(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    worker = models.ForeignKey(Worker, on_delete=models.CASCADE, related_name='archived_attendance')
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Attendance.STATUS_CHOICES)
+    archived_at = models.DateTimeField(default=timezone.now)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ActiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'status'], name='crm_archattend_date_idx'),
+            models.Index(fields=['worker', '-date'], name='crm_archattend_worker_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.worker.full_name} - {self.date} - {self.status}"
+
+
+# Daily rollups, kept current by crm.rollups and rebuilt with `manage.py rebuild_rollups`
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    category = models.CharField(max_length=20, choices=Product.CATEGORY_CHOICES)
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['date', 'product']
+        indexes = [
+            models.Index(fields=['date', 'category'], name='crm_dps_date_category_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.worker.full_name} - {self.date} - {self.status}"
\ No newline at end of file
+        return f"{self.date} - {self.product_id}: {self.units} units"
+
+
+class DailyWorkerSales(models.Model):
+    date = models.DateField()
+    worker = models.ForeignKey(Worker, on_delete=models.CASCADE)
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['date', 'worker']
+        indexes = [
+            models.Index(fields=['worker', 'date'], name='crm_dws_worker_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.worker_id}: {self.units} units"
+
+
+class DailyAttendance(models.Model):
+    date = models.DateField(unique=True)
+    present = models.IntegerField(default=0)
+    absent = models.IntegerField(default=0)
+    late = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date}: {self.present} present, {self.absent} absent, {self.late} late"
+
+
+class Task(models.Model):
+    """A unit of background work, queued by crm.tasks.enqueue and run by `manage.py run_worker`."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # Not picked up before this time; pushed back after a failed attempt
+    run_after = models.DateTimeField(default=timezone.now)
+    progress = models.PositiveIntegerField(default=0)
+    message = models.CharField(max_length=200, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest due task; only queued rows are indexed
+            models.Index(fields=['run_after', 'id'], name='crm_task_queue_idx', condition=models.Q(status='queued')),
+            models.Index(fields=['heartbeat_at'], name='crm_task_running_idx', condition=models.Q(status='running')),
+            models.Index(fields=['-created_at', '-id'], name='crm_task_created_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(status__in=['queued', 'running', 'succeeded', 'failed']), name='crm_task_status_valid',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
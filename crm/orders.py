@@ -0,0 +1,268 @@
+"""
+Orders in bulk.
+
+``place_orders`` takes a list of order dicts (as posted to the batch API)
+and returns one result per item. Items are validated against id maps
+loaded once, stock is allocated in Python from a single read of the
+products involved, and the accepted orders are then written with one
+guarded stock UPDATE per product and one bulk INSERT, all inside one
+transaction.
+
+``change_status`` moves many orders to one status (the order list and
+admin actions) with one UPDATE for the orders and one per product for
+the stock. ``save_order`` and ``delete_orders`` do the same for single
+orders from the order views and the admin.
+
+Cancelled orders hold no stock: cancelling hands the units back, and
+reopening a cancelled order takes them again. ``Order.stock_held``
+records what an order holds, and stock only moves for orders where it
+is known; imported and seeded orders have it NULL and keep whatever
+stock they took or never took.
+"""
+from django.db import transaction
+from django.db.models import BooleanField, Case, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import stock
+from .caching import invalidate
+from .models import Worker, Product, Order
+from .rollups import apply_many, order_contribution
+
+# Allocation is retried when another writer takes the stock between our read and our UPDATE
+ALLOCATION_ATTEMPTS = 3
+
+
+def _orders_changed():
+    invalidate(Order)
+
+
+def _positive_int(value, name):
+    # Only ints and digit strings: int() would truncate 1.7 and word its own errors
+    if isinstance(value, str) and value.strip().isdecimal():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f'{name} must be a whole number')
+    if value < 1:
+        raise ValueError(f'{name} must be at least 1')
+    return value
+
+
+def clean_item(item, worker_ids, product_ids):
+    """Return ``(order_fields, errors)`` for one posted item."""
+    if not isinstance(item, dict):
+        return None, {'__all__': ['Each order must be an object.']}
+
+    cleaned, errors = {}, {}
+    for name, known in (('worker', worker_ids), ('product', product_ids)):
+        try:
+            pk = _positive_int(item[name], name)
+            if pk not in known:
+                raise ValueError(f'Unknown {name} {pk}.')
+            cleaned[f'{name}_id'] = pk
+        except KeyError:
+            errors[name] = ['This field is required.']
+        except (TypeError, ValueError) as e:
+            errors[name] = [str(e)]
+
+    try:
+        cleaned['quantity'] = _positive_int(item['quantity'], 'quantity')
+    except KeyError:
+        errors['quantity'] = ['This field is required.']
+    except (TypeError, ValueError) as e:
+        errors['quantity'] = [str(e)]
+
+    order_date = item.get('order_date')
+    if order_date is None:
+        cleaned['order_date'] = timezone.now().date()
+    else:
+        try:
+            cleaned['order_date'] = parse_date(str(order_date))
+        except ValueError:
+            cleaned['order_date'] = None
+        if cleaned['order_date'] is None:
+            errors['order_date'] = [f'Invalid date {order_date!r}.']
+
+    status = item.get('status', 'pending')
+    if not isinstance(status, str) or status not in dict(Order.STATUS_CHOICES):
+        errors['status'] = [f'Invalid status {status!r}.']
+    cleaned['status'] = status
+
+    return (None, errors) if errors else (cleaned, {})
+
+
+def _ids(items, name):
+    ids = set()
+    for item in items:
+        try:
+            ids.add(int(item[name]))
+        except (KeyError, TypeError, ValueError):
+            pass
+    return ids
+
+
+def _allocate(cleaned, results):
+    """Decide which cleaned items the current stock covers; returns ``(index, fields)`` pairs."""
+    product_ids = {fields['product_id'] for index, fields in cleaned}
+    available = dict(Product.objects.select_for_update().filter(pk__in=product_ids).values_list('pk', 'stock'))
+
+    accepted = []
+    for index, fields in cleaned:
+        product_id, quantity = fields['product_id'], fields['quantity']
+        if fields['status'] == 'cancelled':
+            accepted.append((index, fields))
+            continue
+        if available[product_id] < quantity:
+            results[index] = {
+                'index': index,
+                'status': 'error',
+                'errors': {'quantity': [f'Not enough stock available. Only {available[product_id]} units available.']},
+            }
+            continue
+        available[product_id] -= quantity
+        accepted.append((index, fields))
+    return accepted
+
+
+def place_orders(items, all_or_nothing=False):
+    """
+    Create the orders in ``items`` that validate and have stock.
+
+    Items are served in the order given, so when stock runs out the later
+    items fail. With ``all_or_nothing`` a single failure leaves the
+    database untouched. Returns ``(results, committed)`` where results
+    holds one ``{'index', 'status', ...}`` dict per item.
+    """
+    worker_ids = set(Worker.objects.filter(pk__in=_ids(items, 'worker')).values_list('pk', flat=True))
+    products = Product.objects.filter(pk__in=_ids(items, 'product')).in_bulk()
+
+    results = [None] * len(items)
+    cleaned = []
+    for index, item in enumerate(items):
+        fields, errors = clean_item(item, worker_ids, products)
+        if errors:
+            results[index] = {'index': index, 'status': 'error', 'errors': errors}
+        else:
+            cleaned.append((index, fields))
+
+    for attempt in range(ALLOCATION_ATTEMPTS):
+        attempt_results = list(results)
+        try:
+            with transaction.atomic():
+                accepted = _allocate(cleaned, attempt_results) if cleaned else []
+                if not accepted or (all_or_nothing and len(accepted) < len(items)):
+                    # Nothing is written
+                    return _rolled_back(attempt_results, all_or_nothing), False
+
+                stock.reserve_many(
+                    (fields['product_id'], fields['quantity']) for index, fields in accepted
+                    if fields['status'] != 'cancelled'
+                )
+                orders = []
+                for index, fields in accepted:
+                    order = Order(**fields, stock_held=fields['status'] != 'cancelled')
+                    order.product = products[order.product_id]
+                    order.set_prices()
+                    orders.append(order)
+                Order.objects.bulk_create(orders)
+
+                # bulk_create skips the rollup and cache signals
+                apply_many([order_contribution(order) for order in orders], 1)
+                transaction.on_commit(_orders_changed)
+        except stock.InsufficientStock:
+            if attempt == ALLOCATION_ATTEMPTS - 1:
+                raise
+            continue
+
+        for (index, fields), order in zip(accepted, orders):
+            attempt_results[index] = {
+                'index': index,
+                'status': 'created',
+                'id': order.pk,
+                'unit_price': order.unit_price,
+                'line_total': order.line_total,
+            }
+        return attempt_results, True
+
+
+def change_status(order_ids, status):
+    """
+    Set ``status`` on the orders in ``order_ids`` and return how many changed.
+
+    Stock moves for the orders that are cancelled or reopened, all or
+    nothing (InsufficientStock when a reopened order no longer fits),
+    and the rollups follow, all in the one transaction.
+    """
+    with transaction.atomic():
+        orders = list(
+            Order.objects.filter(pk__in=list(order_ids)).exclude(status=status)
+            .values('pk', 'status', 'stock_held', 'order_date', 'product_id', 'worker_id', 'product__category',
+                    'quantity', 'line_total')
+        )
+        if not orders:
+            return 0
+
+        if status == 'cancelled':
+            moving, sign, move_stock = orders, -1, stock.release_many
+            booked = [order for order in moving if order['stock_held']]
+        else:
+            moving, sign, move_stock = [order for order in orders if order['status'] == 'cancelled'], 1, stock.reserve_many
+            booked = [order for order in moving if order['stock_held'] is False]
+        if booked:
+            # One UPDATE per product, however many orders it has
+            move_stock([(order['product_id'], order['quantity']) for order in booked])
+
+        Order.objects.filter(pk__in=[order['pk'] for order in orders]).update(
+            status=status,
+            stock_held=Case(When(stock_held__isnull=False, then=Value(status != 'cancelled')), default=None,
+                            output_field=BooleanField()),
+        )
+
+        # Queryset updates skip the rollup signals
+        apply_many([
+            {'date': order['order_date'], 'product_id': order['product_id'], 'worker_id': order['worker_id'],
+             'category': order['product__category'], 'units': order['quantity'], 'revenue': order['line_total']}
+            for order in moving
+        ], sign)
+        transaction.on_commit(_orders_changed)
+    return len(orders)
+
+
+def save_order(order):
+    """
+    Save a new or edited ``order`` and move the stock it holds to its
+    new product and quantity (none when cancelled); orders whose stock
+    was never booked keep it untouched. Raises InsufficientStock and
+    leaves the order unsaved when stock runs short.
+    """
+    quantity = 0 if order.status == 'cancelled' else order.quantity
+    with transaction.atomic():
+        before = None
+        if order.pk:
+            before = (Order.objects.select_for_update().filter(pk=order.pk)
+                      .values('product_id', 'quantity', 'stock_held').first())
+        if before is None:
+            if quantity:
+                stock.reserve(order.product_id, quantity)
+            order.stock_held = bool(quantity)
+        elif before['stock_held'] is not None:
+            held = before['quantity'] if before['stock_held'] else 0
+            stock.rebook(before['product_id'], held, order.product_id, quantity)
+            order.stock_held = bool(quantity)
+        order.save()
+
+
+def delete_orders(orders):
+    """Delete ``orders`` and hand back the stock they hold."""
+    orders = list(orders)
+    with transaction.atomic():
+        stock.release_many([(order.product_id, order.quantity) for order in orders if order.stock_held])
+        Order.objects.filter(pk__in=[order.pk for order in orders]).delete()
+
+
+def _rolled_back(results, all_or_nothing):
+    if all_or_nothing:
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = {'index': index, 'status': 'skipped'}
+    return results
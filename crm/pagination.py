@@ -0,0 +1,136 @@
+import base64
+import json
+
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.next_query = ''
+        self.previous_query = ''
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination over a fixed ordering such as ('-order_date', '-id').
+
+    Every page is fetched with a ``WHERE (key) > (cursor) ... LIMIT n`` query,
+    so the cost of a page does not depend on how deep into the table it is.
+    The last ordering field must be unique (normally the primary key).
+    """
+
+    def __init__(self, queryset, ordering, per_page=25):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.descending = [name.startswith('-') for name in self.ordering]
+
+    def encode_cursor(self, obj):
+        values = []
+        for name in self.fields:
+            value = getattr(obj, self.queryset.model._meta.get_field(name).attname)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        except (ValueError, TypeError):
+            raise InvalidCursor(cursor)
+
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor(cursor)
+
+        try:
+            return [
+                self.queryset.model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.fields, values)
+            ]
+        except Exception:
+            raise InvalidCursor(cursor)
+
+    def _seek(self, values, forward):
+        # Builds (a > x) OR (a = x AND b > y) OR ... for the cursor position.
+        condition = Q()
+        for index, name in enumerate(self.fields):
+            use_lt = self.descending[index] == forward
+            lookup = '%s__%s' % (name, 'lt' if use_lt else 'gt')
+            term = Q(**{lookup: values[index]})
+            for prev_index in range(index):
+                term &= Q(**{self.fields[prev_index]: values[prev_index]})
+            condition |= term
+        return condition
+
+    def _reversed_ordering(self):
+        return [name[1:] if name.startswith('-') else '-' + name for name in self.ordering]
+
+    def get_page(self, after=None, before=None):
+        if before:
+            values = self.decode_cursor(before)
+            queryset = self.queryset.filter(self._seek(values, forward=False))
+            rows = list(queryset.order_by(*self._reversed_ordering())[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            if not rows:
+                return self.get_page()
+            next_cursor = self.encode_cursor(rows[-1])
+            previous_cursor = self.encode_cursor(rows[0]) if has_more else None
+            return KeysetPage(rows, next_cursor=next_cursor, previous_cursor=previous_cursor)
+
+        queryset = self.queryset
+        if after:
+            queryset = queryset.filter(self._seek(self.decode_cursor(after), forward=True))
+
+        rows = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        next_cursor = self.encode_cursor(rows[-1]) if rows and has_more else None
+        previous_cursor = self.encode_cursor(rows[0]) if rows and after else None
+        return KeysetPage(rows, next_cursor=next_cursor, previous_cursor=previous_cursor)
+
+
+def _page_query(request, **cursor):
+    params = request.GET.copy()
+    params.pop('after', None)
+    params.pop('before', None)
+    params.update(cursor)
+    return params.urlencode()
+
+
+def paginate(request, queryset, ordering, per_page=25):
+    paginator = KeysetPaginator(queryset, ordering, per_page=per_page)
+    try:
+        page = paginator.get_page(after=request.GET.get('after'), before=request.GET.get('before'))
+    except InvalidCursor:
+        page = paginator.get_page()
+
+    # Links keep the current filters (search, position, ...) intact
+    if page.has_next():
+        page.next_query = _page_query(request, after=page.next_cursor)
+    if page.has_previous():
+        page.previous_query = _page_query(request, before=page.previous_cursor)
+    return page
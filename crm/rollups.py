@@ -0,0 +1,199 @@
+"""
+Daily sales and attendance rollups.
+
+Order writes adjust the rollup rows incrementally through signals (each
+order adds its quantity/revenue to one product row and one worker row
+for its date; cancelled orders count for nothing). Bulk paths that skip
+signals call ``rebuild`` or ``refresh_attendance`` for the dates they
+touched, and ``manage.py rebuild_rollups`` backfills everything in
+batches. A product's rows follow it to a new category (``recategorize``). Rows moved to the archive tables (crm.archive) keep counting:
+recounts read the hot and the archived rows.
+"""
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import (
+    Product, Order, Attendance, ArchivedOrder, ArchivedAttendance, DailyProductSales, DailyWorkerSales, DailyAttendance,
+)
+
+ATTENDANCE_COUNTS = {
+    'present': Count('pk', filter=Q(status='present')),
+    'absent': Count('pk', filter=Q(status='absent')),
+    'late': Count('pk', filter=Q(status='late')),
+}
+
+
+def to_date(value):
+    # Unsaved defaults (timezone.now) are datetimes; normalise like DateField does
+    return Order._meta.get_field('order_date').to_python(value)
+
+
+def order_contribution(order):
+    """What ``order`` adds to the rollups, or None if it adds nothing."""
+    if order.status == 'cancelled':
+        return None
+    return {
+        'date': to_date(order.order_date),
+        'product_id': order.product_id,
+        'worker_id': order.worker_id,
+        'category': order.product.category,
+        'units': order.quantity,
+        'revenue': order.line_total,
+    }
+
+
+def _increment(model, lookup, defaults, deltas):
+    changes = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **defaults, **deltas)
+    except IntegrityError:
+        # Another writer created the row first
+        model.objects.filter(**lookup).update(**changes)
+
+
+def _decrement(model, lookup, deltas):
+    # Never creates rows: the parent may be gone already (cascade deletes)
+    model.objects.filter(**lookup).update(**{field: F(field) - value for field, value in deltas.items()})
+
+
+def apply(contribution, sign):
+    apply_many([contribution], sign)
+
+
+def apply_many(contributions, sign):
+    """Add (or take out) several contributions with one statement per product day and worker day."""
+    products, workers, categories = {}, {}, {}
+    for contribution in contributions:
+        if contribution is None:
+            continue
+        product_key = (contribution['date'], contribution['product_id'])
+        worker_key = (contribution['date'], contribution['worker_id'])
+        categories[product_key] = contribution['category']
+        for totals, key in ((products, product_key), (workers, worker_key)):
+            deltas = totals.setdefault(key, {'orders': 0, 'units': 0, 'revenue': 0})
+            deltas['orders'] += 1
+            deltas['units'] += contribution['units']
+            deltas['revenue'] += contribution['revenue']
+
+    for (day, product_id), deltas in products.items():
+        lookup = {'date': day, 'product_id': product_id}
+        if sign > 0:
+            _increment(DailyProductSales, lookup, {'category': categories[day, product_id]}, deltas)
+        else:
+            _decrement(DailyProductSales, lookup, deltas)
+    for (day, worker_id), deltas in workers.items():
+        lookup = {'date': day, 'worker_id': worker_id}
+        if sign > 0:
+            _increment(DailyWorkerSales, lookup, {}, deltas)
+        else:
+            _decrement(DailyWorkerSales, lookup, deltas)
+
+
+def recategorize(product_ids=None):
+    """Move the product rows of ``product_ids`` (default: all) to their product's current category."""
+    rows = DailyProductSales.objects.all()
+    if product_ids is not None:
+        rows = rows.filter(product_id__in=product_ids)
+    category = Product.all_objects.filter(pk=OuterRef('product_id')).values('category')[:1]
+    return rows.exclude(category=Subquery(category)).update(category=Subquery(category))
+
+
+def refresh_attendance(*days):
+    """Recount DailyAttendance for ``days`` from the (date, status) index."""
+    for day in set(days):
+        counts = Attendance.objects.filter(date=day).aggregate(**ATTENDANCE_COUNTS)
+        archived = ArchivedAttendance.objects.filter(date=day).aggregate(**ATTENDANCE_COUNTS)
+        counts = {status: counts[status] + archived[status] for status in counts}
+        DailyAttendance.objects.bulk_create(
+            [DailyAttendance(date=day, **counts)],
+            update_conflicts=True, unique_fields=['date'], update_fields=['present', 'absent', 'late'],
+        )
+
+
+def _date_windows(start, end, batch_days):
+    while start <= end:
+        window_end = min(start + timedelta(days=batch_days - 1), end)
+        yield start, window_end
+        start = window_end + timedelta(days=1)
+
+
+def _merged(querysets, group, totals):
+    """The grouped totals of several tables (hot and archived) added together."""
+    rows = {}
+    for queryset in querysets:
+        for row in queryset.values(*group).annotate(**totals).order_by():
+            key = tuple(row[name] for name in group)
+            if key in rows:
+                for name in totals:
+                    rows[key][name] += row[name]
+            else:
+                rows[key] = row
+    return rows.values()
+
+
+def rebuild(start, end, batch_days=31, progress=None):
+    """Recompute every rollup between ``start`` and ``end`` one window at a time."""
+    for window_start, window_end in _date_windows(start, end, batch_days):
+        orders = [model.objects.filter(order_date__range=(window_start, window_end)).exclude(status='cancelled')
+                  for model in (Order, ArchivedOrder)]
+        attendance = [model.objects.filter(date__range=(window_start, window_end))
+                      for model in (Attendance, ArchivedAttendance)]
+        totals = {'orders': Count('pk'), 'units': Sum('quantity'), 'revenue': Sum('line_total')}
+
+        with transaction.atomic():
+            DailyProductSales.objects.filter(date__range=(window_start, window_end)).delete()
+            DailyWorkerSales.objects.filter(date__range=(window_start, window_end)).delete()
+            DailyAttendance.objects.filter(date__range=(window_start, window_end)).delete()
+
+            DailyProductSales.objects.bulk_create(
+                DailyProductSales(date=row['order_date'], product_id=row['product_id'],
+                                  category=row['product__category'], orders=row['orders'],
+                                  units=row['units'], revenue=row['revenue'])
+                for row in _merged(orders, ('order_date', 'product_id', 'product__category'), totals)
+            )
+            DailyWorkerSales.objects.bulk_create(
+                DailyWorkerSales(date=row['order_date'], worker_id=row['worker_id'], orders=row['orders'],
+                                 units=row['units'], revenue=row['revenue'])
+                for row in _merged(orders, ('order_date', 'worker_id'), totals)
+            )
+            DailyAttendance.objects.bulk_create(
+                DailyAttendance(**row) for row in _merged(attendance, ('date',), ATTENDANCE_COUNTS)
+            )
+
+        if progress:
+            progress(window_start, window_end)
+
+
+def source_date_range():
+    """First and last date present in orders or attendance, or (None, None)."""
+    ranges = [model.objects.aggregate(first=Min('order_date'), last=Max('order_date'))
+              for model in (Order, ArchivedOrder)]
+    ranges += [model.objects.aggregate(first=Min('date'), last=Max('date'))
+               for model in (Attendance, ArchivedAttendance)]
+    firsts = [dates['first'] for dates in ranges if dates['first']]
+    lasts = [dates['last'] for dates in ranges if dates['last']]
+    if not firsts:
+        return None, None
+    return min(firsts), max(lasts)
+
+
+# Reporting
+def revenue_by_category(start, end):
+    return (DailyProductSales.objects.filter(date__range=(start, end))
+            .values('date', 'category').order_by('date', 'category')
+            .annotate(total_units=Sum('units'), total_revenue=Sum('revenue')))
+
+
+def units_by_worker_month(start, end):
+    # A deleted worker's rows stay behind at zero until the purge
+    return (DailyWorkerSales.objects.filter(date__range=(start, end), worker__deleted_at__isnull=True)
+            .annotate(month=TruncMonth('date'))
+            .values('month', 'worker_id', 'worker__full_name')
+            .annotate(total_units=Sum('units'), total_revenue=Sum('revenue'))
+            .order_by('month', '-total_units'))
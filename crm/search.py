@@ -0,0 +1,168 @@
+"""
+Full-text search over workers and products.
+
+On SQLite the ``crm_worker_search`` and ``crm_product_search`` FTS5 tables
+(created by migration 0006 and kept in sync by triggers, so bulk writes
+and raw SQL are covered too) answer prefix queries from an index and
+rank them with bm25. Other databases, or SQLite builds without FTS5,
+fall back to ``icontains`` filters.
+
+SQLite drops a table's triggers when a migration rebuilds the table (an
+AlterField on crm_worker or crm_product, say), so ``ensure_triggers``
+runs after every migrate, recreates any that are missing and refills
+that index.
+"""
+import re
+from functools import reduce
+from operator import and_, or_
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Worker, Product
+
+MAX_TERMS = 8
+
+SEARCH = {
+    Worker: {
+        'table': 'crm_worker_search',
+        # full_name, position, phone_number, phone_digits
+        'weights': (10.0, 2.0, 1.0, 1.0),
+        'fields': ('full_name', 'position', 'phone_number'),
+        'ordering': ('full_name', 'id'),
+    },
+    Product: {
+        'table': 'crm_product_search',
+        # name, category
+        'weights': (10.0, 2.0),
+        'fields': ('name', 'category'),
+        'ordering': ('name', 'id'),
+    },
+}
+
+PHONE_DIGITS = "replace(replace(replace(replace(replace({}, '-', ''), ' ', ''), '(', ''), ')', ''), '+', '')"
+WORKER_ROW = "{0}.id, {0}.full_name, {0}.position, {0}.phone_number, " + PHONE_DIGITS.format('{0}.phone_number')
+PRODUCT_ROW = '{0}.id, {0}.name, {0}.category'
+
+# As created by migration 0006
+TRIGGERS = {
+    'crm_worker_search': {
+        'crm_worker_search_insert': f"""CREATE TRIGGER crm_worker_search_insert AFTER INSERT ON crm_worker BEGIN
+            INSERT INTO crm_worker_search (rowid, full_name, position, phone_number, phone_digits)
+            VALUES ({WORKER_ROW.format('new')});
+        END""",
+        'crm_worker_search_update': f"""CREATE TRIGGER crm_worker_search_update AFTER UPDATE ON crm_worker BEGIN
+            DELETE FROM crm_worker_search WHERE rowid = old.id;
+            INSERT INTO crm_worker_search (rowid, full_name, position, phone_number, phone_digits)
+            VALUES ({WORKER_ROW.format('new')});
+        END""",
+        'crm_worker_search_delete': """CREATE TRIGGER crm_worker_search_delete AFTER DELETE ON crm_worker BEGIN
+            DELETE FROM crm_worker_search WHERE rowid = old.id;
+        END""",
+    },
+    'crm_product_search': {
+        'crm_product_search_insert': f"""CREATE TRIGGER crm_product_search_insert AFTER INSERT ON crm_product BEGIN
+            INSERT INTO crm_product_search (rowid, name, category) VALUES ({PRODUCT_ROW.format('new')});
+        END""",
+        'crm_product_search_update': f"""CREATE TRIGGER crm_product_search_update AFTER UPDATE OF name, category ON crm_product BEGIN
+            DELETE FROM crm_product_search WHERE rowid = old.id;
+            INSERT INTO crm_product_search (rowid, name, category) VALUES ({PRODUCT_ROW.format('new')});
+        END""",
+        'crm_product_search_delete': """CREATE TRIGGER crm_product_search_delete AFTER DELETE ON crm_product BEGIN
+            DELETE FROM crm_product_search WHERE rowid = old.id;
+        END""",
+    },
+}
+
+REFILL = {
+    'crm_worker_search': f"""INSERT INTO crm_worker_search (rowid, full_name, position, phone_number, phone_digits)
+        SELECT {WORKER_ROW.format('crm_worker')} FROM crm_worker""",
+    'crm_product_search': f"""INSERT INTO crm_product_search (rowid, name, category)
+        SELECT {PRODUCT_ROW.format('crm_product')} FROM crm_product""",
+}
+
+_tables = {}
+
+
+def has_index(table):
+    key = (connection.alias, connection.settings_dict['NAME'], table)
+    if key not in _tables:
+        _tables[key] = connection.vendor == 'sqlite' and table in connection.introspection.table_names()
+    return _tables[key]
+
+
+def terms(text):
+    return re.findall(r'\w+', (text or '').lower())[:MAX_TERMS]
+
+
+def match_expression(text):
+    """Every term as a quoted prefix query, e.g. ``"ann"* "pack"*``."""
+    return ' '.join(f'"{term}"*' for term in terms(text)) or None
+
+
+def filter_queryset(queryset, text):
+    """Narrow ``queryset`` to rows matching every term of ``text``, keeping its ordering."""
+    config = SEARCH[queryset.model]
+    query = match_expression(text)
+    if query is None:
+        return queryset
+
+    table = config['table']
+    if has_index(table):
+        return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [query]))
+
+    return queryset.filter(reduce(and_, (
+        reduce(or_, (Q(**{f'{field}__icontains': term}) for field in config['fields']))
+        for term in terms(text)
+    )))
+
+
+def ranked(model, text, limit=10):
+    """Up to ``limit`` objects matching ``text``, best match first."""
+    config = SEARCH[model]
+    query = match_expression(text)
+    if query is None:
+        return []
+
+    table = config['table']
+    if not has_index(table):
+        return list(filter_queryset(model.objects.all(), text).order_by(*config['ordering'])[:limit])
+
+    weights = ', '.join(str(weight) for weight in config['weights'])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {table} WHERE {table} MATCH %s ORDER BY bm25({table}, {weights}) LIMIT %s',
+            [query, limit],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+
+    objects = model.objects.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+def ensure_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Recreate missing sync triggers and refill their index (a post_migrate
+    receiver). Returns the search tables that were repaired.
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return []
+
+    repaired = []
+    with transaction.atomic(using=using), db.cursor() as cursor:
+        tables = set(db.introspection.table_names(cursor))
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        existing = {row[0] for row in cursor.fetchall()}
+        for table, triggers in TRIGGERS.items():
+            missing = [name for name in triggers if name not in existing]
+            if table not in tables or not missing:
+                continue
+            for name in missing:
+                cursor.execute(triggers[name])
+            # Writes made while a trigger was gone never reached the index
+            cursor.execute(f'DELETE FROM {table}')
+            cursor.execute(REFILL[table])
+            repaired.append(table)
+    return repaired
@@ -0,0 +1,146 @@
+"""
+Reproducible synthetic data at realistic scale.
+
+The same ``random_seed`` and ``end_date`` always produce the same rows.
+Everything is written with batched bulk_create, one transaction per
+batch, after the CRM tables have been emptied.
+"""
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+
+from . import alerts, ledger
+from .models import (
+    Worker, Product, Order, Attendance, DailyProductSales, DailyWorkerSales, DailyAttendance, StockAlert,
+    StockMovement, StockSnapshot, ArchivedOrder, ArchivedAttendance,
+)
+from .caching import invalidate
+from .rollups import rebuild
+
+FIRST_NAMES = ['John', 'Sarah', 'Michael', 'Emily', 'David', 'Aziza', 'Bekzod', 'Dilnoza', 'Jasur', 'Malika',
+               'Olga', 'Timur', 'Nodira', 'Sardor', 'Anna', 'Rustam', 'Laylo', 'Ivan', 'Kamola', 'Farrukh']
+LAST_NAMES = ['Smith', 'Johnson', 'Brown', 'Davis', 'Wilson', 'Karimov', 'Rashidova', 'Yusupov', 'Petrova',
+              'Aliyev', 'Tursunova', 'Ivanov', 'Nazarova', 'Saidov', 'Ergasheva']
+POSITIONS = ['manager', 'supervisor', 'worker', 'quality control', 'packer']
+POSITION_WEIGHTS = [1, 3, 20, 3, 6]
+PRODUCT_WORDS = {
+    'shirts': ['T-Shirt', 'Polo', 'Oxford Shirt', 'Henley', 'Flannel Shirt'],
+    'pants': ['Jeans', 'Chinos', 'Cargo Pants', 'Joggers', 'Trousers'],
+    'dresses': ['Summer Dress', 'Maxi Dress', 'Shift Dress', 'Wrap Dress'],
+    'jackets': ['Leather Jacket', 'Bomber', 'Parka', 'Denim Jacket'],
+    'accessories': ['Socks (3-pack)', 'Belt', 'Scarf', 'Cap', 'Gloves'],
+}
+COLOURS = ['Black', 'White', 'Navy', 'Grey', 'Olive', 'Red', 'Beige', 'Blue']
+ORDER_STATUSES = ['completed', 'pending', 'cancelled']
+ORDER_STATUS_WEIGHTS = [80, 15, 5]
+ATTENDANCE_STATUSES = ['present', 'late', 'absent']
+ATTENDANCE_WEIGHTS = [90, 6, 4]
+
+
+def clear_tables():
+    # Plain DELETEs: collecting millions of rows for cascades and signals is far slower
+    with connection.cursor() as cursor:
+        for model in (DailyProductSales, DailyWorkerSales, DailyAttendance, StockAlert, StockSnapshot, StockMovement,
+                      ArchivedOrder, ArchivedAttendance, Attendance, Order, Worker, Product):
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+
+
+def _write(model, rows, batch_size):
+    with transaction.atomic():
+        model.objects.bulk_create(rows, batch_size=batch_size)
+
+
+def _chunks(total, size):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+def seed(workers, products, orders, days, end_date, random_seed=1, batch_size=5000, progress=None):
+    """Replace the CRM data with synthetic rows and return ``{name: (count, seconds)}``."""
+    rng = random.Random(random_seed)
+    report = progress or (lambda message: None)
+    start_date = end_date - timedelta(days=max(days, 1) - 1)
+    timings = {}
+
+    clear_tables()
+
+    started = time.monotonic()
+    for offset, size in _chunks(workers, batch_size):
+        _write(Worker, [
+            Worker(
+                full_name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                position=rng.choices(POSITIONS, POSITION_WEIGHTS)[0],
+                phone_number=f'555-{offset + i:07d}',
+                join_date=start_date - timedelta(days=rng.randint(0, 2000)),
+            )
+            for i in range(size)
+        ], batch_size)
+    timings['workers'] = (workers, time.monotonic() - started)
+
+    started = time.monotonic()
+    categories = list(PRODUCT_WORDS)
+    for offset, size in _chunks(products, batch_size):
+        rows = []
+        for i in range(size):
+            category = rng.choice(categories)
+            rows.append(Product(
+                name=f'{rng.choice(COLOURS)} {rng.choice(PRODUCT_WORDS[category])} #{offset + i + 1}',
+                category=category,
+                price=Decimal(rng.randint(499, 19999)) / 100,
+                stock=rng.randint(0, 500),
+            ))
+        _write(Product, rows, batch_size)
+    ledger.reconcile()
+    alerts.check()
+    timings['products'] = (products, time.monotonic() - started)
+
+    worker_ids = list(Worker.objects.order_by('pk').values_list('pk', flat=True))
+    prices = dict(Product.objects.order_by('pk').values_list('pk', 'price'))
+    product_ids = list(prices)
+
+    started = time.monotonic()
+    if worker_ids and product_ids:
+        for offset, size in _chunks(orders, batch_size):
+            rows = []
+            for i in range(size):
+                order = Order(
+                    worker_id=rng.choice(worker_ids),
+                    product_id=rng.choice(product_ids),
+                    quantity=rng.randint(1, 20),
+                    order_date=start_date + timedelta(days=rng.randrange(days or 1)),
+                    status=rng.choices(ORDER_STATUSES, ORDER_STATUS_WEIGHTS)[0],
+                )
+                order.set_prices(prices[order.product_id])
+                rows.append(order)
+            _write(Order, rows, batch_size)
+            report(f'orders: {offset + size}/{orders}')
+        timings['orders'] = (orders, time.monotonic() - started)
+    else:
+        timings['orders'] = (0, 0)
+
+    started = time.monotonic()
+    attendance, batch = 0, []
+    for day_offset in range(days):
+        day = start_date + timedelta(days=day_offset)
+        for worker_id in worker_ids:
+            batch.append(Attendance(
+                worker_id=worker_id, date=day, status=rng.choices(ATTENDANCE_STATUSES, ATTENDANCE_WEIGHTS)[0],
+            ))
+            if len(batch) >= batch_size:
+                _write(Attendance, batch, batch_size)
+                attendance += len(batch)
+                batch = []
+        report(f'attendance: {day}')
+    _write(Attendance, batch, batch_size)
+    attendance += len(batch)
+    timings['attendance records'] = (attendance, time.monotonic() - started)
+
+    started = time.monotonic()
+    rebuild(start_date, end_date, progress=lambda first, last: report(f'rollups: {first} - {last}'))
+    timings['days of rollups'] = (max(days, 1), time.monotonic() - started)
+
+    invalidate()
+    return timings
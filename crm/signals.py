@@ -0,0 +1,90 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import alerts, ledger, rollups
+from .caching import invalidate
+from .database import configure_connection
+from .models import Worker, Product, Order, Attendance, CategoryReorderLevel
+
+
+connection_created.connect(configure_connection, dispatch_uid='crm.configure_connection')
+
+
+@receiver([post_save, post_delete], sender=Worker)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Order)
+@receiver([post_save, post_delete], sender=Attendance)
+def refresh_dashboard(sender, **kwargs):
+    invalidate(sender)
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_contribution(sender, instance, raw=False, **kwargs):
+    # What the stored row contributed, so post_save can take it back out
+    instance._rollup_previous = None
+    if instance.pk and not raw:
+        previous = Order.objects.select_related('product').filter(pk=instance.pk).first()
+        if previous:
+            instance._rollup_previous = rollups.order_contribution(previous)
+
+
+@receiver(post_save, sender=Order)
+def update_order_rollups(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    rollups.apply(getattr(instance, '_rollup_previous', None), -1)
+    rollups.apply(rollups.order_contribution(instance), 1)
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_from_rollups(sender, instance, **kwargs):
+    rollups.apply(rollups.order_contribution(instance), -1)
+
+
+@receiver([post_save, post_delete], sender=Attendance)
+def update_attendance_rollup(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rollups.refresh_attendance(rollups.to_date(instance.date))
+
+
+@receiver(pre_save, sender=Product)
+def remember_stock(sender, instance, raw=False, **kwargs):
+    instance._ledger_previous_stock = 0
+    instance._rollup_previous_category = None
+    if instance.pk and not raw:
+        stock, category = (
+            Product.objects.filter(pk=instance.pk).values_list('stock', 'category').first() or (0, None)
+        )
+        instance._ledger_previous_stock, instance._rollup_previous_category = stock, category
+
+
+@receiver(post_save, sender=Product)
+def record_stock_edit(sender, instance, created, raw=False, **kwargs):
+    # Stock typed into a form or the admin; orders go through crm.stock
+    if not raw:
+        change = instance.stock - getattr(instance, '_ledger_previous_stock', 0)
+        ledger.record({instance.pk: change}, 'opening' if created else 'adjustment')
+
+
+@receiver(post_save, sender=Product)
+def move_category_rollups(sender, instance, created, raw=False, **kwargs):
+    # Sales by category read the category stored on each product day
+    previous = getattr(instance, '_rollup_previous_category', None)
+    if not raw and not created and previous and previous != instance.category:
+        rollups.recategorize([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def check_stock_alert(sender, instance, raw=False, **kwargs):
+    # Stock or reorder level edited through a form or the admin
+    if not raw:
+        alerts.check([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=CategoryReorderLevel)
+def check_category_stock_alerts(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    alerts.check(Product.objects.filter(category=instance.category).values_list('pk', flat=True))
+    invalidate(Product)
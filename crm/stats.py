@@ -0,0 +1,136 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from .alerts import open_alerts
+from .caching import DASHBOARD_GENERATION_KEY, start_counter
+from .models import Worker, Product, Order, Attendance
+
+DASHBOARD_CACHE_KEY = 'crm:dashboard:snapshot'
+# Open stock alerts shown on the dashboard; the rest are on the alerts page
+DASHBOARD_ALERTS = 10
+
+
+def _compiled(queryset):
+    return queryset.order_by().query.sql_with_params()
+
+
+def dashboard_counts(day):
+    """
+    Return the dashboard totals and the attendance breakdown for ``day``
+    from a single SELECT.
+
+    The table counts are scalar subqueries compiled from the default
+    managers, and the attendance statuses are folded into conditional
+    aggregates over that day's rows.
+    """
+    statuses = [value for value, label in Attendance.STATUS_CHOICES]
+
+    columns, params = [], []
+    for model in (Worker, Product, Order):
+        sql, sub_params = _compiled(model.objects.values('pk'))
+        columns.append(f'(SELECT COUNT(*) FROM ({sql}) AS counted)')
+        params.extend(sub_params)
+
+    for status in statuses:
+        columns.append('COUNT(CASE WHEN day.status = %s THEN 1 END)')
+        params.append(status)
+
+    attendance_sql, attendance_params = _compiled(Attendance.objects.filter(date=day).values('status'))
+    params.extend(attendance_params)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(columns)} FROM ({attendance_sql}) AS day", params)
+        row = cursor.fetchone()
+
+    return {
+        'total_workers': row[0],
+        'total_products': row[1],
+        'total_orders': row[2],
+        'attendance_summary': dict(zip(statuses, row[3:])),
+    }
+
+
+def _recent_orders():
+    return Order.objects.select_related('worker', 'product').order_by('-order_date')[:5]
+
+
+def _stock_alerts():
+    return open_alerts().select_related('product').order_by('stock', 'id')[:DASHBOARD_ALERTS]
+
+
+def build_dashboard_snapshot(day):
+    snapshot = dashboard_counts(day)
+    snapshot['recent_orders'] = list(_recent_orders())
+    snapshot['stock_alerts'] = list(_stock_alerts())
+    return snapshot
+
+
+async def abuild_dashboard_snapshot(day):
+    """build_dashboard_snapshot, awaited; the three queries still run in turn on the connection's thread."""
+    async def fetch(queryset):
+        return [obj async for obj in queryset]
+
+    snapshot, recent_orders, stock_alerts = await asyncio.gather(
+        sync_to_async(dashboard_counts)(day), fetch(_recent_orders()), fetch(_stock_alerts()),
+    )
+    snapshot['recent_orders'] = recent_orders
+    snapshot['stock_alerts'] = stock_alerts
+    return snapshot
+
+
+def _cached_snapshot(cached, today):
+    """The current generation and, if it is still valid, the cached snapshot."""
+    generation = cached.get(DASHBOARD_GENERATION_KEY)
+    entry = cached.get(DASHBOARD_CACHE_KEY)
+    if generation is None:
+        return start_counter(DASHBOARD_GENERATION_KEY), None
+    if entry and entry['date'] == today and entry['generation'] == generation:
+        return generation, entry['snapshot']
+    return generation, None
+
+
+def get_dashboard_snapshot():
+    """
+    Serve the dashboard from the cache until a write invalidates it.
+
+    Snapshots are tagged with the generation they were built from, so a
+    write that lands while a snapshot is being built is never masked.
+    """
+    today = timezone.now().date()
+    if not settings.CRM_DASHBOARD_CACHE_TIMEOUT:
+        return build_dashboard_snapshot(today)
+    generation, snapshot = _cached_snapshot(cache.get_many([DASHBOARD_CACHE_KEY, DASHBOARD_GENERATION_KEY]), today)
+    if snapshot is not None:
+        return snapshot
+
+    snapshot = build_dashboard_snapshot(today)
+    cache.set(
+        DASHBOARD_CACHE_KEY,
+        {'date': today, 'generation': generation, 'snapshot': snapshot},
+        settings.CRM_DASHBOARD_CACHE_TIMEOUT,
+    )
+    return snapshot
+
+
+async def aget_dashboard_snapshot():
+    today = timezone.now().date()
+    if not settings.CRM_DASHBOARD_CACHE_TIMEOUT:
+        return await abuild_dashboard_snapshot(today)
+    cached = await cache.aget_many([DASHBOARD_CACHE_KEY, DASHBOARD_GENERATION_KEY])
+    generation, snapshot = await sync_to_async(_cached_snapshot)(cached, today)
+    if snapshot is not None:
+        return snapshot
+
+    snapshot = await abuild_dashboard_snapshot(today)
+    await cache.aset(
+        DASHBOARD_CACHE_KEY,
+        {'date': today, 'generation': generation, 'snapshot': snapshot},
+        settings.CRM_DASHBOARD_CACHE_TIMEOUT,
+    )
+    return snapshot
+
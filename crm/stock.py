@@ -0,0 +1,109 @@
+"""
+Stock bookkeeping for orders.
+
+Every change is a single guarded ``UPDATE`` evaluated by the database
+(``SET stock = stock - n WHERE id = ... AND stock >= n``), so concurrent
+order entry can neither lose an update nor drive stock below zero.
+Each change also writes its StockMovement rows (see crm.ledger) and
+refreshes the low-stock alerts of the products it touched (see
+crm.alerts), in the same transaction.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from . import alerts, ledger
+from .caching import invalidate
+from .models import Product
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, requested, available):
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+        super().__init__(
+            f'Not enough stock for product {product_id}: requested {requested}, available {available}.'
+        )
+
+
+def _stock_changed():
+    # Queryset updates send no post_save
+    invalidate(Product)
+
+
+# all_objects: orders of a soft-deleted product still hand stock back until the purge
+def _available(product_id):
+    return Product.all_objects.filter(pk=product_id).values_list('stock', flat=True).first() or 0
+
+
+def _take(product_id, quantity):
+    updated = Product.all_objects.filter(pk=product_id, stock__gte=quantity).update(stock=F('stock') - quantity)
+    if not updated:
+        raise InsufficientStock(product_id, quantity, _available(product_id))
+
+
+def _give(product_id, quantity):
+    Product.all_objects.filter(pk=product_id).update(stock=F('stock') + quantity)
+
+
+def reserve(product_id, quantity, reason='order'):
+    reserve_many([(product_id, quantity)], reason)
+
+
+def release(product_id, quantity, reason='order_release'):
+    release_many([(product_id, quantity)], reason)
+
+
+def reserve_many(lines, reason='order'):
+    """
+    Reserve every ``(product_id, quantity)`` line or none of them.
+
+    Lines for the same product are merged, and products are updated in
+    id order so concurrent multi-line reservations lock rows in a
+    consistent order.
+    """
+    totals = defaultdict(int)
+    for product_id, quantity in lines:
+        totals[product_id] += quantity
+
+    with transaction.atomic():
+        for product_id in sorted(totals):
+            if totals[product_id] > 0:
+                _take(product_id, totals[product_id])
+        ledger.record({product_id: -quantity for product_id, quantity in totals.items()}, reason)
+        alerts.check(totals)
+        transaction.on_commit(_stock_changed)
+
+
+def release_many(lines, reason='order_release'):
+    totals = defaultdict(int)
+    for product_id, quantity in lines:
+        totals[product_id] += quantity
+
+    with transaction.atomic():
+        for product_id in sorted(totals):
+            if totals[product_id] > 0:
+                _give(product_id, totals[product_id])
+        ledger.record({product_id: quantity for product_id, quantity in totals.items()}, reason)
+        alerts.check(totals)
+        transaction.on_commit(_stock_changed)
+
+
+def rebook(old_product_id, old_quantity, new_product_id, new_quantity):
+    """Move an existing reservation to a new product and/or quantity."""
+    with transaction.atomic():
+        if old_product_id == new_product_id:
+            difference = new_quantity - old_quantity
+            if difference > 0:
+                _take(new_product_id, difference)
+            elif difference < 0:
+                _give(new_product_id, -difference)
+            ledger.record({new_product_id: -difference}, 'order_change')
+        else:
+            _give(old_product_id, old_quantity)
+            _take(new_product_id, new_quantity)
+            ledger.record({old_product_id: old_quantity, new_product_id: -new_quantity}, 'order_change')
+        alerts.check({old_product_id, new_product_id})
+        transaction.on_commit(_stock_changed)
@@ -0,0 +1,319 @@
+"""
+Background tasks backed by the crm_task table.
+
+Views call ``enqueue(name, user=..., **kwargs)`` and poll the Task row;
+``manage.py run_worker`` runs ``Worker``, a pool of threads that claim
+due tasks and run the function registered under their name with
+``@task``. No broker is involved, so it runs wherever the database does.
+
+* A task is claimed with a conditional ``UPDATE ... WHERE status =
+  'queued'``, so any number of worker threads or processes can share
+  the queue without running a task twice.
+* Task functions take a ``progress(percent, message)`` callback first,
+  then their keyword arguments, and return a JSON-serialisable result.
+* A failed attempt is retried ``max_attempts`` times in all, each retry
+  waiting twice as long as the one before (``CRM_TASK_RETRY_DELAY``);
+  the exception types a task lists as ``permanent`` fail it at once.
+* Workers record a heartbeat for their running tasks; a task whose
+  heartbeat is older than ``CRM_TASK_STALE_AFTER`` seconds (its worker
+  died) is queued again, or failed once it is out of attempts.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .deletion import MODELS, hide, purge
+from .exports import UnknownExport, get_queryset, iter_csv, iter_rows, write_xlsx
+from .importers import import_file
+from .ledger import take_snapshots
+from .models import Task
+from .rollups import rebuild, source_date_range
+
+logger = logging.getLogger('crm.tasks')
+
+REGISTRY = {}
+
+
+class UnknownTask(Exception):
+    pass
+
+
+def task(name, max_attempts=None, permanent=()):
+    """Register the decorated function as the task ``name``; ``permanent`` errors are not retried."""
+    def register(func):
+        REGISTRY[name] = {'func': func, 'max_attempts': max_attempts, 'permanent': permanent}
+        return func
+
+    return register
+
+
+def enqueue(name, /, user=None, **kwargs):
+    if name not in REGISTRY:
+        raise UnknownTask(name)
+    return Task.objects.create(
+        name=name,
+        kwargs=kwargs,
+        max_attempts=REGISTRY[name]['max_attempts'] or settings.CRM_TASK_MAX_ATTEMPTS,
+        created_by=user,
+    )
+
+
+def _update(task_id, **fields):
+    # Bookkeeping writes retry briefly when SQLite reports the database as locked
+    for attempt in range(5):
+        try:
+            return Task.objects.filter(pk=task_id).update(**fields)
+        except OperationalError:
+            if attempt == 4:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+
+class Progress:
+    """The callback handed to task functions; writes are throttled to one per second."""
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.last_write = 0
+
+    def __call__(self, percent, message=''):
+        now = time.monotonic()
+        if now - self.last_write < 1 and percent < 100:
+            return
+        self.last_write = now
+        _update(
+            self.task_id, progress=max(0, min(int(percent), 100)), message=message[:200], heartbeat_at=timezone.now(),
+        )
+
+
+def claim(worker_name):
+    """Mark the oldest due task as running for ``worker_name`` and return it, or None."""
+    for _ in range(5):
+        now = timezone.now()
+        candidate = (Task.objects.filter(status='queued', run_after__lte=now)
+                     .order_by('run_after', 'id').values_list('pk', flat=True).first())
+        if candidate is None:
+            return None
+        claimed = Task.objects.filter(pk=candidate, status='queued').update(
+            status='running', worker=worker_name, attempts=F('attempts') + 1,
+            started_at=now, heartbeat_at=now, progress=0, message='',
+        )
+        if claimed:
+            return Task.objects.get(pk=candidate)
+        # Another worker got there first
+    return None
+
+
+def run(task):
+    """Run a claimed task and record the outcome."""
+    spec = REGISTRY.get(task.name)
+    try:
+        if spec is None:
+            raise UnknownTask(task.name)
+        result = spec['func'](Progress(task.pk), **task.kwargs)
+    except Exception as e:
+        error = traceback.format_exc()
+        logger.info('Task %s #%s failed (attempt %s of %s)', task.name, task.pk, task.attempts, task.max_attempts)
+        now = timezone.now()
+        if spec is not None and task.attempts < task.max_attempts and not isinstance(e, spec['permanent']):
+            delay = settings.CRM_TASK_RETRY_DELAY * 2 ** (task.attempts - 1)
+            _update(task.pk, status='queued', run_after=now + timedelta(seconds=delay), error=error, worker='')
+        else:
+            _update(task.pk, status='failed', error=error, finished_at=now)
+        return False
+
+    _update(task.pk, status='succeeded', progress=100, result=result, error='', finished_at=timezone.now())
+    return True
+
+
+def requeue_stale(stale_after=None):
+    """Queue again (or fail) running tasks whose worker stopped sending heartbeats."""
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=stale_after or settings.CRM_TASK_STALE_AFTER)
+    stale = Task.objects.filter(status='running', heartbeat_at__lt=cutoff)
+    requeued = stale.filter(attempts__lt=F('max_attempts')).update(
+        status='queued', run_after=now, worker='', error='Worker stopped responding.',
+    )
+    failed = stale.update(status='failed', finished_at=now, error='Worker stopped responding.')
+    return requeued, failed
+
+
+class Worker:
+    def __init__(self, threads=1, poll_interval=1.0, name=None, log=None):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.log = log or (lambda message: None)
+        self.stopping = threading.Event()
+        self.running = set()
+        self.lock = threading.Lock()
+
+    def stop(self):
+        self.stopping.set()
+
+    def work(self, burst):
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                try:
+                    task = claim(self.name)
+                except OperationalError as e:
+                    # "database is locked" under write contention; try again shortly
+                    logger.info('Worker %s could not claim a task: %s', self.name, e)
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                if task is None:
+                    if burst:
+                        return
+                    self.stopping.wait(self.poll_interval)
+                    continue
+
+                self.log(f'{task.name} #{task.pk} started (attempt {task.attempts})')
+                with self.lock:
+                    self.running.add(task.pk)
+                try:
+                    succeeded = run(task)
+                finally:
+                    with self.lock:
+                        self.running.discard(task.pk)
+                self.log(f'{task.name} #{task.pk} {"succeeded" if succeeded else "failed"}')
+        finally:
+            close_old_connections()
+
+    def heartbeat(self):
+        with self.lock:
+            running = list(self.running)
+        if running:
+            Task.objects.filter(pk__in=running, status='running').update(heartbeat_at=timezone.now())
+        requeue_stale()
+
+    def run(self, burst=False):
+        """Work until stopped, or with ``burst`` until the queue is empty."""
+        pool = [threading.Thread(target=self.work, args=(burst,), name=f'crm-worker-{i}', daemon=True)
+                for i in range(self.threads)]
+        for thread in pool:
+            thread.start()
+        last_beat = 0
+        try:
+            while not self.stopping.is_set() and any(thread.is_alive() for thread in pool):
+                if time.monotonic() - last_beat >= settings.CRM_TASK_HEARTBEAT_INTERVAL:
+                    try:
+                        self.heartbeat()
+                        last_beat = time.monotonic()
+                    except OperationalError as e:
+                        logger.info('Worker %s missed a heartbeat: %s', self.name, e)
+                self.stopping.wait(min(self.poll_interval, settings.CRM_TASK_HEARTBEAT_INTERVAL))
+        except KeyboardInterrupt:
+            self.stop()
+        finally:
+            # Running tasks finish; idle threads notice the stop flag
+            self.stopping.set()
+            for thread in pool:
+                thread.join()
+            close_old_connections()
+
+
+# Registered tasks
+def task_file(filename):
+    os.makedirs(settings.CRM_TASK_FILES_DIR, exist_ok=True)
+    return os.path.join(settings.CRM_TASK_FILES_DIR, filename)
+
+
+# A missing openpyxl, an unknown export or a bad date fails the same way on every attempt
+@task('export', permanent=(RuntimeError, ValueError, UnknownExport))
+def export(progress, name, format='csv', start=None, end=None, status=None):
+    """Write an export to CRM_TASK_FILES_DIR; the result names the file."""
+    start, end = parse_date(start) if start else None, parse_date(end) if end else None
+    total = get_queryset(name, start=start, end=end, status=status).count()
+    filename = f'{name}-{timezone.now().date()}-{uuid.uuid4().hex[:8]}.{format}'
+
+    def counted(rows):
+        for number, row in enumerate(rows):
+            if number % 1000 == 0:
+                progress(100 * number / (total or 1), f'{number} of {total} rows')
+            yield row
+
+    rows = counted(iter_rows(name, start=start, end=end, status=status))
+    if format == 'xlsx':
+        write_xlsx(rows, task_file(filename))
+    else:
+        with open(task_file(filename), 'w', newline='') as target:
+            target.writelines(iter_csv(rows))
+    return {'file': filename, 'rows': total}
+
+
+@task('rebuild_rollups')
+def rebuild_rollups(progress, start=None, end=None, batch_days=31):
+    first, last = source_date_range()
+    start = parse_date(start) if start else first
+    end = parse_date(end) if end else last
+    if start is None or end is None:
+        return {'days': 0}
+
+    days = (end - start).days + 1
+
+    def report(window_start, window_end):
+        progress(100 * ((window_end - start).days + 1) / days, f'Rebuilt up to {window_end}')
+
+    rebuild(start, end, batch_days=batch_days, progress=report)
+    return {'start': str(start), 'end': str(end), 'days': days}
+
+
+@task('snapshot_stock')
+def snapshot_stock(progress):
+    return {'snapshots': take_snapshots()}
+
+
+@task('hide_deleted')
+def hide_deleted(progress, model, pk):
+    """Hide the orders and attendance of a soft-deleted worker or product (CRM_PURGE_DELETED off)."""
+    obj = MODELS[model].all_objects.filter(pk=pk, deleted_at__isnull=False).first()
+    if obj is None:
+        return {'hidden': 0}
+
+    def report(hidden, total):
+        progress(100 * hidden / (total or 1), f'{hidden} of {total} rows hidden')
+
+    return {'hidden': hide(obj, progress=report)}
+
+
+@task('purge_deleted')
+def purge_deleted(progress, model, pk):
+    """Remove a soft-deleted worker or product and everything that depends on it."""
+    obj = MODELS[model].all_objects.filter(pk=pk, deleted_at__isnull=False).first()
+    if obj is None:
+        return {'deleted': 0}
+
+    def report(deleted, total):
+        progress(100 * deleted / (total or 1), f'{deleted} of {total} rows deleted')
+
+    return {'deleted': purge(obj, progress=report)}
+
+
+# Order imports are not idempotent, so a failed import is not retried
+@task('import_data', max_attempts=1)
+def import_data(progress, kind, path, remove=True):
+    progress(0, f'Importing {kind}')
+    try:
+        result = import_file(kind, path)
+    finally:
+        if remove and os.path.exists(path):
+            os.remove(path)
+    return {
+        'created': result.created,
+        'updated': result.updated,
+        'skipped': result.skipped,
+        'errors': result.errors[:20],
+        'seconds': round(result.seconds, 2),
+    }
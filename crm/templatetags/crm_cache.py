@@ -0,0 +1,54 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from crm.caching import record, tracked_names
+
+register = template.Library()
+
+
+class CachedFragmentNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        if not settings.CRM_FRAGMENT_CACHE_TIMEOUT:
+            return self.nodelist.render(context)
+
+        key = make_template_fragment_key(self.name, [var.resolve(context) for var in self.vary_on])
+        value = cache.get(key)
+        if value is not None:
+            record(self.name, 'hit')
+            return value
+
+        record(self.name, 'miss')
+        value = self.nodelist.render(context)
+        cache.set(key, value, settings.CRM_FRAGMENT_CACHE_TIMEOUT)
+        return value
+
+
+@register.tag
+def cachedfragment(parser, token):
+    """
+    Cache the enclosed template under a name and the values it varies on::
+
+        {% cachedfragment 'product_table' cache_versions request.get_full_path %}
+            ...
+        {% endcachedfragment %}
+
+    Pass ``cache_versions`` (from crm.caching.version_key) so writes
+    to the models shown make old copies unreachable. Hits and misses
+    are counted for the cache diagnostics page.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f'{bits[0]} needs a fragment name')
+
+    name = bits[1].strip('\'"')
+    nodelist = parser.parse(('endcachedfragment',))
+    parser.delete_first_token()
+    tracked_names.add(name)
+    return CachedFragmentNode(nodelist, name, [parser.compile_filter(bit) for bit in bits[2:]])
@@ -1,3 +1,1653 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.models import ADDITION, LogEntry
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.core.management import CommandError, call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection, OperationalError
+from django.db.backends.signals import connection_created
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+from . import alerts, async_views, caching, checks, deletion, exports, ledger, rollups, search, stock, tasks
+from .attendance import record_attendance, record_day
+from .database import apply_pragmas
+from .instrumentation import view_stats
+from .models import (
+    Worker, Product, Order, Attendance, CategoryReorderLevel, DailyProductSales, DailyWorkerSales,
+    DailyAttendance, StockAlert, StockMovement, StockSnapshot, Task, ArchivedOrder, ArchivedAttendance,
+)
+from .orders import change_status
+from .pagination import KeysetPaginator
+from .stats import dashboard_counts, get_dashboard_snapshot
+
+
+def make_worker(name='Worker', position='worker'):
+    return Worker.objects.create(
+        full_name=name, position=position, phone_number='555-000-0000', join_date=date(2024, 1, 1)
+    )
+
+
+def make_product(name='Product', stock=100, price='10.00', category='shirts'):
+    return Product.objects.create(name=name, category=category, price=price, stock=stock)
+
+
+def attendance_writes(queries):
+    return [q['sql'] for q in queries if re.match(r'INSERT INTO "?crm_attendance"? ', q['sql'])]
+
+
+def rollup_rows():
+    return (
+        list(DailyProductSales.objects.order_by('date', 'product_id')
+             .values_list('date', 'product_id', 'category', 'orders', 'units', 'revenue')),
+        list(DailyWorkerSales.objects.order_by('date', 'worker_id')
+             .values_list('date', 'worker_id', 'orders', 'units', 'revenue')),
+        list(DailyAttendance.objects.order_by('date').values_list('date', 'present', 'absent', 'late')),
+    )
+
+
+class LoggedInTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_login(self.user)
+
+
+class KeysetPaginationTests(LoggedInTestCase):
+    def test_walks_orders_forward_and_back_without_gaps(self):
+        worker = make_worker()
+        product = make_product()
+        start = date(2024, 1, 1)
+        # Several orders share a date so the id tie-breaker matters
+        for i in range(23):
+            Order.objects.create(worker=worker, product=product, quantity=1, order_date=start + timedelta(days=i // 3))
+
+        expected = list(Order.objects.order_by('-order_date', '-id').values_list('id', flat=True))
+        paginator = KeysetPaginator(Order.objects.all(), ('-order_date', '-id'), per_page=5)
+
+        seen, pages, page = [], [], paginator.get_page()
+        while True:
+            pages.append(page)
+            seen.extend(order.id for order in page)
+            if not page.has_next():
+                break
+            page = paginator.get_page(after=page.next_cursor)
+        self.assertEqual(seen, expected)
+
+        back = paginator.get_page(before=pages[-1].previous_cursor)
+        self.assertEqual([o.id for o in back], [o.id for o in pages[-2]])
+        self.assertFalse(pages[0].has_previous())
+
+    def test_list_views_render_next_link_and_ignore_bad_cursor(self):
+        for i in range(30):
+            make_product(name=f'Product {i:02d}')
+
+        response = self.client.get(reverse('product_list'))
+        self.assertEqual(len(response.context['products']), 25)
+        self.assertContains(response, '?after=')
+
+        response = self.client.get(reverse('product_list'), {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['products'].object_list[0].name, 'Product 00')
+
+    def test_worker_list_keeps_search_filters_in_links(self):
+        for i in range(30):
+            make_worker(name=f'Anna {i:02d}', position='packer')
+
+        response = self.client.get(reverse('worker_list'), {'position': 'packer'})
+        self.assertIn('position=packer', response.context['workers'].next_query)
+
+
+class QueryBudgetTests(LoggedInTestCase):
+    """Every page must run the same number of queries for N and 10N rows."""
+
+    def setUp(self):
+        super().setUp()
+        self.user.is_superuser = True
+        self.user.save()
+        self.today = date.today()
+        self.worker = make_worker(name='Budget Worker')
+        self.product = make_product(name='Budget Product')
+        self.order = Order.objects.create(worker=self.worker, product=self.product, quantity=1)
+        Attendance.objects.create(worker=self.worker, date=self.today, status='present')
+        self.seeded = 1
+
+    def seed(self, total):
+        # Spread rows over fresh workers and products so every FK is distinct
+        for i in range(self.seeded, total):
+            worker = make_worker(name=f'Worker {i:03d}')
+            product = make_product(name=f'Product {i:03d}', stock=5)
+            Order.objects.create(worker=worker, product=product, quantity=1)
+            Order.objects.create(worker=self.worker, product=self.product, quantity=1)
+            Attendance.objects.create(worker=worker, date=self.today, status='late')
+            Attendance.objects.create(worker=self.worker, date=self.today - timedelta(days=i), status='absent')
+        self.seeded = total
+
+    def count_queries(self, url):
+        # Budget the cold path; cached pages would hide the queries
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(queries)
+
+    def assertQueryBudgetStable(self, urls, n=3):
+        self.seed(n)
+        # Warm per-process caches such as ContentType lookups first
+        for url in urls:
+            self.count_queries(url)
+        small = {url: self.count_queries(url) for url in urls}
+        self.seed(n * 10)
+        large = {url: self.count_queries(url) for url in urls}
+        self.assertEqual(small, large)
+
+    def test_crm_views(self):
+        self.assertQueryBudgetStable([
+            reverse('home'),
+            reverse('worker_list'),
+            reverse('worker_detail', args=[self.worker.pk]),
+            reverse('product_list'),
+            reverse('product_detail', args=[self.product.pk]),
+            reverse('order_list'),
+            reverse('order_detail', args=[self.order.pk]),
+            reverse('order_update', args=[self.order.pk]),
+            reverse('order_delete', args=[self.order.pk]),
+            reverse('attendance_list'),
+            reverse('attendance_bulk_create'),
+        ])
+
+    def test_admin_pages(self):
+        urls = []
+        for name, obj in [('worker', self.worker), ('product', self.product), ('order', self.order)]:
+            urls.append(reverse(f'admin:crm_{name}_changelist'))
+            urls.append(reverse(f'admin:crm_{name}_change', args=[obj.pk]))
+        urls.append(reverse('admin:crm_attendance_changelist'))
+        self.assertQueryBudgetStable(urls)
+
+
+class DashboardTests(LoggedInTestCase):
+    def test_counts_and_attendance_breakdown_in_one_query(self):
+        today = date.today()
+        workers = [make_worker(name=f'W{i}') for i in range(4)]
+        make_product()
+        for worker, status in zip(workers, ['present', 'present', 'late', 'absent']):
+            Attendance.objects.create(worker=worker, date=today, status=status)
+        Attendance.objects.create(worker=workers[0], date=today - timedelta(days=1), status='absent')
+
+        with self.assertNumQueries(1):
+            counts = dashboard_counts(today)
+
+        self.assertEqual(counts['total_workers'], 4)
+        self.assertEqual(counts['total_products'], 1)
+        self.assertEqual(counts['total_orders'], 0)
+        self.assertEqual(counts['attendance_summary'], {'present': 2, 'absent': 1, 'late': 1})
+
+    def test_snapshot_is_cached_until_a_write(self):
+        make_worker()
+        self.client.get(reverse('home'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('home'))
+        tables = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('crm_', tables)
+        self.assertEqual(response.context['total_workers'], 1)
+
+        make_worker(name='Second')
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['total_workers'], 2)
+
+        Worker.objects.get(full_name='Second').delete()
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['total_workers'], 1)
+
+
+class StockTests(LoggedInTestCase):
+    def test_reserve_many_is_all_or_nothing(self):
+        shirt = make_product(name='Shirt', stock=5)
+        pants = make_product(name='Pants', stock=2)
+
+        with self.assertRaises(stock.InsufficientStock) as raised:
+            stock.reserve_many([(shirt.pk, 3), (pants.pk, 2), (pants.pk, 1)])
+        self.assertEqual(raised.exception.available, 2)
+
+        shirt.refresh_from_db()
+        pants.refresh_from_db()
+        self.assertEqual((shirt.stock, pants.stock), (5, 2))
+
+    def test_order_views_keep_stock_in_step(self):
+        worker = make_worker()
+        shirt = make_product(name='Shirt', stock=10)
+        pants = make_product(name='Pants', stock=10)
+        data = {'worker': worker.pk, 'product': shirt.pk, 'quantity': 4, 'order_date': '2024-05-01', 'status': 'pending'}
+
+        self.client.post(reverse('order_create'), data)
+        order = Order.objects.get()
+        self.assertEqual(Product.objects.get(pk=shirt.pk).stock, 6)
+
+        response = self.client.post(reverse('order_create'), dict(data, quantity=7))
+        self.assertContains(response, 'Only 6 units available')
+        self.assertEqual(Order.objects.count(), 1)
+
+        # Switching product hands the old units back
+        self.client.post(reverse('order_update', args=[order.pk]), dict(data, product=pants.pk, quantity=3))
+        self.assertEqual(Product.objects.get(pk=shirt.pk).stock, 10)
+        self.assertEqual(Product.objects.get(pk=pants.pk).stock, 7)
+
+        self.client.post(reverse('order_delete', args=[order.pk]))
+        self.assertEqual(Product.objects.get(pk=pants.pk).stock, 10)
+
+
+class OrderStatusTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.worker = make_worker()
+        self.shirt = make_product(name='Shirt', stock=100)
+        self.jeans = make_product(name='Jeans', stock=100, category='pants')
+        self.orders = []
+        for i in range(6):
+            product = self.shirt if i % 2 else self.jeans
+            stock.reserve(product.pk, 10)
+            self.orders.append(Order.objects.create(worker=self.worker, product=product, quantity=10,
+                                                    order_date=date(2024, 1, 1 + i), stock_held=True))
+
+    def stock_levels(self):
+        return dict(Product.objects.values_list('name', 'stock'))
+
+    def test_bulk_cancel_is_one_update_plus_one_per_product(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('order_bulk_status'), {
+                'status': 'cancelled', 'orders': [order.pk for order in self.orders[:5]],
+            })
+        # Read them before assertRedirects requests the list page and resets the log
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertRedirects(response, reverse('order_list'))
+        self.assertEqual(Order.objects.filter(status='cancelled').count(), 5)
+        self.assertEqual(self.stock_levels(), {'Shirt': 90, 'Jeans': 100})
+
+        self.assertEqual(len([sql for sql in updates if sql.startswith('UPDATE "crm_order"')]), 1)
+        self.assertEqual(len([sql for sql in updates if sql.startswith('UPDATE "crm_product"')]), 2)
+        self.assertEqual(ledger.balances(), {self.shirt.pk: 90, self.jeans.pk: 100})
+
+        incremental = rollup_rows()
+        call_command('rebuild_rollups', stdout=StringIO())
+        rebuilt = rollup_rows()
+        self.assertEqual([row for row in incremental[0] if row[3]], rebuilt[0])
+        self.assertEqual([row for row in incremental[1] if row[2]], rebuilt[1])
+
+    def test_reopening_needs_stock_for_every_order(self):
+        ids = [order.pk for order in self.orders]
+        change_status(ids, 'cancelled')
+        Product.objects.filter(pk=self.shirt.pk).update(stock=15)
+
+        response = self.client.post(reverse('order_bulk_status'), {'status': 'completed', 'orders': ids}, follow=True)
+        self.assertContains(response, 'Not enough stock to reopen the orders for Shirt')
+        self.assertEqual(Order.objects.filter(status='cancelled').count(), 6)
+        self.assertEqual(self.stock_levels(), {'Shirt': 15, 'Jeans': 100})
+
+        self.assertEqual(change_status(ids[::2], 'completed'), 3)
+        self.assertEqual(self.stock_levels(), {'Shirt': 15, 'Jeans': 70})
+
+    def test_bulk_change_can_cover_every_page_of_the_filter(self):
+        change_status([order.pk for order in self.orders[:2]], 'completed')
+        with mock.patch('crm.views.PAGE_SIZE', 2):
+            response = self.client.get(reverse('order_list'), {'status': 'pending'})
+        self.assertContains(response, 'name="filter_status" value="pending"')
+        self.assertEqual(len(response.context['orders']), 2)
+
+        response = self.client.post(reverse('order_bulk_status'), {
+            'status': 'cancelled', 'select_across': '1', 'filter_status': 'pending', 'orders': [self.orders[5].pk],
+        }, follow=True)
+        self.assertContains(response, '4 orders marked cancelled.')
+        self.assertEqual(Order.objects.filter(status='completed').count(), 2)
+        self.assertEqual(self.stock_levels(), {'Shirt': 90, 'Jeans': 90})
+
+        response = self.client.post(reverse('order_bulk_status'), {'status': 'pending'}, follow=True)
+        self.assertContains(response, 'Select at least one order and a status.')
+
+    def test_admin_actions(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='secret'))
+        response = self.client.post(reverse('admin:crm_order_changelist'), {
+            'action': 'mark_completed', '_selected_action': [order.pk for order in self.orders[:3]],
+        }, follow=True)
+        self.assertContains(response, '3 orders marked completed.')
+        self.assertEqual(self.stock_levels(), {'Shirt': 70, 'Jeans': 70})
+
+        self.client.post(reverse('admin:crm_order_changelist'), {
+            'action': 'mark_cancelled', '_selected_action': [order.pk for order in self.orders],
+        })
+        self.assertEqual(self.stock_levels(), {'Shirt': 100, 'Jeans': 100})
+
+    def test_orders_without_booked_stock_move_none(self):
+        # Imported or seeded orders: nobody knows what stock they took
+        legacy = [Order.objects.create(worker=self.worker, product=self.shirt, quantity=5, status=status)
+                  for status in ('pending', 'cancelled')]
+        self.assertEqual(change_status([order.pk for order in legacy], 'completed'), 2)
+        self.assertEqual(change_status([order.pk for order in legacy], 'cancelled'), 2)
+        self.assertEqual(self.stock_levels()['Shirt'], 70)
+
+        data = {'worker': self.worker.pk, 'product': self.shirt.pk, 'quantity': 8, 'order_date': '2024-02-01'}
+        self.client.post(reverse('order_update', args=[legacy[0].pk]), dict(data, status='pending'))
+        self.client.post(reverse('order_delete', args=[legacy[0].pk]))
+        self.assertEqual(self.stock_levels()['Shirt'], 70)
+        legacy[1].refresh_from_db()
+        self.assertIsNone(legacy[1].stock_held)
+
+        # Booked orders keep track through a bulk change
+        change_status([self.orders[1].pk], 'cancelled')
+        self.assertIs(Order.objects.get(pk=self.orders[1].pk).stock_held, False)
+        change_status([self.orders[1].pk], 'pending')
+        self.assertIs(Order.objects.get(pk=self.orders[1].pk).stock_held, True)
+        self.assertEqual(self.stock_levels()['Shirt'], 70)
+
+    def test_admin_forms_move_stock(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='secret'))
+        data = {'worker': self.worker.pk, 'product': self.shirt.pk, 'quantity': 10, 'order_date': '2024-02-01',
+                'status': 'pending'}
+        self.client.post(reverse('admin:crm_order_add'), data)
+        order = Order.objects.latest('pk')
+        self.assertEqual(self.stock_levels()['Shirt'], 60)
+
+        self.client.post(reverse('admin:crm_order_change', args=[order.pk]), dict(data, status='cancelled'))
+        self.assertEqual(self.stock_levels()['Shirt'], 70)
+        self.client.post(reverse('admin:crm_order_changelist'), {
+            'action': 'mark_pending', '_selected_action': [order.pk],
+        })
+        self.assertEqual(self.stock_levels()['Shirt'], 60)
+
+        response = self.client.post(reverse('admin:crm_order_change', args=[order.pk]), dict(data, quantity=80))
+        self.assertContains(response, 'Only 70 units available.')
+        # Stock taken by someone else after the form check: an error message, nothing saved
+        contended = stock.InsufficientStock(self.shirt.pk, 20, 5)
+        with mock.patch('crm.admin.save_order', side_effect=contended):
+            response = self.client.post(reverse('admin:crm_order_add'), data, follow=True)
+        self.assertContains(response, 'Only 5 units available.')
+        self.assertEqual(Order.objects.latest('pk'), order)
+        self.assertFalse(LogEntry.objects.filter(action_flag=ADDITION).exclude(object_id=str(order.pk)).exists())
+        self.client.post(reverse('admin:crm_order_delete', args=[order.pk]), {'post': 'yes'})
+        self.assertFalse(Order.objects.filter(pk=order.pk).exists())
+        self.assertEqual(self.stock_levels(), {'Shirt': 70, 'Jeans': 70})
+
+        self.client.post(reverse('admin:crm_order_changelist'), {
+            'action': 'delete_selected', '_selected_action': [order.pk for order in self.orders[:2]], 'post': 'yes',
+        })
+        self.assertEqual(self.stock_levels(), {'Shirt': 80, 'Jeans': 80})
+
+    def test_order_form_cancellation_returns_stock_once(self):
+        order = self.orders[1]
+        data = {'worker': self.worker.pk, 'product': self.shirt.pk, 'quantity': 10, 'order_date': '2024-01-02'}
+        self.client.post(reverse('order_update', args=[order.pk]), dict(data, status='cancelled'))
+        self.assertEqual(self.stock_levels()['Shirt'], 80)
+
+        # Editing a cancelled order moves no stock; reopening takes it again
+        self.client.post(reverse('order_update', args=[order.pk]), dict(data, status='cancelled', quantity=50))
+        self.assertEqual(self.stock_levels()['Shirt'], 80)
+        self.client.post(reverse('order_update', args=[order.pk]), dict(data, status='pending', quantity=5))
+        self.assertEqual(self.stock_levels()['Shirt'], 75)
+
+        change_status([order.pk], 'cancelled')
+        self.client.post(reverse('order_delete', args=[order.pk]))
+        self.assertEqual(self.stock_levels()['Shirt'], 80)
+
+
+class StockLedgerTests(LoggedInTestCase):
+    def movements(self, product):
+        return list(product.stock_movements.order_by('id').values_list('reason', 'change'))
+
+    def backdate(self, queryset, field, day):
+        queryset.update(**{field: timezone.make_aware(datetime(day.year, day.month, day.day))})
+
+    def test_every_change_is_recorded(self):
+        worker = make_worker()
+        shirt = make_product(name='Shirt', stock=10)
+        pants = make_product(name='Pants', stock=10)
+        data = {'worker': worker.pk, 'product': shirt.pk, 'quantity': 4, 'order_date': '2024-05-01', 'status': 'pending'}
+
+        self.client.post(reverse('order_create'), data)
+        order = Order.objects.get()
+        self.client.post(reverse('order_update', args=[order.pk]), dict(data, product=pants.pk, quantity=3))
+        self.client.post(reverse('order_delete', args=[order.pk]))
+        shirt.stock = 25
+        shirt.save()
+        Product.objects.filter(pk=pants.pk).update(stock=8)
+
+        self.assertEqual(ledger.reconcile(), 1)
+        self.assertEqual(self.movements(shirt), [('opening', 10), ('order', -4), ('order_change', 4), ('adjustment', 15)])
+        self.assertEqual(self.movements(pants), [('opening', 10), ('order_change', -3), ('order_release', 3),
+                                                 ('adjustment', -2)])
+        self.assertEqual(ledger.balances(), {shirt.pk: 25, pants.pk: 8})
+
+    def test_soft_deleted_product_keeps_its_ledger_in_step(self):
+        shirt = make_product(name='Shirt', stock=10)
+        stock.reserve(shirt.pk, 4)
+        deletion.soft_delete(shirt)
+
+        stock.release(shirt.pk, 4)
+        self.assertEqual(Product.all_objects.get(pk=shirt.pk).stock, 10)
+        self.assertEqual(ledger.stock_as_of(shirt, timezone.now()), 10)
+        self.assertEqual(ledger.reconcile(), 0)
+
+    def test_stock_as_of_starts_from_the_latest_snapshot(self):
+        shirt = make_product(name='Shirt', stock=100)
+        self.backdate(StockMovement.objects.all(), 'created_at', date(2024, 1, 1))
+        stock.reserve(shirt.pk, 30)
+        self.backdate(StockMovement.objects.filter(reason='order'), 'created_at', date(2024, 2, 1))
+        self.assertEqual(ledger.take_snapshots(), 1)
+        self.backdate(StockSnapshot.objects.all(), 'taken_at', date(2024, 2, 2))
+        self.assertEqual(ledger.take_snapshots(), 0)
+        stock.reserve(shirt.pk, 5)
+
+        self.assertEqual(ledger.stock_as_of(shirt, date(2023, 12, 31)), 0)
+        self.assertEqual(ledger.stock_as_of(shirt, date(2024, 1, 15)), 100)
+        self.assertEqual(ledger.stock_as_of(shirt.pk, date(2024, 2, 1)), 70)
+        self.assertEqual(ledger.stock_as_of(shirt, timezone.now()), 65)
+
+        # The snapshot stands in for the movements it covers
+        StockMovement.objects.filter(created_at__lte=StockSnapshot.objects.get().taken_at).delete()
+        self.assertEqual(ledger.stock_as_of(shirt, date(2024, 3, 1)), 70)
+        with self.assertNumQueries(1):
+            self.assertEqual(ledger.stock_as_of(shirt, timezone.now()), 65)
+
+
+class StockAlertTests(LoggedInTestCase):
+    def open_alerts(self):
+        return list(alerts.open_alerts().order_by('product__name').values_list('product__name', 'stock', 'level'))
+
+    def test_order_views_open_update_and_resolve_one_alert(self):
+        worker = make_worker()
+        shirt = make_product(name='Shirt', stock=12)
+        data = {'worker': worker.pk, 'product': shirt.pk, 'quantity': 3, 'order_date': '2024-05-01', 'status': 'pending'}
+
+        self.client.post(reverse('order_create'), data)
+        self.assertEqual(self.open_alerts(), [('Shirt', 9, 10)])
+        self.client.post(reverse('order_create'), dict(data, quantity=4))
+        self.assertEqual(self.open_alerts(), [('Shirt', 5, 10)])
+
+        for order in Order.objects.all():
+            self.client.post(reverse('order_delete', args=[order.pk]))
+        self.assertEqual(self.open_alerts(), [])
+        self.assertIsNotNone(StockAlert.objects.get().resolved_at)
+
+    def test_product_level_overrides_category_level(self):
+        jeans = make_product(name='Jeans', stock=15, category='pants')
+        make_product(name='Shirt', stock=15)
+        self.assertEqual(self.open_alerts(), [])
+
+        CategoryReorderLevel.objects.create(category='pants', level=20)
+        self.assertEqual(self.open_alerts(), [('Jeans', 15, 20)])
+
+        jeans.reorder_level = 5
+        jeans.save()
+        self.assertEqual(self.open_alerts(), [])
+
+    def test_dashboard_reads_open_alerts(self):
+        make_product(name='Shirt', stock=2)
+        make_product(name='Jeans', stock=50)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('home'))
+        self.assertEqual([alert.product.name for alert in response.context['stock_alerts']], ['Shirt'])
+        # No scan for products below a stock level
+        self.assertFalse([q['sql'] for q in queries if re.search(r'"crm_product"\."stock" <', q['sql'])])
+
+        response = self.client.get(reverse('stock_alerts'))
+        self.assertContains(response, 'Shirt')
+        self.assertNotContains(response, 'Jeans')
+
+
+class StockConcurrencyTests(TransactionTestCase):
+    def test_concurrent_reservations_never_lose_updates_or_oversell(self):
+        product = make_product(stock=500)
+        threads, per_thread, quantity = 8, 40, 2
+        successes = []
+
+        def place_orders():
+            taken = 0
+            try:
+                for _ in range(per_thread):
+                    while True:
+                        try:
+                            stock.reserve(product.pk, quantity)
+                            taken += 1
+                            break
+                        except stock.InsufficientStock:
+                            break
+                        except OperationalError:
+                            # SQLite reports table locks instead of waiting; retry
+                            continue
+            finally:
+                connection.close()
+            successes.append(taken)
+
+        workers = [threading.Thread(target=place_orders) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        product.refresh_from_db()
+        sold = sum(successes) * quantity
+        self.assertEqual(sum(successes), 250)
+        self.assertEqual(product.stock, 500 - sold)
+        self.assertEqual(product.stock, 0)
+
+
+flaky_calls = []
+
+
+@tasks.task('test_flaky', max_attempts=2)
+def flaky_task(progress, fail_times=0):
+    flaky_calls.append(1)
+    progress(50, 'halfway')
+    if len(flaky_calls) <= fail_times:
+        raise RuntimeError('try again')
+    return {'calls': len(flaky_calls)}
+
+
+@override_settings(CRM_TASK_RETRY_DELAY=60)
+class TaskQueueTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        flaky_calls.clear()
+        files = tempfile.TemporaryDirectory()
+        self.addCleanup(files.cleanup)
+        self.enterContext(override_settings(CRM_TASK_FILES_DIR=files.name))
+
+    def test_export_runs_in_the_background_and_is_downloadable(self):
+        worker = make_worker(name='Ann')
+        Order.objects.create(worker=worker, product=make_product(name='Shirt'), quantity=2, order_date=date(2024, 1, 5))
+
+        response = self.client.post(reverse('export_enqueue', args=['orders']), {'start': '2024-01-01'})
+        task = Task.objects.get()
+        self.assertRedirects(response, reverse('task_detail', args=[task.pk]))
+        self.assertEqual((task.status, task.kwargs['start']), ('queued', '2024-01-01'))
+
+        self.assertTrue(tasks.run(tasks.claim('test')))
+        status = self.client.get(reverse('task_status', args=[task.pk])).json()
+        self.assertEqual((status['status'], status['progress'], status['result']['rows']), ('succeeded', 100, 1))
+
+        response = self.client.get(status['download_url'])
+        self.assertIn(b'Ann', b''.join(response.streaming_content))
+        response.close()
+
+    def test_failed_attempts_are_retried_with_backoff_then_failed(self):
+        task = tasks.enqueue('test_flaky', fail_times=1)
+        self.assertFalse(tasks.run(tasks.claim('test')))
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ('queued', 1))
+        self.assertIn('try again', task.error)
+        # Not due for another minute
+        self.assertIsNone(tasks.claim('test'))
+
+        Task.objects.update(run_after=timezone.now())
+        self.assertTrue(tasks.run(tasks.claim('test')))
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts, task.result), ('succeeded', 2, {'calls': 2}))
+
+        flaky_calls.clear()
+        task = tasks.enqueue('test_flaky', fail_times=5)
+        for _ in range(2):
+            tasks.run(tasks.claim('test'))
+            Task.objects.filter(status='queued').update(run_after=timezone.now())
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ('failed', 2))
+
+    def test_exports_that_cannot_succeed_are_not_retried(self):
+        task = tasks.enqueue('export', name='orders', format='xlsx')
+        with mock.patch('crm.tasks.write_xlsx', side_effect=RuntimeError('XLSX export requires the openpyxl package.')):
+            self.assertFalse(tasks.run(tasks.claim('test')))
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ('failed', 1))
+        self.assertIn('openpyxl', task.error)
+
+        task = tasks.enqueue('export', name='orders', start='2024-13-01')
+        self.assertFalse(tasks.run(tasks.claim('test')))
+        self.assertEqual(Task.objects.get(pk=task.pk).status, 'failed')
+
+    def test_tasks_of_a_dead_worker_are_queued_again(self):
+        task = tasks.enqueue('test_flaky')
+        tasks.claim('gone')
+        Task.objects.update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(tasks.requeue_stale(), (1, 0))
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.worker), ('queued', ''))
+
+    def test_users_only_see_their_own_tasks(self):
+        task = tasks.enqueue('test_flaky', user=self.user)
+        other = User.objects.create_user('clerk', password='secret')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('task_status', args=[task.pk])).status_code, 404)
+        self.assertNotContains(self.client.get(reverse('task_list')), 'test_flaky')
+        self.assertEqual(self.client.get(reverse('import_enqueue')).status_code, 302)
+
+
+class TaskWorkerTests(TransactionTestCase):
+    def test_worker_threads_run_each_task_once(self):
+        flaky_calls.clear()
+        for _ in range(6):
+            tasks.enqueue('test_flaky')
+
+        out = StringIO()
+        call_command('run_worker', threads=3, burst=True, poll_interval=0.01, stdout=out)
+        self.assertEqual(list(Task.objects.values_list('status', 'attempts').distinct()), [('succeeded', 1)])
+        self.assertEqual(len(flaky_calls), 6)
+        self.assertIn('Worker stopped.', out.getvalue())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite tuning')
+class SQLiteProfileTests(TransactionTestCase):
+    def test_new_connections_get_the_profile_pragmas(self):
+        # manage.py and development keep the checked-in database out of WAL mode
+        self.assertEqual(settings.CRM_SQLITE_PRAGMAS['journal_mode'], 'DELETE')
+
+        # The in-memory test database cannot reconnect, so announce a new connection instead
+        self.addCleanup(apply_pragmas, connection, {**settings.CRM_SQLITE_PRAGMAS, 'cache_size': -2000})
+        with override_settings(CRM_SQLITE_PRAGMAS=settings.SQLITE_PROFILES['production']['pragmas']):
+            connection_created.send(sender=type(connection), connection=connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -32000)
+
+        with self.assertRaises(ValueError):
+            apply_pragmas(connection, {'cache_size; DROP TABLE crm_order': 1})
+
+    def test_write_benchmark_leaves_the_database_alone(self):
+        make_worker()
+        make_product(stock=3)
+        out = StringIO()
+        call_command('benchmark_writes', '--threads', '2', '--orders', '5', stdout=out)
+
+        self.assertIn('default', out.getvalue())
+        self.assertIn('production', out.getvalue())
+        self.assertIn('10 orders', out.getvalue())
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(Product.objects.get().stock, 3)
+
+
+class AttendanceRecordingTests(LoggedInTestCase):
+    def test_record_attendance_upserts_in_a_single_statement(self):
+        day = date(2024, 3, 1)
+        workers = [make_worker(name=f'W{i}') for i in range(50)]
+        Attendance.objects.create(worker=workers[0], date=day, status='absent')
+
+        with CaptureQueriesContext(connection) as queries:
+            record_attendance(day, {worker.pk: 'present' for worker in workers})
+        self.assertEqual(len(attendance_writes(queries)), 1)
+
+        self.assertEqual(Attendance.objects.filter(date=day).count(), 50)
+        self.assertEqual(Attendance.objects.get(worker=workers[0], date=day).status, 'present')
+
+    def test_bulk_form_posts_every_worker(self):
+        day = date(2024, 3, 1)
+        workers = [make_worker(name=f'W{i}') for i in range(3)]
+        data = {'date': day.isoformat()}
+        data.update({f'worker_{worker.pk}': 'late' for worker in workers})
+
+        response = self.client.post(reverse('attendance_bulk_create'), data)
+        self.assertRedirects(response, reverse('attendance_list'))
+        self.assertEqual(Attendance.objects.filter(date=day, status='late').count(), 3)
+
+
+class QuickAttendanceTests(LoggedInTestCase):
+    def test_record_day_touches_exceptions_only_in_python(self):
+        day = date(2024, 3, 1)
+        workers = [make_worker(name=f'W{i}') for i in range(100)]
+        Attendance.objects.create(worker=workers[5], date=day, status='late')
+
+        with CaptureQueriesContext(connection) as queries:
+            record_day(day, {workers[0].pk: 'absent'})
+        # One INSERT ... SELECT for the defaults, one upsert for the exception
+        self.assertEqual(len(attendance_writes(queries)), 2)
+
+        self.assertEqual(Attendance.objects.filter(date=day).count(), 100)
+        self.assertEqual(
+            dict(Attendance.objects.filter(date=day).exclude(status='present').values_list('worker_id', 'status')),
+            {workers[0].pk: 'absent'},
+        )
+
+    def test_form_accepts_lines_or_json_and_rejects_unknown_workers(self):
+        day = date(2024, 3, 1)
+        first, second = make_worker(name='First'), make_worker(name='Second')
+
+        response = self.client.post(reverse('attendance_quick_create'), {
+            'date': day.isoformat(), 'exceptions': f'{first.pk}, Late\n',
+        })
+        self.assertRedirects(response, reverse('attendance_list'))
+        self.assertEqual(Attendance.objects.get(worker=first, date=day).status, 'late')
+        self.assertEqual(Attendance.objects.get(worker=second, date=day).status, 'present')
+
+        self.client.post(reverse('attendance_quick_create'), {
+            'date': day.isoformat(), 'exceptions': f'{{"{second.pk}": "absent"}}',
+        })
+        self.assertEqual(Attendance.objects.get(worker=first, date=day).status, 'present')
+        self.assertEqual(Attendance.objects.get(worker=second, date=day).status, 'absent')
+
+        response = self.client.post(reverse('attendance_quick_create'), {
+            'date': day.isoformat(), 'exceptions': '999999,absent',
+        })
+        self.assertFormError(response.context['form'], 'exceptions', 'Unknown worker IDs: 999999.')
+
+    @override_settings(CRM_ATTENDANCE_FULL_FORM_LIMIT=2)
+    def test_full_form_redirects_for_large_headcount(self):
+        workers = [make_worker(name=f'W{i}') for i in range(3)]
+        response = self.client.get(reverse('attendance_bulk_create'))
+        self.assertRedirects(response, reverse('attendance_quick_create'))
+
+        # A form opened before the headcount grew is still recorded, not dropped by the redirect
+        data = {'date': '2024-03-01', **{f'worker_{worker.pk}': 'late' for worker in workers}}
+        response = self.client.post(reverse('attendance_bulk_create'), data)
+        self.assertRedirects(response, reverse('attendance_list'))
+        self.assertEqual(Attendance.objects.filter(date=date(2024, 3, 1), status='late').count(), 3)
+
+
+class ExportTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        worker = make_worker(name='Exporter')
+        product = make_product(name='Shirt', price='10.00')
+        for day, status in [(1, 'pending'), (2, 'completed'), (3, 'completed'), (20, 'completed')]:
+            Order.objects.create(worker=worker, product=product, quantity=2, order_date=date(2024, 1, day), status=status)
+
+    def test_csv_streams_filtered_rows(self):
+        response = self.client.get(reverse('export', args=['orders']), {
+            'start': '2024-01-02', 'end': '2024-01-10', 'status': 'completed',
+        })
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[0], 'Order #')
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[1].split(',')[6:9], ['Shirt', '2', '10.00'])
+        self.assertEqual(Decimal(lines[1].split(',')[9]), Decimal('20'))
+
+    @skipUnless(openpyxl, 'openpyxl is not installed')
+    def test_xlsx_has_the_header_and_the_filtered_rows(self):
+        response = self.client.get(reverse('export', args=['orders']), {'status': 'pending', 'format': 'xlsx'})
+        self.assertEqual(response['Content-Disposition'].split('.')[-1], 'xlsx"')
+        sheet = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True).active
+        rows = list(sheet.iter_rows(values_only=True))
+        response.close()
+        self.assertEqual(rows[0], tuple(label for field, label in exports.ORDER_COLUMNS))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual((rows[1][2], rows[1][4], rows[1][6], rows[1][7]), ('pending', 'Exporter', 'Shirt', 2))
+        self.assertEqual(Decimal(str(rows[1][9])), Decimal('20'))
+
+    def test_rejects_unknown_export_and_bad_dates(self):
+        self.assertEqual(self.client.get(reverse('export', args=['users'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('export', args=['orders']), {'start': 'x'}).status_code, 400)
+
+    def test_command_writes_csv(self):
+        out = StringIO()
+        call_command('export', 'products', stdout=out)
+        self.assertEqual(out.getvalue().splitlines()[1].split(',')[1], 'Shirt')
+
+
+class ArchiveTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.worker = make_worker(name='Archivist')
+        self.product = make_product(name='Shirt', price='10.00')
+        self.orders = {
+            status: Order.objects.create(worker=self.worker, product=self.product, quantity=2,
+                                         order_date=date(2023, 6, 1), status=status)
+            for status in ('pending', 'completed', 'cancelled')
+        }
+        self.recent = Order.objects.create(worker=self.worker, product=self.product, quantity=1,
+                                           order_date=date(2024, 6, 1), status='completed')
+        for day in (date(2023, 6, 1), date(2024, 6, 1)):
+            Attendance.objects.create(worker=self.worker, date=day, status='present')
+
+    def test_moves_closed_orders_and_old_attendance_in_batches(self):
+        before = rollup_rows()
+        out = StringIO()
+        call_command('archive', '--before', '2024-01-01', '--batch-size', '1', stdout=out)
+        self.assertIn('Archived 2 orders and 1 attendance records.', out.getvalue())
+
+        self.assertEqual(set(Order.objects.values_list('pk', flat=True)), {self.orders['pending'].pk, self.recent.pk})
+        self.assertEqual(set(ArchivedOrder.objects.values_list('pk', flat=True)),
+                         {self.orders['completed'].pk, self.orders['cancelled'].pk})
+        self.assertEqual(list(ArchivedAttendance.objects.values_list('date', flat=True)), [date(2023, 6, 1)])
+        archived = ArchivedOrder.objects.get(pk=self.orders['completed'].pk)
+        self.assertEqual((archived.worker, archived.line_total), (self.worker, Decimal('20.00')))
+
+        # The archived rows still count, also after a rebuild
+        self.assertEqual(rollup_rows(), before)
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(rollup_rows(), before)
+
+    def test_archived_orders_stay_readable(self):
+        archived_pk = self.orders['completed'].pk
+        call_command('archive', '--before', '2024-01-01', stdout=StringIO())
+
+        response = self.client.get(reverse('order_detail', args=[archived_pk]))
+        self.assertContains(response, 'Archived')
+        self.assertNotContains(response, reverse('order_update', args=[archived_pk]))
+        self.assertEqual(self.client.get(reverse('order_detail', args=[999])).status_code, 404)
+
+        response = self.client.get(reverse('worker_detail', args=[self.worker.pk]))
+        self.assertEqual(response.context['revenue'], Decimal('50.00'))
+        self.assertEqual([order.pk for order in response.context['archived_orders']],
+                         [self.orders['cancelled'].pk, archived_pk])
+
+        response = self.client.get(reverse('export', args=['archived_orders']))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], [str(archived_pk), str(self.orders['cancelled'].pk)])
+
+        response = self.client.get(reverse('order_list'))
+        self.assertEqual([order.pk for order in response.context['orders']], [self.recent.pk, self.orders['pending'].pk])
+
+
+class DeletionTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.worker = make_worker(name='Leaver')
+        self.other = make_worker(name='Stayer')
+        self.shirt = make_product(name='Shirt', price='10.00', stock=100)
+        for day in range(1, 6):
+            Order.objects.create(worker=self.worker, product=self.shirt, quantity=1, order_date=date(2024, 1, day),
+                                 status='completed')
+            Attendance.objects.create(worker=self.worker, date=date(2024, 1, day), status='present')
+        Order.objects.create(worker=self.other, product=self.shirt, quantity=2, order_date=date(2024, 1, 1))
+        Attendance.objects.create(worker=self.other, date=date(2024, 1, 1), status='late')
+        call_command('archive', '--before', '2024-01-03', stdout=StringIO())
+
+    def test_worker_is_hidden_at_once_and_purged_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('worker_delete', args=[self.worker.pk]))
+        # The request only marks the worker; its rows are left to the task
+        writes = [q['sql'] for q in queries if q['sql'].startswith(('UPDATE', 'INSERT', 'DELETE'))]
+        self.assertEqual([sql.split()[1] for sql in writes if 'crm_task' not in sql], ['"crm_worker"'])
+        self.assertRedirects(response, reverse('worker_list'))
+        self.assertFalse(Worker.objects.filter(pk=self.worker.pk).exists())
+        self.assertIsNotNone(Worker.all_objects.get(pk=self.worker.pk).deleted_at)
+        self.assertNotContains(self.client.get(reverse('order_create')), 'Leaver')
+
+        # Batches of hide take its orders and attendance out of the lists, the totals and the rollups
+        worker = Worker.all_objects.get(pk=self.worker.pk)
+        self.assertEqual(deletion.hide(worker, batch_size=2), 10)
+        for model in (Order, ArchivedOrder, Attendance, ArchivedAttendance):
+            self.assertFalse(model.objects.filter(worker_id=self.worker.pk).exists(), model)
+        self.assertEqual(Order.all_objects.filter(worker_id=self.worker.pk).count(), 3)
+        self.assertEqual(dashboard_counts(date(2024, 1, 1))['total_orders'], 1)
+        self.assertNotContains(self.client.get(reverse('order_list')), 'Leaver')
+        self.assertEqual(DailyProductSales.objects.aggregate(units=Sum('units'))['units'], 2)
+        self.assertEqual(DailyWorkerSales.objects.filter(worker=self.worker).aggregate(units=Sum('units'))['units'], 0)
+        self.assertEqual(list(DailyAttendance.objects.filter(present__gt=0)), [])
+        self.assertEqual(deletion.hide(worker), 0)
+
+        task = Task.objects.get(name='purge_deleted')
+        with override_settings(CRM_PURGE_BATCH_SIZE=2), CaptureQueriesContext(connection) as queries:
+            self.assertTrue(tasks.run(tasks.claim('test')))
+        task.refresh_from_db()
+        self.assertEqual(task.result, {'deleted': 15})
+        deletes = [q['sql'] for q in queries if q['sql'].startswith('DELETE FROM "crm_order"')]
+        self.assertEqual(len(deletes), 2)
+
+        self.assertFalse(Worker.all_objects.filter(pk=self.worker.pk).exists())
+        for model in (Order, ArchivedOrder, Attendance, ArchivedAttendance, DailyWorkerSales):
+            self.assertFalse(model._base_manager.filter(worker_id=self.worker.pk).exists(), model)
+        self.assertEqual(Order.all_objects.count(), 1)
+
+        # The raw deletes kept the rollups in step
+        incremental = rollup_rows()
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(rollup_rows(), incremental)
+
+    @override_settings(CRM_PURGE_DELETED=False)
+    def test_admin_delete_is_soft_until_purged(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='secret'))
+        self.shirt.stock = 2
+        self.shirt.save()
+        self.assertTrue(alerts.open_alerts().exists())
+
+        response = self.client.post(reverse('admin:crm_product_delete', args=[self.shirt.pk]), {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(alerts.open_alerts().exists())
+        self.assertEqual(Order.objects.count(), 4)
+
+        self.assertEqual(list(Task.objects.values_list('name', flat=True)), ['hide_deleted'])
+        self.assertTrue(tasks.run(tasks.claim('test')))
+        self.assertEqual(Task.objects.get().result, {'hidden': 6})
+        self.assertEqual((Order.objects.count(), Order.all_objects.count()), (0, 4))
+
+        out = StringIO()
+        call_command('purge_deleted', stdout=out)
+        self.assertIn('Purged 1 deleted records.', out.getvalue())
+        self.assertFalse(Product.all_objects.exists())
+        for model in (Order, ArchivedOrder, StockMovement, DailyProductSales):
+            self.assertFalse(model._base_manager.exists(), model)
+        self.assertEqual(list(deletion.pending()), [])
+
+
+class ImportDataTests(TestCase):
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as target:
+            target.write(content)
+        return path
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_imports_products_workers_and_orders_with_natural_keys(self):
+        make_product(name='Shirt', stock=1)
+        products = self.write('products.csv', (
+            'name,category,price,stock\n'
+            'Shirt,shirts,12.50,40\n'
+            'Jeans,pants,30.00,10\n'
+            'Broken,hats,1.00,1\n'
+        ))
+        workers = self.write('workers.jsonl', (
+            '{"full_name": "Ann", "position": "packer", "phone_number": "555-1", "join_date": "2023-01-01"}\n'
+            '{"full_name": "Bob", "position": "worker", "phone_number": "555-2", "join_date": "2023-02-01"}\n'
+        ))
+        orders = self.write('orders.csv', (
+            'worker,product,quantity,order_date,status\n'
+            '555-1,Shirt,2,2023-05-01,completed\n'
+            '555-2,Jeans,1,2023-05-02,\n'
+            '555-9,Jeans,1,2023-05-02,pending\n'
+        ))
+
+        out, err = StringIO(), StringIO()
+        call_command('import_data', 'products', products, stdout=out, stderr=err)
+        self.assertIn('1 created, 1 updated, 1 skipped', out.getvalue())
+        self.assertIn("invalid category 'hats'", err.getvalue())
+        self.assertEqual(Product.objects.get(name='Shirt').stock, 40)
+
+        call_command('import_data', 'workers', workers, stdout=out, stderr=err)
+        self.assertEqual(Worker.objects.count(), 2)
+
+        # FKs come from in-memory maps: two lookups up front, then one INSERT per batch
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_data', 'orders', orders, '--batch-size', '1', stdout=out, stderr=err)
+        # (the rollup rebuild afterwards aggregates orders and attendance, hot and archived)
+        lookups = [q['sql'] for q in queries
+                   if q['sql'].startswith('SELECT') and not re.search(r'crm_(archived)?(order|attendance)', q['sql'])]
+        self.assertEqual(len(lookups), 2)
+
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(Order.objects.get(worker__phone_number='555-2').status, 'pending')
+        # History does not consume stock
+        self.assertEqual(Product.objects.get(name='Jeans').stock, 10)
+
+    def test_bad_rows_are_skipped_with_their_line(self):
+        products = self.write('products.csv', (
+            'name,category,price,stock\n'
+            'Shirt,shirts,12.50,40\n'
+            'Short,shirts\n'
+            'Refund,shirts,-1.00,5\n'
+            'Sold out,shirts,9.00,0\n'
+            'Jeans,pants,30.00,10\n'
+        ))
+        workers = self.write('workers.jsonl', (
+            '{"full_name": "Ann", "position": "packer", "phone_number": "555-1", "join_date": "2023-01-01"}\n'
+            '{"full_name": "Bob", "position": \n'
+            '["not", "an", "object"]\n'
+            '{"full_name": "Cy", "position": "worker", "phone_number": "555-3", "join_date": "2023-03-01"}\n'
+        ))
+
+        out, err = StringIO(), StringIO()
+        call_command('import_data', 'products', products, '--batch-size', '10', stdout=out, stderr=err)
+        self.assertIn('2 created, 0 updated, 3 skipped', out.getvalue())
+        self.assertIn('line 3: ValueError: missing price', err.getvalue())
+        self.assertIn('line 4: ValueError: price must not be negative', err.getvalue())
+        self.assertIn('line 5: ValueError: stock must be at least 1', err.getvalue())
+        self.assertEqual(set(Product.objects.values_list('name', flat=True)), {'Shirt', 'Jeans'})
+
+        call_command('import_data', 'workers', workers, stdout=out, stderr=err)
+        self.assertIn('line 2: JSONDecodeError', err.getvalue())
+        self.assertIn('line 3: ValueError: not a JSON object', err.getvalue())
+        self.assertEqual(set(Worker.objects.values_list('full_name', flat=True)), {'Ann', 'Cy'})
+
+        orders = self.write('orders.csv', (
+            'worker,product,quantity,order_date,status\n'
+            '555-1,Shirt,0,2023-05-01,completed\n'
+            '555-3,Jeans,1,2023-05-02,pending\n'
+        ))
+        call_command('import_data', 'orders', orders, stdout=out, stderr=err)
+        self.assertIn('line 2: ValueError: quantity must be at least 1', err.getvalue())
+        self.assertEqual(Order.objects.get().product.name, 'Jeans')
+
+
+class OrderPriceSnapshotTests(LoggedInTestCase):
+    def test_price_is_fixed_when_the_order_is_placed(self):
+        shirt = make_product(name='Shirt', price='10.00')
+        order = Order.objects.create(worker=make_worker(), product=shirt, quantity=3)
+        self.assertEqual((order.unit_price, order.line_total), (Decimal('10.00'), Decimal('30.00')))
+
+        Product.objects.filter(pk=shirt.pk).update(price=Decimal('99.00'))
+        order = Order.objects.get(pk=order.pk)
+        order.quantity = 4
+        order.save()
+        self.assertEqual((order.unit_price, order.line_total), (Decimal('10.00'), Decimal('40.00')))
+
+        # Switching product takes the new product's price
+        order.product = make_product(name='Jeans', price='25.00')
+        order.save()
+        self.assertEqual(Order.objects.get(pk=order.pk).line_total, Decimal('100.00'))
+
+    def test_totals_do_not_touch_product(self):
+        worker = make_worker()
+        for quantity in (1, 2, 3):
+            Order.objects.create(worker=worker, product=make_product(price='5.00'), quantity=quantity)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('worker_detail', args=[worker.pk]))
+        self.assertContains(response, '$30.00')
+        # One sum over the hot orders, one over the archived ones
+        aggregates = [q['sql'] for q in queries if 'SUM(' in q['sql']]
+        self.assertEqual(len(aggregates), 2)
+        for sql in aggregates:
+            self.assertNotIn('crm_product', sql)
+
+
+# Whatever CRM_CACHE_BACKEND says: the test run is one process, so any cache sees every write
+@override_settings(CRM_CONDITIONAL_GET=True, CRM_FRAGMENT_CACHE_TIMEOUT=600)
+class CachingTests(LoggedInTestCase):
+    def stats(self, name):
+        return next(row for row in caching.get_stats([name]))
+
+    def test_unchanged_pages_answer_304(self):
+        product = make_product(name='Shirt')
+        url = reverse('product_list')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304,
+        )
+
+        # Stock changes are queryset UPDATEs, without post_save
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.reserve(product.pk, 5)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '95')
+
+        self.assertEqual(self.stats('product_list')['not_modified'], 2)
+
+    def test_etag_is_per_user(self):
+        make_product()
+        etag = self.client.get(reverse('product_list'))['ETag']
+        other = User.objects.create_user('other', password='secret')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('product_list'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_fragments_are_keyed_by_model_versions(self):
+        worker, product = make_worker(), make_product()
+        Order.objects.create(worker=worker, product=product, quantity=2, order_date=date(2024, 5, 1))
+        url = reverse('product_detail', args=[product.pk])
+
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual((self.stats('product_orders')['miss'], self.stats('product_orders')['hit']), (1, 1))
+
+        Order.objects.create(worker=worker, product=product, quantity=7, order_date=date(2024, 5, 2))
+        response = self.client.get(url)
+        self.assertEqual(self.stats('product_orders')['miss'], 2)
+        self.assertContains(response, '<td>7</td>', html=True)
+
+    def test_invalidate_moves_the_dashboard_and_the_versions(self):
+        product = make_product(name='Shirt')
+        self.assertEqual(get_dashboard_snapshot()['total_products'], 1)
+        version = caching.versions(Product)['crm.product']
+
+        Product.objects.filter(pk=product.pk).update(deleted_at=timezone.now())
+        self.assertEqual(get_dashboard_snapshot()['total_products'], 1)
+        # Off, as with a per-process cache, every request builds it
+        with override_settings(CRM_DASHBOARD_CACHE_TIMEOUT=0):
+            self.assertEqual(get_dashboard_snapshot()['total_products'], 0)
+        caching.invalidate(Product)
+        self.assertEqual(get_dashboard_snapshot()['total_products'], 0)
+        self.assertNotEqual(caching.versions(Product)['crm.product'], version)
+
+    def test_per_process_cache_is_refused(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            errors = checks.check_shared_cache(None)
+            self.assertEqual([error.id for error in errors], ['crm.E001'])
+            with override_settings(CRM_FRAGMENT_CACHE_TIMEOUT=0, CRM_CONDITIONAL_GET=False):
+                errors = checks.check_shared_cache(None)
+            self.assertEqual(errors[0].msg.split()[0], 'CRM_DASHBOARD_CACHE_TIMEOUT')
+
+            with override_settings(CRM_FRAGMENT_CACHE_TIMEOUT=0, CRM_CONDITIONAL_GET=False,
+                                   CRM_DASHBOARD_CACHE_TIMEOUT=0):
+                self.assertEqual(checks.check_shared_cache(None), [])
+
+    def test_diagnostics_page_is_staff_only(self):
+        self.client.get(reverse('home'))
+        response = self.client.get(reverse('cache_diagnostics'))
+        self.assertContains(response, 'home_recent_orders')
+        self.assertContains(response, 'crm.product')
+
+        self.client.post(reverse('cache_diagnostics'))
+        self.assertEqual(self.stats('home')['rendered'], 0)
+
+        self.client.force_login(User.objects.create_user('clerk', password='secret'))
+        self.assertEqual(self.client.get(reverse('cache_diagnostics')).status_code, 302)
+
+
+class InstrumentationTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        view_stats.reset()
+        make_worker()
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('worker_list'))
+        timing = dict(part.strip().split(';', 1) for part in response['Server-Timing'].split(','))
+        self.assertEqual(set(timing), {'total', 'db', 'template'})
+        self.assertIn(f'desc="{len(queries)} queries"', timing['db'])
+
+    @override_settings(CRM_SLOW_REQUEST_MS=0, CRM_SLOW_REQUEST_QUERIES=2)
+    def test_slow_requests_are_logged_with_their_worst_sql(self):
+        with self.assertLogs('crm.performance', 'WARNING') as logs:
+            self.client.get(reverse('worker_list'), {'search': 'work'})
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry['view'], entry['status']), ('worker_list', 200))
+        self.assertEqual(len(entry['worst_sql']), 2)
+        self.assertGreaterEqual(entry['worst_sql'][0]['ms'], entry['worst_sql'][1]['ms'])
+
+    def test_performance_page_shows_percentiles(self):
+        for _ in range(3):
+            self.client.get(reverse('worker_list'))
+        views, slow = view_stats.summary()
+        row = next(row for row in views if row['view'] == 'worker_list')
+        self.assertEqual(row['count'], 3)
+        self.assertLessEqual(row['p50_ms'], row['p99_ms'])
+
+        self.assertContains(self.client.get(reverse('performance_stats')), 'worker_list')
+        self.client.force_login(User.objects.create_user('clerk', password='secret'))
+        self.assertEqual(self.client.get(reverse('performance_stats')).status_code, 302)
+
+
+class AsyncURLConf:
+    # What crm.urls serves with CRM_ASYNC_VIEWS on
+    urlpatterns = [
+        path('', async_views.home, name='home'),
+        path('workers/<int:pk>/', async_views.worker_detail, name='worker_detail'),
+        path('products/<int:pk>/', async_views.product_detail, name='product_detail'),
+        path('', include('clothe_crm.urls')),
+    ]
+
+
+@override_settings(ROOT_URLCONF=AsyncURLConf)
+class AsyncViewTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(self.user)
+        self.worker = make_worker(name='Ann')
+        self.product = make_product(name='Shirt', stock=3)
+        Order.objects.create(worker=self.worker, product=self.product, quantity=2, status='completed')
+        Attendance.objects.create(worker=self.worker, date=timezone.now().date(), status='late')
+
+    async def test_pages_render_like_the_sync_views(self):
+        response = await self.async_client.get(reverse('home'))
+        self.assertContains(response, 'Shirt')
+        self.assertEqual(response.context['attendance_summary']['late'], 1)
+        self.assertIn('queries', response['Server-Timing'])
+
+        response = await self.async_client.get(reverse('worker_detail', args=[self.worker.pk]))
+        self.assertContains(response, '$20.00')
+        self.assertEqual(len(response.context['attendance']), 1)
+
+        response = await self.async_client.get(reverse('product_detail', args=[self.product.pk]))
+        self.assertContains(response, 'Ann')
+        self.assertEqual((await self.async_client.get(reverse('product_detail', args=[0]))).status_code, 404)
+
+    @override_settings(CRM_CONDITIONAL_GET=True)
+    async def test_login_and_conditional_get(self):
+        url = reverse('worker_detail', args=[self.worker.pk])
+        etag = (await self.async_client.get(url))['ETag']
+        self.assertEqual((await self.async_client.get(url, headers={'If-None-Match': etag})).status_code, 304)
+
+        await sync_to_async(self.async_client.logout)()
+        response = await self.async_client.get(url)
+        self.assertRedirects(response, f"{reverse('login')}?next={url}", fetch_redirect_response=False)
+
+
+class SearchTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ann = Worker.objects.create(full_name='Ann Packer', position='manager', phone_number='555-123-4567',
+                                         join_date=date(2024, 1, 1))
+        self.bob = Worker.objects.create(full_name='Bob Smith', position='packer', phone_number='555-987-6543',
+                                         join_date=date(2024, 1, 1))
+        Worker.objects.bulk_create([
+            Worker(full_name=f'Worker {i}', position='worker', phone_number=f'555-000-{i:04d}', join_date=date(2024, 1, 1))
+            for i in range(20)
+        ])
+
+    def names(self, text):
+        return sorted(worker.full_name for worker in search.filter_queryset(Worker.objects.all(), text))
+
+    def test_missing_triggers_are_recreated_after_migrate(self):
+        if not search.has_index('crm_worker_search'):
+            self.skipTest('SQLite without FTS5')
+        # What SQLite does to the triggers when a migration rebuilds crm_worker
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER crm_worker_search_update')
+        Worker.objects.filter(pk=self.bob.pk).update(full_name='Robert Smith')
+        self.assertEqual(self.names('robert'), [])
+
+        emit_post_migrate_signal(0, False, connection.alias)
+        self.assertEqual(self.names('robert'), ['Robert Smith'])
+        self.assertEqual(search.ensure_triggers(), [])
+        Worker.objects.filter(pk=self.ann.pk).update(full_name='Anna Packer')
+        self.assertEqual(self.names('anna'), ['Anna Packer'])
+
+    def test_matches_name_position_and_phone_prefixes(self):
+        self.assertEqual(self.names('ann'), ['Ann Packer'])
+        self.assertEqual(self.names('pack'), ['Ann Packer', 'Bob Smith'])
+        self.assertEqual(self.names('987-65'), ['Bob Smith'])
+        self.assertEqual(self.names('5551234'), ['Ann Packer'])
+        self.assertEqual(self.names('worker 19'), ['Worker 19'])
+        self.assertEqual(len(self.names('work')), 20)
+
+    def test_index_follows_updates_and_deletes(self):
+        Worker.objects.filter(pk=self.bob.pk).update(full_name='Robert Smith')
+        self.assertEqual(self.names('robert'), ['Robert Smith'])
+        self.assertEqual(self.names('bob'), [])
+        self.ann.delete()
+        self.assertEqual(self.names('ann'), [])
+
+    def test_typeahead_ranks_name_matches_first(self):
+        make_product(name='Packing Tape', category='accessories')
+        response = self.client.get(reverse('search_typeahead'), {'q': 'pack'})
+        results = response.json()['results']
+        self.assertEqual([result['label'] for result in results], ['Ann Packer', 'Bob Smith', 'Packing Tape'])
+        self.assertEqual(results[0]['url'], reverse('worker_detail', args=[self.ann.pk]))
+
+    def test_worker_list_uses_the_index(self):
+        response = self.client.get(reverse('worker_list'), {'search': '555-987'})
+        self.assertEqual([worker.full_name for worker in response.context['workers']], ['Bob Smith'])
+        if search.has_index('crm_worker_search'):
+            plan = search.filter_queryset(Worker.objects.all(), 'bob').explain()
+            self.assertIn('VIRTUAL TABLE INDEX', plan)
+
+    def test_fallback_without_index(self):
+        with mock.patch('crm.search.has_index', return_value=False):
+            self.assertEqual(self.names('pack'), ['Ann Packer', 'Bob Smith'])
+            self.assertEqual([worker.full_name for worker in search.ranked(Worker, 'smith')], ['Bob Smith'])
+
+    def test_autocomplete_pages_prefix_matches(self):
+        url = reverse('autocomplete', args=['workers'])
+        data = self.client.get(url, {'q': 'pack'}).json()
+        self.assertEqual([result['text'] for result in data['results']], ['Ann Packer', 'Bob Smith'])
+        self.assertIsNone(data['next'])
+
+        first = self.client.get(url, {'q': 'work'}).json()
+        self.assertEqual(len(first['results']), 20)
+        self.assertIsNone(first['next'])
+        everyone = self.client.get(url).json()
+        self.assertEqual(len(everyone['results']), 20)
+        rest = self.client.get(url, {'after': everyone['next']}).json()
+        self.assertEqual(len(rest['results']), 2)
+        self.assertEqual(self.client.get(reverse('autocomplete', args=['orders'])).status_code, 404)
+
+    def test_order_form_renders_only_the_selected_choices(self):
+        Product.objects.bulk_create([
+            Product(name=f'Product {i}', category='shirts', price='10.00', stock=5) for i in range(200)
+        ])
+        response = self.client.get(reverse('order_create'))
+        self.assertNotContains(response, 'Product 199')
+        self.assertNotContains(response, 'Ann Packer')
+        self.assertContains(response, 'data-autocomplete-url')
+
+        order = Order.objects.create(worker=self.bob, product=Product.objects.get(name='Product 7'), quantity=1,
+                                     order_date=date(2024, 1, 2))
+        response = self.client.get(reverse('order_update', args=[order.pk]))
+        self.assertContains(response, f'<option value="{self.bob.pk}" selected>Bob Smith</option>', html=True)
+        self.assertNotContains(response, 'Ann Packer')
+        self.assertNotContains(response, 'Product 8<')
+
+    def test_admin_order_form_uses_autocomplete(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='secret'))
+        response = self.client.get(reverse('admin:crm_order_add'))
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertNotContains(response, 'Bob Smith')
+
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'term': 'pack', 'app_label': 'crm', 'model_name': 'order', 'field_name': 'worker',
+        })
+        self.assertEqual([result['text'] for result in response.json()['results']], ['Ann Packer', 'Bob Smith'])
+
+
+class ApiTests(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.worker = make_worker(name='Ann')
+        self.shirt = make_product(name='Shirt', stock=5, price='10.00')
+        self.jeans = make_product(name='Jeans', stock=1, price='25.00', category='pants')
+
+    def batch(self, orders, **options):
+        return self.client.post(reverse('api_order_batch'), json.dumps({'orders': orders, **options}),
+                                content_type='application/json')
+
+    def test_lists_with_cursor_and_sparse_fields(self):
+        for day in range(1, 6):
+            Order.objects.create(worker=self.worker, product=self.shirt, quantity=1, order_date=date(2024, 1, day))
+
+        url = reverse('api_list', args=['orders'])
+        seen, params = [], {'limit': 2, 'fields': 'id,order_date,line_total'}
+        while True:
+            body = self.client.get(url, params).json()
+            seen += body['results']
+            if not body['next']:
+                break
+            params['after'] = body['next']
+        self.assertEqual([row['order_date'] for row in seen], [f'2024-01-0{day}' for day in range(5, 0, -1)])
+        self.assertEqual(set(seen[0]), {'id', 'order_date', 'line_total'})
+        self.assertEqual(seen[0]['line_total'], '10.00')
+
+        body = self.client.get(reverse('api_list', args=['products']), {'category': 'pants'}).json()
+        self.assertEqual([row['name'] for row in body['results']], ['Jeans'])
+        detail = self.client.get(reverse('api_detail', args=['workers', self.worker.pk]), {'fields': 'full_name'})
+        self.assertEqual(detail.json(), {'full_name': 'Ann'})
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.client.get(reverse('api_list', args=['orders']), {'fields': 'secret'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_list', args=['orders']), {'after': 'junk'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_list', args=['orders']), {'since': 'May'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_list', args=['nope'])).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_detail', args=['workers', 0])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_order_batch')).status_code, 405)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_list', args=['orders'])).status_code, 401)
+        credentials = base64.b64encode(b'staff:secret').decode()
+        response = self.client.get(reverse('api_list', args=['orders']), HTTP_AUTHORIZATION=f'Basic {credentials}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_batch_creates_what_stock_covers(self):
+        response = self.batch([
+            {'worker': self.worker.pk, 'product': self.shirt.pk, 'quantity': 3, 'order_date': '2024-03-01'},
+            {'worker': self.worker.pk, 'product': self.shirt.pk, 'quantity': 3},
+            {'worker': self.worker.pk, 'product': self.jeans.pk, 'quantity': 1, 'status': 'completed'},
+            {'worker': 0, 'product': self.shirt.pk, 'quantity': 'two'},
+            {'worker': self.worker.pk, 'product': self.shirt.pk, 'quantity': 2},
+        ])
+        body = response.json()
+        self.assertEqual((body['committed'], body['created'], body['failed']), (True, 3, 2))
+        self.assertEqual([result['status'] for result in body['results']],
+                         ['created', 'error', 'created', 'error', 'created'])
+        self.assertIn('Only 2 units', body['results'][1]['errors']['quantity'][0])
+        self.assertEqual(set(body['results'][3]['errors']), {'worker', 'quantity'})
+        self.assertEqual(body['results'][2]['line_total'], '25.00')
+
+        self.shirt.refresh_from_db()
+        self.jeans.refresh_from_db()
+        self.assertEqual((self.shirt.stock, self.jeans.stock), (0, 0))
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(DailyProductSales.objects.get(date=date(2024, 3, 1)).revenue, Decimal('30.00'))
+
+    def test_batch_cost_does_not_grow_with_its_size(self):
+        Product.objects.filter(pk=self.shirt.pk).update(stock=1000)
+
+        def queries(size):
+            with CaptureQueriesContext(connection) as context:
+                self.batch([{'worker': self.worker.pk, 'product': self.shirt.pk, 'quantity': 1}] * size)
+            return len(context)
+
+        queries(1)  # creates today's rollup rows
+        # Up to SQLite's bound-parameter limit per INSERT
+        self.assertEqual(queries(2), queries(100))
+        self.assertEqual(Order.objects.count(), 103)
+
+    def test_all_or_nothing_batch_writes_nothing_on_failure(self):
+        response = self.batch([
+            {'worker': self.worker.pk, 'product': self.shirt.pk, 'quantity': 1},
+            {'worker': self.worker.pk, 'product': self.jeans.pk, 'quantity': 2},
+        ], all_or_nothing=True)
+        body = response.json()
+        self.assertFalse(body['committed'])
+        self.assertEqual([result['status'] for result in body['results']], ['skipped', 'error'])
+        self.assertFalse(Order.objects.exists())
+        self.shirt.refresh_from_db()
+        self.assertEqual(self.shirt.stock, 5)
+
+        self.assertEqual(self.batch([{}] * 501).status_code, 400)
+
+    def test_batch_field_errors_are_clean(self):
+        response = self.batch([
+            {'worker': self.worker.pk, 'product': self.shirt.pk, 'quantity': 1.7},
+            {'worker': self.worker.pk, 'product': self.shirt.pk, 'quantity': 'two'},
+            {'worker': str(self.worker.pk), 'product': self.shirt.pk, 'quantity': ' 2 ', 'status': ['x']},
+            {'worker': str(self.worker.pk), 'product': self.shirt.pk, 'quantity': '2'},
+        ])
+        results = response.json()['results']
+        self.assertEqual(results[0]['errors'], {'quantity': ['quantity must be a whole number']})
+        self.assertEqual(results[1]['errors'], {'quantity': ['quantity must be a whole number']})
+        self.assertEqual(set(results[2]['errors']), {'status'})
+        self.assertEqual((results[3]['status'], Order.objects.get().quantity), ('created', 2))
+
+    def test_contended_batch_answers_409(self):
+        contended = stock.InsufficientStock(self.shirt.pk, 1, 0)
+        with mock.patch('crm.orders.stock.reserve_many', side_effect=contended):
+            response = self.batch([{'worker': self.worker.pk, 'product': self.shirt.pk, 'quantity': 1}])
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+
+class RollupTests(LoggedInTestCase):
+    def test_order_writes_update_rollups_incrementally(self):
+        worker = make_worker()
+        shirt = make_product(name='Shirt', price='10.00')
+        jeans = make_product(name='Jeans', price='25.00', category='pants')
+        day = date(2024, 3, 1)
+
+        order = Order.objects.create(worker=worker, product=shirt, quantity=3, order_date=day, status='pending')
+        Order.objects.create(worker=worker, product=jeans, quantity=1, order_date=day, status='completed')
+        sales = DailyProductSales.objects.get(date=day, product=shirt)
+        self.assertEqual((sales.orders, sales.units, sales.revenue), (1, 3, Decimal('30.00')))
+        self.assertEqual(DailyWorkerSales.objects.get(date=day, worker=worker).revenue, Decimal('55.00'))
+
+        order.product, order.quantity = jeans, 2
+        order.save()
+        self.assertEqual(DailyProductSales.objects.get(date=day, product=shirt).units, 0)
+        self.assertEqual(DailyProductSales.objects.get(date=day, product=jeans).units, 3)
+
+        order.status = 'cancelled'
+        order.save()
+        self.assertEqual(DailyWorkerSales.objects.get(date=day, worker=worker).units, 1)
+
+        Order.objects.filter(status='completed').delete()
+        self.assertEqual(DailyWorkerSales.objects.get(date=day, worker=worker).revenue, 0)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        call_command('load_initial_data', '--workers', '4', '--products', '3', '--orders', '0', '--days', '3',
+                     '--end-date', '2024-03-03', stdout=StringIO())
+        workers, products = list(Worker.objects.all()), list(Product.objects.all())
+        for i in range(30):
+            Order.objects.create(worker=workers[i % 4], product=products[i % 3], quantity=i % 5 + 1,
+                                 order_date=date(2024, 3, 1) + timedelta(days=i % 3),
+                                 status=['pending', 'completed', 'cancelled'][i % 3])
+        Attendance.objects.filter(pk=Attendance.objects.first().pk).update(status='late')
+        Attendance.objects.first().save()
+
+        incremental = rollup_rows()
+        call_command('rebuild_rollups', '--batch-days', '2', stdout=StringIO())
+        rebuilt = rollup_rows()
+        # Incremental updates keep emptied rows at zero, a rebuild drops them
+        self.assertEqual([row for row in incremental[0] if row[3]], rebuilt[0])
+        self.assertEqual([row for row in incremental[1] if row[2]], rebuilt[1])
+        self.assertEqual(incremental[2], rebuilt[2])
+        self.assertEqual(sum(row[2] for row in rebuilt[2]) + sum(row[1] for row in rebuilt[2]), 4 * 3 - 1)
+
+    def test_product_rows_follow_a_category_change(self):
+        shirt = make_product(name='Shirt', price='10.00')
+        Order.objects.create(worker=make_worker(), product=shirt, quantity=2, order_date=date(2024, 3, 1))
+        shirt.category = 'jackets'
+        shirt.save()
+        self.assertEqual(list(rollups.revenue_by_category(date(2024, 3, 1), date(2024, 3, 1))
+                              .values_list('category', 'total_units')), [('jackets', 2)])
+
+        # Imports update products without signals
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'products.csv')
+            with open(path, 'w') as target:
+                target.write('name,category,price,stock\nShirt,dresses,10.00,5\n')
+            call_command('import_data', 'products', path, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(list(DailyProductSales.objects.values_list('category', flat=True)), ['dresses'])
+
+    def test_sales_report_reads_rollups_only(self):
+        worker = make_worker(name='Ann')
+        Order.objects.create(worker=worker, product=make_product(name='Shirt'), quantity=4,
+                             order_date=timezone.now().date(), status='completed')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('sales_report'))
+        self.assertContains(response, 'Ann')
+        self.assertContains(response, '40.00')
+        self.assertFalse([q for q in queries if 'crm_order' in q['sql']])
+
+
+class InitialDataTests(LoggedInTestCase):
+    def test_loaded_data_reaches_rollups_and_caches(self):
+        make_worker(name='Gone')
+        self.client.get(reverse('home'))
+        before = caching.versions(Order)
+
+        call_command('load_initial_data', stdout=StringIO())
+        self.assertNotEqual(caching.versions(Order), before)
+        self.assertEqual(self.client.get(reverse('home')).context['total_workers'], Worker.objects.count())
+
+        sold = Order.objects.exclude(status='cancelled').aggregate(units=Sum('quantity'))['units'] or 0
+        self.assertEqual(DailyProductSales.objects.aggregate(units=Sum('units'))['units'] or 0, sold)
+        today = DailyAttendance.objects.get(date=timezone.now().date())
+        self.assertEqual(today.present + today.absent + today.late, Worker.objects.count())
+
+
+class SyntheticDataTests(TestCase):
+    def snapshot(self):
+        return (
+            list(Worker.objects.order_by('phone_number').values_list('full_name', 'position', 'phone_number')),
+            list(Order.objects.order_by('pk').values_list('worker__phone_number', 'product__name', 'quantity', 'order_date')),
+        )
+
+    def test_seeding_is_reproducible_and_sized(self):
+        args = ['load_initial_data', '--workers', '12', '--products', '7', '--orders', '150', '--days', '5',
+                '--end-date', '2024-06-30', '--batch-size', '40']
+        call_command(*args, stdout=StringIO())
+        first = self.snapshot()
+
+        self.assertEqual(Worker.objects.count(), 12)
+        self.assertEqual(Product.objects.count(), 7)
+        self.assertEqual(Order.objects.count(), 150)
+        self.assertEqual(Attendance.objects.count(), 12 * 5)
+        self.assertEqual(Order.objects.order_by('order_date').first().order_date, date(2024, 6, 26))
+
+        call_command(*args, stdout=StringIO())
+        self.assertEqual(self.snapshot(), first)
+
+    def test_benchmark_reports_every_endpoint(self):
+        call_command('load_initial_data', '--workers', '3', '--orders', '20', '--days', '2', stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('benchmark', '--iterations', '2', '--warmup', '0', '--output', output,
+                         '--baseline', os.path.join(directory, 'missing.json'), stdout=StringIO())
+            with open(output) as source:
+                results = json.load(source)
+
+        self.assertEqual({name: result['status'] for name, result in results.items()}, {
+            'home': 200, 'order_list': 200, 'worker_detail': 200,
+            'attendance_bulk_create': 200, 'attendance_bulk_create:post': 302,
+            'attendance_quick_create': 200, 'attendance_quick_create:post': 302,
+        })
+        self.assertEqual(Attendance.objects.filter(date=timezone.now().date(), status='present').count(), 3)
+        self.assertFalse(User.objects.filter(username='benchmark').exists())
+
+        # Past the limit the full form is left out rather than timed as a redirect
+        with override_settings(CRM_ATTENDANCE_FULL_FORM_LIMIT=2):
+            out = StringIO()
+            call_command('benchmark', '--iterations', '1', '--warmup', '0', '--read-only',
+                         '--baseline', 'missing.json', stdout=out)
+        self.assertIn('attendance_bulk_create skipped', out.getvalue())
+        self.assertNotIn('post', out.getvalue())
+
+    def test_benchmark_fails_on_an_unexpected_status(self):
+        call_command('load_initial_data', '--workers', '3', '--orders', '5', '--days', '1', stdout=StringIO())
+        err = StringIO()
+        with mock.patch('crm.views.get_dashboard_snapshot', side_effect=PermissionDenied), \
+                self.assertRaisesMessage(CommandError, '1 page(s) did not answer as expected: home'):
+            call_command('benchmark', '--iterations', '1', '--warmup', '0', '--read-only',
+                         '--baseline', 'missing.json', stdout=StringIO(), stderr=err)
+        self.assertIn('home answered 403, expected 200', err.getvalue())
+
+
+@skipUnlessDBFeature('supports_partial_indexes')
+class IndexUsageTests(TestCase):
+    """The planner must pick the index added for each access path."""
+
+    @classmethod
+    def setUpTestData(cls):
+        workers = [make_worker(name=f'W{i:02d}', position=['packer', 'worker'][i % 2]) for i in range(20)]
+        products = [make_product(name=f'P{i:02d}', stock=i * 7) for i in range(20)]
+        Order.objects.bulk_create([
+            Order(worker=workers[i % 20], product=products[i % 20], quantity=1, unit_price=10, line_total=10,
+                  order_date=date(2024, 1, 1) + timedelta(days=i % 60), status=['pending', 'completed'][i % 2])
+            for i in range(400)
+        ])
+        Attendance.objects.bulk_create([
+            Attendance(worker=worker, date=date(2024, 1, 1) + timedelta(days=day), status='present')
+            for worker in workers for day in range(30)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_dashboard_attendance_counts(self):
+        self.assertUsesIndex(
+            Attendance.objects.filter(date=date(2024, 1, 5)).values('status'), 'crm_attendance_date_status_idx',
+        )
+
+    def test_worker_and_product_order_history(self):
+        self.assertUsesIndex(
+            Order.objects.filter(worker_id=1).order_by('-order_date'), 'crm_order_worker_date_idx',
+        )
+        self.assertUsesIndex(
+            Order.objects.filter(product_id=1).order_by('-order_date'), 'crm_order_product_date_idx',
+        )
+
+    def test_recent_orders_and_status_filter(self):
+        self.assertUsesIndex(Order.objects.order_by('-order_date', '-id')[:5], 'crm_order_date_id_idx')
+        self.assertUsesIndex(
+            Order.objects.filter(status='pending', order_date__gte=date(2024, 2, 1)), 'crm_order_status_date_idx',
+        )
+
+    def test_worker_list_by_position(self):
+        self.assertUsesIndex(
+            Worker.objects.filter(position='packer').order_by('full_name', 'id'), 'crm_worker_position_idx',
+        )
+
+    def test_open_stock_alerts(self):
+        self.assertUsesIndex(alerts.open_alerts().order_by('stock', 'id')[:10], 'crm_stockalert_open_idx')
@@ -1,26 +1,32 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, async_views, views
+
+# Dashboard and detail pages, async when served over ASGI
+pages = async_views if settings.CRM_ASYNC_VIEWS else views
 
 urlpatterns = [
     # Home
-    path('', views.home, name='home'),
+    path('', pages.home, name='home'),
 
     # Workers
     path('workers/', views.worker_list, name='worker_list'),
-    path('workers/<int:pk>/', views.worker_detail, name='worker_detail'),
+    path('workers/<int:pk>/', pages.worker_detail, name='worker_detail'),
     path('workers/new/', views.worker_create, name='worker_create'),
     path('workers/<int:pk>/edit/', views.worker_update, name='worker_update'),
     path('workers/<int:pk>/delete/', views.worker_delete, name='worker_delete'),
 
     # Products
     path('products/', views.product_list, name='product_list'),
-    path('products/<int:pk>/', views.product_detail, name='product_detail'),
+    path('products/<int:pk>/', pages.product_detail, name='product_detail'),
     path('products/new/', views.product_create, name='product_create'),
     path('products/<int:pk>/edit/', views.product_update, name='product_update'),
     path('products/<int:pk>/delete/', views.product_delete, name='product_delete'),
+    path('products/alerts/', views.stock_alerts, name='stock_alerts'),
 
     # Orders
     path('orders/', views.order_list, name='order_list'),
+    path('orders/status/', views.order_bulk_status, name='order_bulk_status'),
     path('orders/<int:pk>/', views.order_detail, name='order_detail'),
     path('orders/new/', views.order_create, name='order_create'),
     path('orders/<int:pk>/edit/', views.order_update, name='order_update'),
@@ -29,4 +35,33 @@ urlpatterns = [
     # Attendance
     path('attendance/', views.attendance_list, name='attendance_list'),
     path('attendance/record/', views.attendance_bulk_create, name='attendance_bulk_create'),
+    path('attendance/record/quick/', views.attendance_quick_create, name='attendance_quick_create'),
+
+    # Reports
+    path('reports/', views.sales_report, name='sales_report'),
+
+    # Diagnostics
+    path('diagnostics/cache/', views.cache_diagnostics, name='cache_diagnostics'),
+    path('diagnostics/performance/', views.performance_stats, name='performance_stats'),
+
+    # Search
+    path('search/', views.search_typeahead, name='search_typeahead'),
+    path('autocomplete/<str:model_name>/', views.autocomplete, name='autocomplete'),
+
+    # JSON API
+    path('api/orders/batch/', api.order_batch, name='api_order_batch'),
+    path('api/<str:resource>/', api.resource_list, name='api_list'),
+    path('api/<str:resource>/<int:pk>/', api.resource_detail, name='api_detail'),
+
+    # Exports
+    path('exports/<str:name>/', views.export, name='export'),
+    path('exports/<str:name>/background/', views.export_enqueue, name='export_enqueue'),
+
+    # Background tasks
+    path('tasks/', views.task_list, name='task_list'),
+    path('tasks/<int:pk>/', views.task_detail, name='task_detail'),
+    path('tasks/<int:pk>/status/', views.task_status, name='task_status'),
+    path('tasks/<int:pk>/download/', views.task_download, name='task_download'),
+    path('tasks/import/', views.import_enqueue, name='import_enqueue'),
+    path('tasks/rebuild-rollups/', views.rollups_enqueue, name='rollups_enqueue'),
 ]
\ No newline at end of file
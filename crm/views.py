@@ -1,40 +1,47 @@
+import os
+import uuid
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.db.models import Count, Sum
 from django.utils import timezone
 from django.contrib import messages
-from .models import Worker, Product, Order, Attendance
-from .forms import WorkerForm, ProductForm, OrderForm, AttendanceForm, AttendanceBulkForm, WorkerSearchForm
+from .models import Worker, Product, Order, Attendance, ArchivedOrder, Task
+from .forms import (
+    WorkerForm, ProductForm, OrderForm, OrderStatusForm, AttendanceForm, AttendanceBulkForm, AttendanceExceptionsForm,
+    ExportForm, ImportUploadForm, WorkerSearchForm,
+)
+from . import alerts, deletion, search, stock, tasks
+from .caching import conditional_page, get_stats, reset_stats, version_key, versions
+from .attendance import record_attendance, record_day
+from .exports import EXPORTS, iter_rows, iter_csv, xlsx_tempfile
+from .instrumentation import view_stats
+from .pagination import InvalidCursor, KeysetPaginator, paginate
+from .orders import change_status, delete_orders, save_order
+from .rollups import revenue_by_category, units_by_worker_month
+from .stats import get_dashboard_snapshot
+
+PAGE_SIZE = 25
 
 
 @login_required
+@conditional_page('home', Worker, Product, Order, Attendance)
 def home(request):
-    # Get statistics for the dashboard
-    total_workers = Worker.objects.count()
-    total_products = Product.objects.count()
-    total_orders = Order.objects.count()
-
-    # Today's attendance summary
-    today = timezone.now().date()
-    attendance_summary = {
-        'present': Attendance.objects.filter(date=today, status='present').count(),
-        'absent': Attendance.objects.filter(date=today, status='absent').count(),
-        'late': Attendance.objects.filter(date=today, status='late').count(),
-    }
-
-    # Recent orders
-    recent_orders = Order.objects.order_by('-order_date')[:5]
-
-    # Low stock products
-    low_stock_products = Product.objects.filter(stock__lt=10).order_by('stock')
+    # Counts, attendance and the two dashboard tables come from one cached snapshot
+    snapshot = get_dashboard_snapshot()
 
     context = {
-        'total_workers': total_workers,
-        'total_products': total_products,
-        'total_orders': total_orders,
-        'attendance_summary': attendance_summary,
-        'recent_orders': recent_orders,
-        'low_stock_products': low_stock_products,
+        'total_workers': snapshot['total_workers'],
+        'total_products': snapshot['total_products'],
+        'total_orders': snapshot['total_orders'],
+        'attendance_summary': snapshot['attendance_summary'],
+        'recent_orders': snapshot['recent_orders'],
+        'stock_alerts': snapshot['stock_alerts'],
+        'cache_versions': version_key(Worker, Product, Order),
     }
 
     return render(request, 'crm/home.html', context)
@@ -44,36 +51,57 @@ def home(request):
 @login_required
 def worker_list(request):
     form = WorkerSearchForm(request.GET)
-    workers = Worker.objects.all().order_by('full_name')
+    workers = Worker.objects.all()
 
     if form.is_valid():
         search_term = form.cleaned_data.get('search')
         position = form.cleaned_data.get('position')
 
         if search_term:
-            workers = workers.filter(full_name__icontains=search_term)
+            workers = search.filter_queryset(workers, search_term)
 
         if position:
             workers = workers.filter(position=position)
 
     context = {
-        'workers': workers,
+        'workers': paginate(request, workers, ('full_name', 'id'), per_page=PAGE_SIZE),
         'form': form,
     }
 
     return render(request, 'crm/worker_list.html', context)
 
 
+def _delete_in_background(request, obj, model_name):
+    # Only the record is hidden here; its rows go in batches off the request
+    deletion.soft_delete(obj)
+    task = 'purge_deleted' if settings.CRM_PURGE_DELETED else 'hide_deleted'
+    tasks.enqueue(task, user=request.user, model=model_name, pk=obj.pk)
+
+
+def order_revenue(orders):
+    # Summed in SQL from the stored line totals
+    return orders.exclude(status='cancelled').aggregate(revenue=Sum('line_total'))['revenue'] or 0
+
+
+# Detail pages list the newest archived orders; the archive export has the rest
+ARCHIVED_ORDERS_SHOWN = 10
+
+
 @login_required
+@conditional_page('worker_detail', Worker, Product, Order, Attendance)
 def worker_detail(request, pk):
     worker = get_object_or_404(Worker, pk=pk)
-    orders = Order.objects.filter(worker=worker).order_by('-order_date')
+    orders = Order.objects.filter(worker=worker).select_related('product').order_by('-order_date')
+    archived_orders = ArchivedOrder.objects.filter(worker=worker).select_related('worker', 'product')
     attendance = Attendance.objects.filter(worker=worker).order_by('-date')[:10]
 
     context = {
         'worker': worker,
         'orders': orders,
+        'archived_orders': archived_orders.order_by('-order_date', '-id')[:ARCHIVED_ORDERS_SHOWN],
         'attendance': attendance,
+        'revenue': order_revenue(orders) + order_revenue(archived_orders),
+        'cache_versions': version_key(Worker, Product, Order, Attendance),
     }
 
     return render(request, 'crm/worker_detail.html', context)
@@ -114,8 +142,8 @@ def worker_delete(request, pk):
     worker = get_object_or_404(Worker, pk=pk)
 
     if request.method == 'POST':
-        worker.delete()
-        messages.success(request, 'Worker deleted successfully!')
+        _delete_in_background(request, worker, 'worker')
+        messages.success(request, 'Worker deleted successfully! Their orders and attendance are removed in the background.')
         return redirect('worker_list')
 
     return render(request, 'crm/worker_confirm_delete.html', {'worker': worker})
@@ -123,19 +151,33 @@ def worker_delete(request, pk):
 
 # Product views
 @login_required
+@conditional_page('product_list', Product)
 def product_list(request):
-    products = Product.objects.all().order_by('name')
-    return render(request, 'crm/product_list.html', {'products': products})
+    query = request.GET.get('q', '').strip()
+    products = search.filter_queryset(Product.objects.all(), query)
+
+    context = {
+        'products': paginate(request, products, ('name', 'id'), per_page=PAGE_SIZE),
+        'query': query,
+        'cache_versions': version_key(Product),
+    }
+
+    return render(request, 'crm/product_list.html', context)
 
 
 @login_required
+@conditional_page('product_detail', Worker, Product, Order)
 def product_detail(request, pk):
     product = get_object_or_404(Product, pk=pk)
-    orders = Order.objects.filter(product=product).order_by('-order_date')
+    orders = Order.objects.filter(product=product).select_related('worker').order_by('-order_date')
+    archived_orders = ArchivedOrder.objects.filter(product=product).select_related('worker', 'product')
 
     context = {
         'product': product,
         'orders': orders,
+        'archived_orders': archived_orders.order_by('-order_date', '-id')[:ARCHIVED_ORDERS_SHOWN],
+        'revenue': order_revenue(orders) + order_revenue(archived_orders),
+        'cache_versions': version_key(Worker, Product, Order),
     }
 
     return render(request, 'crm/product_detail.html', context)
@@ -176,24 +218,74 @@ def product_delete(request, pk):
     product = get_object_or_404(Product, pk=pk)
 
     if request.method == 'POST':
-        product.delete()
-        messages.success(request, 'Product deleted successfully!')
+        _delete_in_background(request, product, 'product')
+        messages.success(request, 'Product deleted successfully! Its orders are removed in the background.')
         return redirect('product_list')
 
     return render(request, 'crm/product_confirm_delete.html', {'product': product})
 
 
+@login_required
+def stock_alerts(request):
+    show_resolved = request.GET.get('resolved') == '1'
+    if show_resolved:
+        queryset = alerts.resolved_alerts()
+    else:
+        queryset = alerts.open_alerts()
+    page = paginate(request, queryset.select_related('product'), ('-opened_at', '-id'), per_page=PAGE_SIZE)
+    return render(request, 'crm/stock_alerts.html', {'alerts': page, 'show_resolved': show_resolved})
+
+
 # Order views
 @login_required
 def order_list(request):
-    orders = Order.objects.all().order_by('-order_date')
-    return render(request, 'crm/order_list.html', {'orders': orders})
+    orders = Order.objects.select_related('worker', 'product')
+    status = request.GET.get('status')
+    if status in dict(Order.STATUS_CHOICES):
+        orders = orders.filter(status=status)
+    else:
+        status = None
+    orders = paginate(request, orders, ('-order_date', '-id'), per_page=PAGE_SIZE)
+
+    context = {
+        'orders': orders,
+        'status': status,
+        'status_choices': Order.STATUS_CHOICES,
+    }
+
+    return render(request, 'crm/order_list.html', context)
+
+
+@login_required
+def order_bulk_status(request):
+    if request.method != 'POST':
+        return redirect('order_list')
+
+    form = OrderStatusForm(request.POST)
+    if not form.is_valid():
+        messages.error(request, 'Select at least one order and a status.')
+        return redirect('order_list')
+
+    status = form.cleaned_data['status']
+    try:
+        changed = change_status(form.selected_orders().values_list('pk', flat=True), status)
+    except stock.InsufficientStock as e:
+        product = Product.all_objects.filter(pk=e.product_id).first()
+        messages.error(request, f'Not enough stock to reopen the orders for {product}. Only {e.available} units available.')
+        return redirect('order_list')
+
+    messages.success(request, f'{changed} orders marked {dict(Order.STATUS_CHOICES)[status].lower()}.')
+    return redirect('order_list')
 
 
 @login_required
 def order_detail(request, pk):
-    order = get_object_or_404(Order, pk=pk)
-    return render(request, 'crm/order_detail.html', {'order': order})
+    order = Order.objects.select_related('worker', 'product').filter(pk=pk).first()
+    archived = order is None
+    if archived:
+        # Closed orders moved out by `manage.py archive` keep their ids
+        order = get_object_or_404(ArchivedOrder.objects.select_related('worker', 'product'), pk=pk)
+    return render(request, 'crm/order_detail.html', {'order': order, 'archived': archived})
 
 
 @login_required
@@ -203,17 +295,13 @@ def order_create(request):
         if form.is_valid():
             order = form.save(commit=False)
 
-            # Check if there's enough stock
-            product = order.product
-            if product.stock < order.quantity:
-                messages.error(request, f'Not enough stock available. Only {product.stock} units available.')
+            # Reserve stock and save the order together; cancelled orders hold none
+            try:
+                save_order(order)
+            except stock.InsufficientStock as e:
+                messages.error(request, f'Not enough stock available. Only {e.available} units available.')
                 return render(request, 'crm/order_form.html', {'form': form, 'title': 'Create Order'})
 
-            # Update stock
-            product.stock -= order.quantity
-            product.save()
-
-            order.save()
             messages.success(request, 'Order created successfully!')
             return redirect('order_list')
     else:
@@ -225,26 +313,19 @@ def order_create(request):
 @login_required
 def order_update(request, pk):
     order = get_object_or_404(Order, pk=pk)
-    original_quantity = order.quantity
 
     if request.method == 'POST':
         form = OrderForm(request.POST, instance=order)
         if form.is_valid():
             updated_order = form.save(commit=False)
 
-            # Adjust stock based on quantity change
-            product = updated_order.product
-            quantity_difference = updated_order.quantity - original_quantity
-
-            if quantity_difference > 0 and product.stock < quantity_difference:
-                messages.error(request, f'Not enough stock available. Only {product.stock} units available.')
+            # Move the reservation to the new product/quantity; cancelling hands it back
+            try:
+                save_order(updated_order)
+            except stock.InsufficientStock as e:
+                messages.error(request, f'Not enough stock available. Only {e.available} units available.')
                 return render(request, 'crm/order_form.html', {'form': form, 'title': 'Update Order'})
 
-            # Update stock
-            product.stock -= quantity_difference
-            product.save()
-
-            updated_order.save()
             messages.success(request, 'Order updated successfully!')
             return redirect('order_detail', pk=order.pk)
     else:
@@ -255,15 +336,12 @@ def order_update(request, pk):
 
 @login_required
 def order_delete(request, pk):
-    order = get_object_or_404(Order, pk=pk)
+    order = get_object_or_404(Order.objects.select_related('worker', 'product'), pk=pk)
 
     if request.method == 'POST':
-        # Restore stock
-        product = order.product
-        product.stock += order.quantity
-        product.save()
+        # Restore stock; a cancelled order gave it back already
+        delete_orders([order])
 
-        order.delete()
         messages.success(request, 'Order deleted successfully!')
         return redirect('order_list')
 
@@ -283,7 +361,7 @@ def attendance_list(request):
     else:
         selected_date = today
 
-    attendance_records = Attendance.objects.filter(date=selected_date).order_by('worker__full_name')
+    attendance_records = Attendance.objects.filter(date=selected_date).select_related('worker').order_by('worker__full_name')
 
     context = {
         'attendance_records': attendance_records,
@@ -295,6 +373,11 @@ def attendance_list(request):
 
 @login_required
 def attendance_bulk_create(request):
+    # One select per worker stops being usable on a large shop floor; a form
+    # already filled in is still recorded
+    if request.method != 'POST' and Worker.objects.count() > settings.CRM_ATTENDANCE_FULL_FORM_LIMIT:
+        return redirect('attendance_quick_create')
+
     workers = Worker.objects.all().order_by('full_name')
     today = timezone.now().date()
 
@@ -304,13 +387,9 @@ def attendance_bulk_create(request):
         if form.is_valid():
             date = form.cleaned_data['date']
 
-            # Delete existing attendance records for the selected date
-            Attendance.objects.filter(date=date).delete()
-
-            # Create new attendance records
-            for worker in workers:
-                status = form.cleaned_data[f'worker_{worker.id}']
-                Attendance.objects.create(worker=worker, date=date, status=status)
+            # Insert or overwrite every worker's record for the date in bulk
+            statuses = {worker.id: form.cleaned_data[f'worker_{worker.id}'] for worker in workers}
+            record_attendance(date, statuses)
 
             messages.success(request, 'Attendance recorded successfully!')
             return redirect('attendance_list')
@@ -321,11 +400,305 @@ def attendance_bulk_create(request):
         if existing_attendance.exists():
             # Pre-populate form with existing data
             initial_data = {'date': today}
-            for record in existing_attendance:
-                initial_data[f'worker_{record.worker.id}'] = record.status
+            for worker_id, status in existing_attendance.values_list('worker_id', 'status'):
+                initial_data[f'worker_{worker_id}'] = status
 
             form = AttendanceBulkForm(initial=initial_data, workers=workers)
         else:
             form = AttendanceBulkForm(workers=workers)
 
-    return render(request, 'crm/attendance_bulk_form.html', {'form': form})
\ No newline at end of file
+    return render(request, 'crm/attendance_bulk_form.html', {'form': form})
+
+
+@login_required
+def attendance_quick_create(request):
+    if request.method == 'POST':
+        form = AttendanceExceptionsForm(request.POST)
+
+        if form.is_valid():
+            record_day(form.cleaned_data['date'], form.cleaned_data['exceptions'])
+            messages.success(request, 'Attendance recorded successfully!')
+            return redirect('attendance_list')
+    else:
+        if request.GET.get('date'):
+            try:
+                day = timezone.datetime.strptime(request.GET.get('date'), '%Y-%m-%d').date()
+            except ValueError:
+                day = timezone.now().date()
+        else:
+            day = timezone.now().date()
+
+        # Only the exceptions are loaded, never the whole headcount
+        existing = Attendance.objects.filter(date=day).exclude(status='present').order_by('worker_id')
+        lines = [f'{worker_id},{status}' for worker_id, status in existing.values_list('worker_id', 'status')]
+        form = AttendanceExceptionsForm(initial={'date': day, 'exceptions': '\n'.join(lines)})
+
+    return render(request, 'crm/attendance_quick_form.html', {'form': form})
+
+
+# Reports
+@login_required
+def sales_report(request):
+    form = ExportForm(request.GET)
+    end = timezone.now().date()
+    start = end - timezone.timedelta(days=29)
+
+    if form.is_valid():
+        start = form.cleaned_data['start'] or start
+        end = form.cleaned_data['end'] or end
+
+    # Read from the daily rollups, never from the order table
+    by_category = {}
+    for row in revenue_by_category(start, end):
+        totals = by_category.setdefault(row['category'], {'units': 0, 'revenue': 0})
+        totals['units'] += row['total_units']
+        totals['revenue'] += row['total_revenue']
+
+    categories = dict(Product.CATEGORY_CHOICES)
+    context = {
+        'start': start,
+        'end': end,
+        'categories': [
+            {'name': categories.get(name, name), 'units': totals['units'], 'revenue': totals['revenue']}
+            for name, totals in sorted(by_category.items(), key=lambda item: -item[1]['revenue'])
+        ],
+        'workers': units_by_worker_month(start, end)[:50],
+    }
+
+    return render(request, 'crm/sales_report.html', context)
+
+
+# Diagnostics
+@staff_member_required
+def cache_diagnostics(request):
+    if request.method == 'POST':
+        reset_stats()
+        messages.success(request, 'Cache counters reset.')
+        return redirect('cache_diagnostics')
+
+    backend = settings.CACHES['default']
+    context = {
+        'backend': backend['BACKEND'].rsplit('.', 1)[-1],
+        'location': backend.get('LOCATION', ''),
+        'fragment_timeout': settings.CRM_FRAGMENT_CACHE_TIMEOUT,
+        'conditional_get': settings.CRM_CONDITIONAL_GET,
+        'versions': sorted(versions(Worker, Product, Order, Attendance).items()),
+        'stats': get_stats(),
+    }
+
+    return render(request, 'crm/cache_diagnostics.html', context)
+
+
+@staff_member_required
+def performance_stats(request):
+    if request.method == 'POST':
+        view_stats.reset()
+        messages.success(request, 'Performance samples cleared.')
+        return redirect('performance_stats')
+
+    views, slow_requests = view_stats.summary()
+    context = {
+        'views': views,
+        'slow_requests': slow_requests,
+        'window': view_stats.window,
+        'slow_threshold': settings.CRM_SLOW_REQUEST_MS,
+    }
+
+    return render(request, 'crm/performance_stats.html', context)
+
+
+# Search
+@login_required
+def search_typeahead(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 8)), 25))
+    except ValueError:
+        limit = 8
+
+    results = [
+        {'type': 'worker', 'id': worker.pk, 'label': worker.full_name,
+         'detail': f'{worker.position} · {worker.phone_number}', 'url': reverse('worker_detail', args=[worker.pk])}
+        for worker in search.ranked(Worker, query, limit)
+    ] + [
+        {'type': 'product', 'id': product.pk, 'label': product.name,
+         'detail': product.get_category_display(), 'url': reverse('product_detail', args=[product.pk])}
+        for product in search.ranked(Product, query, limit)
+    ]
+
+    return JsonResponse({'query': query, 'results': results})
+
+
+AUTOCOMPLETE = {
+    'workers': (Worker, lambda worker: f'{worker.position} · {worker.phone_number}'),
+    'products': (Product, lambda product: f'{product.get_category_display()} · {product.stock} in stock'),
+}
+AUTOCOMPLETE_PAGE_SIZE = 20
+
+
+@login_required
+def autocomplete(request, model_name):
+    """One page of choices for an AutocompleteSelect, in name order, narrowed by the search index."""
+    if model_name not in AUTOCOMPLETE:
+        raise Http404('Unknown model')
+    model, detail = AUTOCOMPLETE[model_name]
+
+    query = request.GET.get('q', '').strip()
+    queryset = search.filter_queryset(model.objects.all(), query)
+    paginator = KeysetPaginator(queryset, search.SEARCH[model]['ordering'], per_page=AUTOCOMPLETE_PAGE_SIZE)
+    try:
+        page = paginator.get_page(after=request.GET.get('after'))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+
+    return JsonResponse({
+        'query': query,
+        'results': [{'id': obj.pk, 'text': str(obj), 'detail': detail(obj)} for obj in page],
+        'next': page.next_cursor,
+    })
+
+
+# Exports
+@login_required
+def export(request, name):
+    if name not in EXPORTS:
+        raise Http404('Unknown export')
+
+    form = ExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+
+    rows = iter_rows(
+        name,
+        start=form.cleaned_data['start'],
+        end=form.cleaned_data['end'],
+        status=form.cleaned_data['status'],
+    )
+    filename = f'{name}-{timezone.now().date()}'
+
+    if form.cleaned_data['format'] == 'xlsx':
+        try:
+            target = xlsx_tempfile(rows)
+        except RuntimeError as e:
+            return HttpResponseBadRequest(str(e))
+        return FileResponse(target, as_attachment=True, filename=f'{filename}.xlsx')
+
+    # Rows are written as they come off the database cursor
+    response = StreamingHttpResponse(iter_csv(rows), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def _isoformat(day):
+    # Task arguments are stored as JSON
+    return day.isoformat() if day else None
+
+
+@login_required
+def export_enqueue(request, name):
+    if name not in EXPORTS:
+        raise Http404('Unknown export')
+    if request.method != 'POST':
+        return redirect('export', name=name)
+
+    form = ExportForm(request.POST)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+
+    task = tasks.enqueue(
+        'export', user=request.user, name=name,
+        format=form.cleaned_data['format'] or 'csv',
+        start=_isoformat(form.cleaned_data['start']),
+        end=_isoformat(form.cleaned_data['end']),
+        status=form.cleaned_data['status'] or None,
+    )
+    messages.success(request, 'Export queued. The file will be ready to download here.')
+    return redirect('task_detail', pk=task.pk)
+
+
+# Background tasks
+def _visible_tasks(request):
+    if request.user.is_staff:
+        return Task.objects.all()
+    return Task.objects.filter(created_by=request.user)
+
+
+@login_required
+def task_list(request):
+    queryset = _visible_tasks(request).select_related('created_by')
+    page = paginate(request, queryset, ('-created_at', '-id'), per_page=PAGE_SIZE)
+    return render(request, 'crm/task_list.html', {'tasks': page})
+
+
+@login_required
+def task_detail(request, pk):
+    task = get_object_or_404(_visible_tasks(request), pk=pk)
+    return render(request, 'crm/task_detail.html', {'task': task})
+
+
+@login_required
+def task_status(request, pk):
+    task = get_object_or_404(_visible_tasks(request), pk=pk)
+    has_file = task.status == 'succeeded' and isinstance(task.result, dict) and 'file' in task.result
+    return JsonResponse({
+        'id': task.pk,
+        'name': task.name,
+        'status': task.status,
+        'progress': task.progress,
+        'message': task.message,
+        'attempts': task.attempts,
+        'max_attempts': task.max_attempts,
+        'result': task.result,
+        'finished': task.is_finished,
+        'download_url': reverse('task_download', args=[task.pk]) if has_file else None,
+    })
+
+
+@login_required
+def task_download(request, pk):
+    task = get_object_or_404(_visible_tasks(request), pk=pk, status='succeeded')
+    filename = (task.result or {}).get('file')
+    if not filename:
+        raise Http404('This task has no file')
+    try:
+        target = open(tasks.task_file(os.path.basename(filename)), 'rb')
+    except FileNotFoundError:
+        raise Http404('The file is no longer available')
+    return FileResponse(target, as_attachment=True, filename=filename)
+
+
+@staff_member_required
+def rollups_enqueue(request):
+    if request.method != 'POST':
+        return redirect('sales_report')
+
+    form = ExportForm(request.POST)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+
+    task = tasks.enqueue(
+        'rebuild_rollups', user=request.user,
+        start=_isoformat(form.cleaned_data['start']), end=_isoformat(form.cleaned_data['end']),
+    )
+    messages.success(request, 'Rollup rebuild queued.')
+    return redirect('task_detail', pk=task.pk)
+
+
+@staff_member_required
+def import_enqueue(request):
+    if request.method == 'POST':
+        form = ImportUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            path = tasks.task_file(f'upload-{uuid.uuid4().hex}-{os.path.basename(upload.name)}')
+            with open(path, 'wb') as target:
+                for chunk in upload.chunks():
+                    target.write(chunk)
+
+            task = tasks.enqueue('import_data', user=request.user, kind=form.cleaned_data['kind'], path=path)
+            messages.success(request, 'Import queued.')
+            return redirect('task_detail', pk=task.pk)
+    else:
+        form = ImportUploadForm()
+
+    return render(request, 'crm/task_import.html', {'form': form})